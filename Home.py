@@ -1,6 +1,9 @@
 import streamlit
 import streamlit.components.v1 as components
-from openai import OpenAI
+from clients import get_client
+from rate_limiter import get_rate_limiter
+from response_cache import get_response_cache
+from semantic_cache import get_semantic_cache
 
 streamlit.title("🏠 Home")
 streamlit.caption("🚀 A collection of Streamlit apps powered by large language models (LLMs)")
@@ -21,7 +24,15 @@ streamlit.write("---")
 if "client" not in streamlit.session_state:
     api_key = streamlit.text_input("Enter your API Key", type="password")
     if api_key:
-        streamlit.session_state["client"] = OpenAI(api_key=api_key)
+        streamlit.session_state["client"] = get_client(api_key)
 else:
     streamlit.write("Your API key has been provided.")
-    
\ No newline at end of file
+
+with streamlit.expander("Response cache"):
+    response_cache = get_response_cache()
+    streamlit.write(response_cache.stats())
+    streamlit.button("Clear response cache", on_click=response_cache.clear)
+    streamlit.write("Semantic cache", get_semantic_cache().stats())
+
+with streamlit.expander("Rate limits"):
+    streamlit.write(get_rate_limiter().stats())
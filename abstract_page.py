@@ -1,5 +1,9 @@
 from abc import ABC, abstractmethod
 import streamlit
+from chat_history import ChatHistory
+from profiling_panel import display_profiling_panel
+from rate_limiter import current_session
+from tracing import get_tracer
 
 class AbstractPage(ABC):
     def __init__(self, title, description, initial_message_content):
@@ -17,8 +21,19 @@ class AbstractPage(ABC):
         streamlit.markdown(self.description)
 
     def display_chat_messages(self):
-        for msg in streamlit.session_state.messages:
-            streamlit.chat_message(msg["role"]).write(msg["content"])
+        ChatHistory().display()
+
+    def display_chat(self, respond):
+        # respond renders its working inside the assistant message and returns the final reply
+        self.display_chat_messages()
+        if prompt := streamlit.chat_input():
+            streamlit.session_state.messages.append({"role": "user", "content": prompt})
+            streamlit.chat_message("user").write(prompt)
+            with streamlit.chat_message("assistant"), get_tracer().span("turn", page=self.title, session=current_session()):
+                content = respond(prompt)
+            streamlit.session_state.messages.append({"role": "assistant", "content": content})
+        display_profiling_panel()
+        return prompt
 
     def add_sidebar_components(self, component):
         self.side_bar_components.append(component)
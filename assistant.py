@@ -1,5 +1,23 @@
+import httpx
+import openai
 import streamlit as st
 import time
+from chat_history import ChatHistory
+from ingestion import FileIngestion
+from local_retrieval import LocalRetriever, get_local_index_for
+from response_cache import get_response_cache
+from run_polling import CANCEL_TIMEOUT, RunOutcome, RunWaiter, cancel_run
+from run_service import get_run_service
+from profiling_panel import display_profiling_panel
+from rate_limiter import current_session
+from semantic_cache import embed, get_semantic_cache
+from tracing import TRACE, get_tracer
+
+# st.fragment (Streamlit 1.37+) lets a pending run refresh itself without rerunning the page
+BACKGROUND = hasattr(st, "fragment")
+RUN_POLL_INTERVAL = 0.25
+RUN_DEADLINE = 120.0
+
 
 class AssistantSettings():
     def __init__(self, id, name, instructions, vector_store, model):
@@ -9,22 +27,91 @@ class AssistantSettings():
         self.vector_store = vector_store
         self.model = model
         
+class AssistantCatalog:
+    PAGE_SIZE = 15
+    TTL = 300
+
+    def __init__(self, client):
+        self.client = client
+        if "assistant_catalog" not in st.session_state:
+            st.session_state["assistant_catalog"] = {
+                "assistants": [], "has_more": True, "fetched_at": None, "retrieved": {}
+            }
+        self.state = st.session_state["assistant_catalog"]
+
+    def is_fresh(self, fetched_at):
+        return fetched_at is not None and time.time() - fetched_at < self.TTL
+
+    def list(self):
+        # reruns are served from session state until the TTL runs out
+        if not self.is_fresh(self.state["fetched_at"]):
+            self.state["assistants"] = []
+            self.state["has_more"] = True
+            self.load_more()
+            self.state["fetched_at"] = time.time()
+        return self.state["assistants"]
+
+    @property
+    def has_more(self):
+        return self.state["has_more"]
+
+    def load_more(self):
+        params = {"order": "desc", "limit": self.PAGE_SIZE}
+        if self.state["assistants"]:
+            params["after"] = self.state["assistants"][-1].id
+        page = self.client.beta.assistants.list(**params)
+        self.state["assistants"].extend(page.data)
+        self.state["has_more"] = page.has_next_page()
+
+    def retrieve(self, assistant_id):
+        cached = self.state["retrieved"].get(assistant_id)
+        if cached is not None and self.is_fresh(cached[0]):
+            return cached[1]
+        for assistant in self.state["assistants"]:
+            if assistant.id == assistant_id and self.is_fresh(self.state["fetched_at"]):
+                return assistant
+        assistant = self.client.beta.assistants.retrieve(assistant_id)
+        self.state["retrieved"][assistant_id] = (time.time(), assistant)
+        return assistant
+
+    def created(self, assistant):
+        self.state["assistants"].insert(0, assistant)
+        self.state["retrieved"][assistant.id] = (time.time(), assistant)
+
+    def updated(self, assistant):
+        self.state["assistants"] = [
+            assistant if cached.id == assistant.id else cached for cached in self.state["assistants"]
+        ]
+        self.state["retrieved"][assistant.id] = (time.time(), assistant)
+
+    def deleted(self, assistant_id):
+        self.state["assistants"] = [cached for cached in self.state["assistants"] if cached.id != assistant_id]
+        self.state["retrieved"].pop(assistant_id, None)
+
+    def invalidate(self):
+        self.state["fetched_at"] = None
+        self.state["retrieved"] = {}
+
+
 class AssistantsDisplay:
     def __init__(self):
         self.client = st.session_state.client
+        self.catalog = AssistantCatalog(self.client)
 
     def retrieve_assistants(self):
-        assistants = self.client.beta.assistants.list(
-            order="desc",
-            limit=15
-        )
-        return assistants
+        return self.catalog.list()
 
     def display(self):
         assistants = self.retrieve_assistants()
-        st.write("# Assistants")
+        header_column, refresh_column = st.columns([5, 1])
+        with header_column:
+            st.write("# Assistants")
+        with refresh_column:
+            st.button("Refresh", on_click=self.catalog.invalidate, icon="🔄")
         for assistant in assistants:
             self.display_assistant(assistant)
+        if self.catalog.has_more:
+            st.button("Load more", on_click=self.catalog.load_more)
 
     def display_assistant(self, assistant):
         with st.container(border=True):
@@ -46,6 +133,8 @@ class AssistantsDisplay:
                 st.button("Delete", key=assistant.id + 'delete', on_click=lambda a_id=assistant.id: self.delete_assistant(a_id), type="primary", icon="🗑️")
 
     def select_assistant(self, assistant_id):
+        if st.session_state.get("assistant_job") is not None:
+            st.session_state.pop("assistant_job").cancel()
         st.session_state["messages"] = []
         st.session_state.selected_assistant = assistant_id
         st.toast(f"Assistant {assistant_id} selected successfully.", icon="✅")   
@@ -58,16 +147,20 @@ class AssistantsDisplay:
             submit_button = st.form_submit_button("Save Changes")
 
             if submit_button:
-                self.client.beta.assistants.update(
+                updated_assistant = self.client.beta.assistants.update(
                     assistant_id=assistant.id,
                     name=new_name,
                     instructions=new_instructions,
                     model=new_model
                 )
+                self.catalog.updated(updated_assistant)
+                get_semantic_cache().invalidate(assistant.id)
                 st.toast(f"Assistant {assistant.id} updated successfully.", icon="✏️")
 
     def delete_assistant(self, assistant_id):
         self.client.beta.assistants.delete(assistant_id=assistant_id)
+        self.catalog.deleted(assistant_id)
+        get_semantic_cache().invalidate(assistant_id)
         st.toast(f"Assistant {assistant_id} deleted successfully.", icon="🗑️")
 
 class AssistantSettingsForm:
@@ -85,7 +178,18 @@ class AssistantSettingsForm:
         with st.form(key="settings_form"):
             self.display_fields()
             uploaded_files = st.file_uploader("Upload file(s)", type=["txt", "md", "pdf"], accept_multiple_files=True)
-            submit_button = st.form_submit_button("Submit", on_click= lambda f=uploaded_files: self.submit(f))
+            index_locally = st.checkbox("Also add the files to the local index")
+            cache_sampled = st.checkbox(
+                "Reuse sampled answers for identical conversations",
+                st.session_state.get("cache_sampled_answers", False),
+                help="Answers sampled above temperature 0 differ run to run, so they are not cached unless you opt in.",
+            )
+            submit_button = st.form_submit_button("Submit")
+        if submit_button:
+            st.session_state["cache_sampled_answers"] = cache_sampled
+            assistant = self.submit(uploaded_files)
+            if uploaded_files and index_locally:
+                self.add_to_local_index(uploaded_files, assistant.id)
 
     def display_fields(self):
         self.name_field = st.text_input("Enter assistant name", self.DEFAULT_NAME)
@@ -99,23 +203,146 @@ class AssistantSettingsForm:
             instructions=self.instructions_field,
             model=self.model_field
         )
+        catalog = AssistantCatalog(self.client)
+        catalog.created(assistant)
 
         if uploaded_files:
-            # implement adding files (to a vector store?)
-            self.create_vector_store(uploaded_files)
+            vector_store = self.create_vector_store(uploaded_files)
+            catalog.updated(FileIngestion(self.client).attach(assistant.id, vector_store.id))
+        st.toast(f"Assistant {assistant.id} created successfully.", icon="✅")
+        return assistant
     
     def create_vector_store(self, uploaded_files):
         # create vector store with client
-        vector_store = self.client.beta.vector_stores.create(
+        vector_store = self.client.vector_stores.create(
             name="Vector store for " + self.name_field,
 
         )
+        with st.status(f"Ingesting {len(uploaded_files)} file(s)...") as status:
+            ingestion = FileIngestion(self.client, on_progress=self.progress_table())
+            batch = ingestion.ingest([(file.name, file.getvalue()) for file in uploaded_files], vector_store.id)
+            status.update(label="Files ingested" if batch is not None else "No files could be uploaded",
+                          state="complete" if batch is not None else "error")
+        return vector_store
+
+    def add_to_local_index(self, uploaded_files, assistant_id):
+        with st.status(f"Parsing {len(uploaded_files)} file(s) into the local index...") as status:
+            retriever = LocalRetriever(self.client, get_local_index_for(self.client, assistant_id))
+            count = retriever.ingest([(file.name, file.getvalue()) for file in uploaded_files], self.progress_table())
+            status.update(label=f"Indexed {count} chunk(s) locally", state="complete")
+
+    def progress_table(self):
+        progress = {}
+        progress_table = st.empty()
+
+        def on_progress(name, state):
+            progress[name] = state
+            progress_table.table([{"file": file_name, "status": file_state} for file_name, file_state in progress.items()])
+        return on_progress
+
+class ThreadMessageCache:
+    PAGE_LIMIT = 5
+
+    def __init__(self, client, thread_id):
+        self.client = client
+        self.thread_id = thread_id
+        if "thread_message_cache" not in st.session_state:
+            st.session_state["thread_message_cache"] = {}
+        caches = st.session_state["thread_message_cache"]
+        if thread_id not in caches:
+            caches[thread_id] = {"messages": [], "ids": set(), "last_id": None}
+        self.entry = caches[thread_id]
+
+    @property
+    def messages(self):
+        return self.entry["messages"]
+
+    def add(self, message):
+        if message.id in self.entry["ids"]:
+            return
+        self.messages.append(message)
+        self.entry["ids"].add(message.id)
+        self.entry["last_id"] = message.id
+
+    def fetch_new(self, run_id=None):
+        # only asks for messages after the last one we have seen, oldest first
+        params = {"thread_id": self.thread_id, "order": "asc", "limit": self.PAGE_LIMIT}
+        if self.entry["last_id"]:
+            params["after"] = self.entry["last_id"]
+        if run_id:
+            params["run_id"] = run_id
+        new_messages = []
+        for message in self.client.beta.threads.messages.list(**params):
+            self.add(message)
+            new_messages.append(message)
+        return new_messages
+
+
+def reply_text(messages):
+    # the text of the newest assistant message, or None when the run added none
+    for message in reversed(messages):
+        if message.role == "assistant":
+            text = "".join(block.text.value for block in message.content if block.type == "text")
+            return text or None
+    return None
+
+
+def stream_run(job, client, params, deadline=RUN_DEADLINE):
+    # runs on a run service worker: yields text deltas and records messages and run state on the job.
+    # As in RunWaiter, a run that asks for tool outputs or outlasts the deadline is cancelled and its
+    # RunOutcome left in job.result.
+    started = time.monotonic()
+    stopped = None
+    try:
+        # the request timeout covers a stream that goes quiet between events
+        with client.beta.threads.runs.stream(**params, timeout=deadline) as stream:
+            for event in stream:
+                if job.cancelled.is_set():
+                    return
+                if event.event == "thread.message.delta":
+                    for block in event.data.delta.content or []:
+                        if block.type == "text" and block.text and block.text.value:
+                            yield block.text.value
+                elif event.event == "thread.message.completed":
+                    job.messages.append(event.data)
+                elif event.event.startswith("thread.run.") and not event.event.startswith("thread.run.step."):
+                    job.run = event.data
+                    if job.run.status == "requires_action":
+                        stopped = "requires_action"
+                        return
+                if time.monotonic() - started >= deadline:
+                    stopped = "timed out"
+                    return
+    except (openai.APITimeoutError, httpx.TimeoutException):
+        stopped = "timed out"
+    finally:
+        if stopped is not None:
+            if job.run is not None:
+                job.run = cancel_run(client, job.run)
+            job.result = RunOutcome(stopped, job.run, 0, time.monotonic() - started)
+        elif job.cancelled.is_set() and job.run is not None:
+            cancel_run(client, job.run)
+
+
+def poll_run(job, client, params):
+    outcome = RunWaiter(client, deadline=RUN_DEADLINE).run(params, cancelled=job.cancelled)
+    job.run = outcome.run
+    return outcome
+
 
 class ChatInterface:
-    def __init__(self, assistant_id):
+    def __init__(self, assistant_id, stream=True, retriever=None, page="Assistant"):
         self.client = st.session_state.client
+        self.stream = stream
+        self.page = page
+        self.retriever = retriever
+        self.additional_instructions = None
+        self.last_run = None
+        self.response_cache = get_response_cache()
+        self.semantic_cache = get_semantic_cache()
         self.thread = self.initialise_thread()
-        self.assistant = self.client.beta.assistants.retrieve(st.session_state.selected_assistant)
+        self.message_cache = ThreadMessageCache(self.client, self.thread.id)
+        self.assistant = AssistantCatalog(self.client).retrieve(st.session_state.selected_assistant)
         self.chat_container = st.container()
         self.footer_container = st.container()
 
@@ -140,6 +367,9 @@ class ChatInterface:
 
         if user_chat_message_content:
             self.handle_user_input(user_chat_message_content)
+        with self.chat_container:
+            self.display_pending_job()
+        display_profiling_panel()
 
         return user_chat_message_content
 
@@ -147,23 +377,147 @@ class ChatInterface:
         if "messages" not in st.session_state:
             st.session_state["messages"] = []
         
-        st.chat_message("assistant").write("Hello, there.")
-        for message in st.session_state["messages"][1:]:
-            if message["role"] == "user":
-                st.chat_message("user").write(message["content"])
-            elif message["role"] == "assistant":
-                st.chat_message("assistant").write(message["content"])
+        ChatHistory().display(first=1, greeting="Hello, there.")
 
     def handle_user_input(self, user_input):
+        self.cancel_pending_job()
+        tracer = get_tracer()
+        turn = tracer.start("turn", page=self.page, session=current_session())
+        token = TRACE.set(turn)
+        try:
+            self.answer(user_input, turn)
+        except BaseException as error:
+            tracer.finish(turn, error)
+            raise
+        finally:
+            TRACE.reset(token)
+        # a turn handed to the run service is finished along with its job
+        if "assistant_job" not in st.session_state:
+            tracer.finish(turn)
+
+    def answer(self, user_input, turn):
         with self.chat_container:
             st.chat_message("user").markdown(user_input)
         self.add_user_message_to_session(user_input)
         self.add_user_message_to_thread(user_input)
-        response = self.get_client_response()
-        message = response.data[0].content[0].text.value
-        with self.chat_container:
+        if self.retriever is not None:
+            self.additional_instructions = self.retriever.context(user_input)
+        cache_key = self.response_cache_key()
+        message = self.response_cache.get(cache_key) if cache_key else None
+        question_vector = None
+        if message is None and self.additional_instructions is None and self.is_opening_question():
+            question_vector = embed(self.client, user_input)
+            message = self.semantic_cache.lookup(self.assistant.id, question_vector)
+        if message is not None:
+            turn.set(cache_hit=True)
+            self.add_assistant_message_to_thread(message)
+            with self.chat_container:
+                st.chat_message("assistant").markdown(message)
+            self.add_assistant_message_to_session(message)
+            return
+        # the run itself happens on the run service; display_pending_job shows it as it arrives
+        st.session_state["assistant_job"] = get_run_service().submit(
+            stream_run if self.stream else poll_run, self.client, self.run_params(),
+            context={"cache_key": cache_key, "question_vector": question_vector, "user_input": user_input, "turn": turn},
+        )
+
+    def display_pending_job(self):
+        if "assistant_notice" in st.session_state:
+            st.warning(st.session_state.pop("assistant_notice"))
+        job = st.session_state.get("assistant_job")
+        if job is None:
+            return
+        if BACKGROUND:
+            display_live_job(self)
+            return
+        # without fragments, fall back to waiting in the script thread
+        placeholder = st.empty()
+        while not job.poll().wait(RUN_POLL_INTERVAL):
+            with placeholder.container():
+                self.display_job_progress(job)
+        placeholder.empty()
+        message = self.finish_job(job)
+        if message is not None:
             st.chat_message("assistant").markdown(message)
-        self.add_assistant_message_to_session(message)
+        elif "assistant_notice" in st.session_state:
+            st.warning(st.session_state.pop("assistant_notice"))
+
+    def display_job_progress(self, job):
+        st.chat_message("assistant").markdown((job.text() or "Thinking...") + " ▌")
+
+    def cancel_pending_job(self):
+        # a thread takes no new messages while a run is active, so wait for the cancel to land
+        job = st.session_state.pop("assistant_job", None)
+        if job is None:
+            return
+        job.cancel()
+        job.wait(CANCEL_TIMEOUT)
+        for message in job.messages:
+            self.message_cache.add(message)
+        finish_turn(job)
+
+    def finish_job(self, job):
+        st.session_state.pop("assistant_job", None)
+        finish_turn(job)
+        for message in job.messages:
+            self.message_cache.add(message)
+        self.last_run = job.run
+        if job.status == "failed":
+            st.session_state["assistant_notice"] = f"The assistant run failed: {job.error}"
+            return None
+        if job.status == "cancelled":
+            return None
+        if self.stream:
+            message = job.text()
+            completed = job.result is None and self.last_run is not None and self.last_run.status == "completed"
+            if job.result is not None:
+                # the stream was stopped and the run cancelled
+                st.session_state["assistant_notice"] = job.result.describe()
+            elif not completed:
+                st.session_state["assistant_notice"] = (
+                    f"The assistant run ended with status {self.last_run.status if self.last_run else 'unknown'}."
+                )
+        else:
+            outcome = job.result
+            completed = outcome.completed
+            if completed:
+                message = reply_text(self.message_cache.fetch_new(run_id=outcome.run.id))
+                if message is None:
+                    # a run can complete without adding a message, e.g. after a failed tool call
+                    completed = False
+                    st.session_state["assistant_notice"] = "The assistant run finished without a reply."
+            else:
+                message = None
+                st.session_state["assistant_notice"] = outcome.describe()
+        if completed:
+            if job.context["cache_key"]:
+                self.response_cache.set(job.context["cache_key"], message)
+            if job.context["question_vector"] is not None:
+                self.semantic_cache.add(
+                    self.assistant.id, job.context["question_vector"], job.context["user_input"], message
+                )
+        if message:
+            self.add_assistant_message_to_session(message)
+        return message
+
+    def is_opening_question(self):
+        # paraphrase matching ignores context, so only standalone opening questions use it
+        return sum(message["role"] == "user" for message in st.session_state["messages"]) == 1
+
+    def response_cache_key(self):
+        # sampled answers are only reused when the form opted in to caching them
+        params = {
+            "assistant_id": self.assistant.id,
+            "temperature": getattr(self.assistant, "temperature", None),
+            "top_p": getattr(self.assistant, "top_p", None),
+            "additional_instructions": self.additional_instructions,
+        }
+        max_temperature = 1.0 if st.session_state.get("cache_sampled_answers") else None
+        if not self.response_cache.cacheable(params, max_temperature):
+            return None
+        return self.response_cache.key(
+            self.assistant.model, self.assistant.instructions, st.session_state["messages"], params
+        )
 
     def add_user_message_to_session(self, content):
         st.session_state["messages"].append({"role": "user", "content": content})
@@ -172,21 +526,45 @@ class ChatInterface:
         st.session_state["messages"].append({"role": "assistant", "content": content})
 
     def add_user_message_to_thread(self, content):
-        self.client.beta.threads.messages.create(
+        message = self.client.beta.threads.messages.create(
             thread_id=self.thread.id,
             role="user",
             content=content
         )
+        self.message_cache.add(message)
 
-    def get_client_response(self):
-        run = self.client.beta.threads.runs.create_and_poll(
+    def add_assistant_message_to_thread(self, content):
+        # keeps the thread in step with the chat when an answer is served from the cache
+        message = self.client.beta.threads.messages.create(
             thread_id=self.thread.id,
-            assistant_id=self.assistant.id,
+            role="assistant",
+            content=content
         )
-        if run.status == 'completed': 
-            messages = self.client.beta.threads.messages.list(
-                thread_id=self.thread.id
-            )
-            return messages
-        else:
-            print(run.status)
\ No newline at end of file
+        self.message_cache.add(message)
+
+    def run_params(self):
+        params = {"thread_id": self.thread.id, "assistant_id": self.assistant.id}
+        if self.additional_instructions:
+            # locally retrieved excerpts ride along with this run only, not the thread
+            params["additional_instructions"] = self.additional_instructions
+        return params
+
+
+def finish_turn(job):
+    turn = job.context.get("turn")
+    if turn is not None:
+        get_tracer().finish(turn, job.error, outcome=job.status)
+
+
+def display_live_job(chat_interface):
+    job = st.session_state.get("assistant_job")
+    if job is None:
+        return
+    if job.done:
+        chat_interface.finish_job(job)
+        st.rerun()
+    chat_interface.display_job_progress(job.poll())
+
+
+if BACKGROUND:
+    display_live_job = st.fragment(run_every=RUN_POLL_INTERVAL)(display_live_job)
@@ -0,0 +1,181 @@
+import time
+import pytest
+import streamlit as st
+from contextlib import contextmanager
+from types import SimpleNamespace
+from assistant import AssistantCatalog, ThreadMessageCache, reply_text, stream_run
+from run_service import Job
+
+
+def message(id, role="assistant", text="hello", run_id=None):
+    return SimpleNamespace(id=id, role=role, run_id=run_id,
+                           content=[SimpleNamespace(type="text", text=SimpleNamespace(value=text))])
+
+
+class FakeMessages:
+    # pages through the thread as the SDK does: iterating a page asks for the next one after its last id
+    def __init__(self, messages):
+        self.thread = list(messages)
+        self.calls = []
+
+    def list(self, thread_id, order, limit, after=None, run_id=None):
+        self.calls.append({"after": after, "run_id": run_id})
+        ids = [message.id for message in self.thread]
+        start = ids.index(after) + 1 if after else 0
+        matching = [message for message in self.thread[start:] if run_id is None or message.run_id == run_id]
+        page = matching[:limit]
+
+        def pages():
+            yield from page
+            if len(matching) > limit:
+                yield from self.list(thread_id, order, limit, page[-1].id, run_id)
+        return pages()
+
+
+@pytest.fixture(autouse=True)
+def session_state():
+    st.session_state.clear()
+    yield
+    st.session_state.clear()
+
+
+def message_cache(messages):
+    fake = FakeMessages(messages)
+    client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(messages=fake)))
+    return ThreadMessageCache(client, "thread_1"), fake
+
+
+def test_fetches_only_messages_after_the_last_one_seen():
+    cache, fake = message_cache([message(f"msg_{number}") for number in range(7)])
+    assert [message.id for message in cache.fetch_new()] == [f"msg_{number}" for number in range(7)]
+    # seven messages take two pages of five
+    assert [call["after"] for call in fake.calls] == [None, "msg_4"]
+
+    fake.thread.append(message("msg_7"))
+    assert [message.id for message in cache.fetch_new()] == ["msg_7"]
+    assert fake.calls[-1]["after"] == "msg_6"
+    assert len(cache.messages) == 8
+
+
+def test_filters_by_run_and_ignores_messages_already_added():
+    cache, fake = message_cache([message("msg_0", "user"), message("msg_1", run_id="run_1")])
+    cache.add(fake.thread[0])
+    new = cache.fetch_new(run_id="run_1")
+    assert [message.id for message in new] == ["msg_1"] and fake.calls[-1] == {"after": "msg_0", "run_id": "run_1"}
+    cache.add(new[0])
+    assert [message.id for message in cache.messages] == ["msg_0", "msg_1"]
+
+
+def test_reply_text_is_none_when_the_run_added_no_reply():
+    assert reply_text([]) is None
+    assert reply_text([message("msg_0", "user")]) is None
+    assert reply_text([message("msg_0", text="first"), message("msg_1", text="second")]) == "second"
+
+
+class FakeAssistants:
+    def __init__(self, count):
+        self.stored = [SimpleNamespace(id=f"asst_{number:02d}", name=f"Tutor {number}") for number in range(count)]
+        self.list_calls = []
+        self.retrieve_calls = 0
+
+    def list(self, order, limit, after=None):
+        self.list_calls.append(after)
+        ids = [assistant.id for assistant in self.stored]
+        start = ids.index(after) + 1 if after else 0
+        data = self.stored[start:start + limit]
+        return SimpleNamespace(data=data, has_next_page=lambda: start + limit < len(self.stored))
+
+    def retrieve(self, assistant_id):
+        self.retrieve_calls += 1
+        return next(assistant for assistant in self.stored if assistant.id == assistant_id)
+
+
+def catalog(count):
+    fake = FakeAssistants(count)
+    return AssistantCatalog(SimpleNamespace(beta=SimpleNamespace(assistants=fake))), fake
+
+
+def test_catalog_is_served_from_session_state_until_the_ttl_runs_out():
+    assistants, fake = catalog(3)
+    assert len(assistants.list()) == 3 and len(assistants.list()) == 3
+    assert fake.list_calls == [None]
+
+    assistants.state["fetched_at"] = time.time() - AssistantCatalog.TTL - 1
+    assistants.list()
+    assert fake.list_calls == [None, None]
+
+
+def test_load_more_pages_with_the_after_cursor():
+    assistants, fake = catalog(AssistantCatalog.PAGE_SIZE + 5)
+    assert len(assistants.list()) == AssistantCatalog.PAGE_SIZE and assistants.has_more
+    assistants.load_more()
+    assert fake.list_calls == [None, f"asst_{AssistantCatalog.PAGE_SIZE - 1:02d}"]
+    assert len(assistants.list()) == AssistantCatalog.PAGE_SIZE + 5 and not assistants.has_more
+
+
+def test_writes_go_through_to_the_cached_catalog():
+    assistants, fake = catalog(2)
+    assistants.list()
+    created = SimpleNamespace(id="asst_new", name="New tutor")
+    assistants.created(created)
+    assert assistants.list()[0] is created and assistants.retrieve("asst_new") is created
+
+    renamed = SimpleNamespace(id="asst_00", name="Renamed")
+    assistants.updated(renamed)
+    assert assistants.retrieve("asst_00") is renamed and renamed in assistants.list()
+
+    assistants.deleted("asst_01")
+    assert "asst_01" not in [assistant.id for assistant in assistants.list()]
+    assert fake.list_calls == [None] and fake.retrieve_calls == 0
+
+
+class FakeStreamingRuns:
+    # streams run events for one run, then keeps streaming deltas for as long as it is read
+    def __init__(self, statuses, delay=0.0):
+        self.statuses = statuses
+        self.delay = delay
+        self.cancelled = False
+        self.timeout = None
+
+    def run(self, status):
+        return SimpleNamespace(id="run_1", thread_id="thread_1", status=status,
+                               required_action=SimpleNamespace(submit_tool_outputs=SimpleNamespace(
+                                   tool_calls=[SimpleNamespace(function=SimpleNamespace(name="lookup_grades"))])))
+
+    def events(self):
+        for status in self.statuses:
+            yield SimpleNamespace(event=f"thread.run.{status}", data=self.run(status))
+        while True:
+            time.sleep(self.delay)
+            text = SimpleNamespace(type="text", text=SimpleNamespace(value="more "))
+            yield SimpleNamespace(event="thread.message.delta", data=SimpleNamespace(delta=SimpleNamespace(content=[text])))
+
+    @contextmanager
+    def stream(self, timeout=None, **params):
+        self.timeout = timeout
+        yield self.events()
+
+    def cancel(self, thread_id, run_id):
+        self.cancelled = True
+        return self.run("cancelled")
+
+
+def streamed(runs, deadline):
+    job = Job()
+    client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=runs)))
+    for chunk in stream_run(job, client, {}, deadline):
+        job.chunks.append(chunk)
+    return job
+
+
+def test_a_streamed_run_that_asks_for_tools_is_cancelled():
+    runs = FakeStreamingRuns(["created", "requires_action"])
+    job = streamed(runs, deadline=5.0)
+    assert runs.cancelled and job.result.status == "requires_action" and job.run.status == "cancelled"
+    assert "lookup_grades" in job.result.describe()
+
+
+def test_a_streamed_run_is_cancelled_at_the_deadline():
+    runs = FakeStreamingRuns(["created", "in_progress"], delay=0.01)
+    job = streamed(runs, deadline=0.05)
+    assert runs.cancelled and runs.timeout == 0.05 and job.result.status == "timed out" and job.text()
@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+from assistant import AssistantSettingsForm
+from clients import get_client
+from mock_openai import MockConfig, MockOpenAIServer
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PAGES = {
+    "Augmented LLM": "pages/1_The Augmented LLM.py",
+    "Prompt chaining": "pages/2_Prompt_Chaining.py",
+    "Routing": "pages/3_Routing.py",
+    "Parallelisation": "pages/4_Parallelisation.py",
+    "Orchestrator-workers": "pages/5_Orchestrator-workers.py",
+    "Evaluator-optimizer": "pages/6_Evaluator-optimizer.py",
+}
+QUESTIONS = [
+    "What is a derivative?",
+    "How do I find the area under a curve?",
+    "Why does the chain rule work?",
+]
+RERUNS = 5
+TURN_TIMEOUT = 120.0
+# lower is better for every metric, so a rise past the tolerance is a regression
+METRICS = ["ttft", "total", "calls per turn", "rerun", "rerun calls"]
+
+
+def median(values):
+    return round(statistics.median(values), 4) if values else None
+
+
+def start_session(path, base_url):
+    at = AppTest.from_file(os.path.join(ROOT, path), default_timeout=TURN_TIMEOUT)
+    at.session_state["client"] = get_client("mock-key", base_url)
+    at.session_state["selected_assistant"] = None
+    return at.run()
+
+
+def answer(at, question):
+    # returns how long the answer took and how much of that the script thread was busy
+    started = time.monotonic()
+    at.chat_input[0].set_value(question).run()
+    busy = time.monotonic() - started
+    # the assistant page answers on a background job; rerun as its fragment would until it lands
+    while "assistant_job" in at.session_state and time.monotonic() - started < TURN_TIMEOUT:
+        time.sleep(0.02)
+        rerun_started = time.monotonic()
+        at.run()
+        busy += time.monotonic() - rerun_started
+    return time.monotonic() - started, busy
+
+
+def send_turn(at, question, server):
+    started = time.monotonic()
+    total, _ = answer(at, question)
+    requests = server.requests_since(started)
+    first_tokens = [request["first_token"] for request in requests if request["stream"] and request["first_token"]]
+    endpoints = {}
+    for request in requests:
+        endpoints[request["path"]] = endpoints.get(request["path"], 0) + 1
+    return {
+        "question": question,
+        # without streaming the student sees nothing until the whole answer is ready
+        "ttft": round(min(first_tokens) - started, 4) if first_tokens else round(total, 4),
+        "total": round(total, 4),
+        "calls": len(requests),
+        "errors": sum(1 for request in requests if (request["status"] or 0) >= 400),
+        "endpoints": endpoints,
+        "exception": [str(exception.value) for exception in at.exception],
+    }
+
+
+def measure_reruns(at, server):
+    times = []
+    calls = 0
+    for _ in range(RERUNS):
+        started = time.monotonic()
+        at.run()
+        times.append(time.monotonic() - started)
+        calls += len(server.requests_since(started))
+    return median(times), calls / RERUNS
+
+
+def benchmark_page(path, server, questions):
+    at = start_session(path, server.base_url)
+    turns = [send_turn(at, question, server) for question in questions]
+    rerun, rerun_calls = measure_reruns(at, server)
+    return {
+        "turns": turns,
+        "summary": {
+            "ttft": median([turn["ttft"] for turn in turns]),
+            "total": median([turn["total"] for turn in turns]),
+            "calls per turn": round(sum(turn["calls"] for turn in turns) / len(turns), 2),
+            "rerun": rerun,
+            "rerun calls": rerun_calls,
+            "failed turns": sum(1 for turn in turns if turn["exception"]),
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+@contextmanager
+def cold_caches():
+    # caches are created under the working directory, so run in a fresh one to start cold
+    previous = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="benchmark-"))
+    # shared caches open their files relative to the directory they were created in
+    st.cache_resource.clear()
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+        st.cache_resource.clear()
+
+
+def run_benchmarks(config, pages=None, questions=QUESTIONS):
+    with cold_caches(), MockOpenAIServer(config) as server:
+        server.state.add_assistant(AssistantSettingsForm.DEFAULT_ASSISTANT_ID)
+        results = {name: benchmark_page(PAGES[name], server, questions) for name in pages or PAGES}
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "mock": {"latency": config.latency, "jitter": config.jitter, "tokens per second": config.tokens_per_second,
+                 "error rate": config.error_rate},
+        "pages": results,
+    }
+
+
+def compare(results, baseline, tolerance):
+    # returns (page, metric, before, after) for every metric that got worse by more than tolerance
+    regressions = []
+    for name, page in results["pages"].items():
+        before = baseline.get("pages", {}).get(name, {}).get("summary")
+        if not before:
+            continue
+        for metric in METRICS:
+            old, new = before.get(metric), page["summary"].get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > 0.01:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def print_summary(results, baseline=None):
+    print(f"{'page':<22}" + "".join(f"{metric:>16}" for metric in METRICS))
+    for name, page in results["pages"].items():
+        before = (baseline or {}).get("pages", {}).get(name, {}).get("summary", {})
+        cells = []
+        for metric in METRICS:
+            value = page["summary"][metric]
+            cell = f"{value:g}"
+            if before.get(metric):
+                cell += f" ({(value - before[metric]) / before[metric]:+.0%})"
+            cells.append(f"{cell:>16}")
+        print(f"{name:<22}" + "".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each pattern page against the mock OpenAI API.")
+    parser.add_argument("--page", action="append", choices=list(PAGES), help="pages to run (default: all)")
+    parser.add_argument("--latency", type=float, default=0.2, help="median seconds before each response starts")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default="benchmark_baseline.json", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed fractional slowdown before failing")
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency, args.jitter, args.tokens_per_second, error_rate=args.error_rate)
+    results = run_benchmarks(config, args.page)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+
+    baseline = None
+    if os.path.exists(args.baseline) and os.path.abspath(args.baseline) != os.path.abspath(args.output):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    print_summary(results, baseline)
+    regressions = compare(results, baseline, args.tolerance) if baseline else []
+    for name, metric, old, new in regressions:
+        print(f"Regression: {name} {metric} went from {old:g} to {new:g}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
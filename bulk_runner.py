@@ -0,0 +1,432 @@
+import argparse
+import asyncio
+import contextvars
+import hashlib
+import importlib.util
+import json
+import os
+import time
+from collections import Counter
+from types import SimpleNamespace
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from clients import get_async_client_for, get_client, run_async
+from evaluator_optimizer import EvaluatorOptimizer
+from orchestrator import Deferred, Orchestrator
+from parallelisation import Concatenate, MajorityVote, ParallelEngine
+from prompt_chaining import ChainExecutor, Stage, StageCache
+from rate_limiter import SESSION, get_rate_limiter
+from response_cache import CachedClient, get_response_cache
+from routing import Route, Router, llm_classifier
+from tracing import get_tracer
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Every bulk request shares one rate limiter session. The limiter only covers this process, so
+# a run beside the app shares the key's limits with it only if capped with --rpm and --tpm.
+BULK_SESSION = "bulk"
+DEFAULT_CONCURRENCY = 16
+# the Batch API takes at most this many requests per input file
+BATCH_MAX_REQUESTS = 50000
+
+# The dataset record a call in batch mode belongs to. Like the rate limiter's session, it
+# follows the record's work onto the threads and tasks the patterns start.
+BATCH_RECORD = contextvars.ContextVar("batch_record", default=None)
+
+
+def load_page(filename):
+    # the pages hold each pattern's default prompts; loading one defines its class without drawing anything
+    spec = importlib.util.spec_from_file_location(f"bulk_{filename[0]}", os.path.join(ROOT, "pages", filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ChainingPattern:
+    def __init__(self, client, async_client):
+        page = load_page("2_Prompt_Chaining.py")
+        self.stages = [
+            Stage(config["name"], config["template"], config["model"], config["temperature"],
+                  page.GATES[config["gate"]](config["gate_value"]))
+            for config in page.PromptChainingPage.DEFAULT_STAGES
+        ]
+        self.executor = ChainExecutor(async_client, StageCache())
+
+    async def run(self, text):
+        results = await self.executor.run(self.stages, text)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results[-1].output, {"stages": {result.stage.name: result.output for result in results}}
+
+
+class RoutingPattern:
+    def __init__(self, client, async_client):
+        page = load_page("3_Routing.py").RoutingPage
+        self.model = page.DEFAULT_MODEL
+        self.client = async_client
+        routes = [
+            Route(
+                route["name"],
+                route["instructions"],
+                [example for example in route["examples"].splitlines() if example.strip()],
+                [keyword.strip() for keyword in route["keywords"].split(",") if keyword.strip()],
+            )
+            for route in page.DEFAULT_ROUTES
+        ]
+        self.router = Router(routes, llm_classify=llm_classifier(client, self.model))
+
+    async def run(self, text):
+        # the LLM classifier is synchronous, so it runs off the loop as the speculative router does
+        decision = await asyncio.to_thread(self.router.route, text)
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "system", "content": decision.route.instructions}, {"role": "user", "content": text}],
+        )
+        return response.choices[0].message.content, {"route": decision.route.name, "source": decision.source}
+
+
+class SectioningPattern:
+    def __init__(self, client, async_client):
+        self.sections = load_page("4_Parallelisation.py").ParallelisationPage.DEFAULT_SECTIONS
+        self.engine = ParallelEngine(async_client)
+
+    async def fan_out(self, text):
+        return await self.engine.section(text, self.sections, Concatenate())
+
+    async def run(self, text):
+        result = await self.fan_out(text)
+        if not result.succeeded:
+            raise RuntimeError(f"all {len(result.results)} parallel calls failed: {result.failed[0].error}")
+        return result.aggregate, {"branches": len(result.results), "succeeded": len(result.succeeded)}
+
+
+class VotingPattern(SectioningPattern):
+    SAMPLES = 5
+
+    def __init__(self, client, async_client):
+        self.instructions = load_page("4_Parallelisation.py").ParallelisationPage.DEFAULT_VOTING_INSTRUCTIONS
+        self.engine = ParallelEngine(async_client)
+
+    async def fan_out(self, text):
+        return await self.engine.vote(text, self.SAMPLES, self.instructions, MajorityVote())
+
+
+class OrchestratorPattern:
+    def __init__(self, client, async_client):
+        self.orchestrator = Orchestrator(async_client)
+
+    async def run(self, text):
+        graph = await self.orchestrator.plan(text)
+        results = await self.orchestrator.execute(text, graph)
+        record = BATCH_RECORD.get()
+        if record is not None and record.pending:
+            # a synthesis of placeholder results would be a wasted batch request
+            raise BatchDeferred(next(iter(record.pending)))
+        answer = ""
+        async for delta in self.orchestrator.synthesise(text, graph, results):
+            answer += delta
+        return answer, {"subtasks": len(graph.order), "failed": sum(1 for result in results.values() if not result.ok)}
+
+
+class EvaluatorPattern:
+    def __init__(self, client, async_client):
+        self.optimizer = EvaluatorOptimizer(async_client)
+
+    async def run(self, text):
+        result = await self.optimizer.run(text)
+        if result.best is None:
+            raise RuntimeError(f"no answer within the budget ({result.stop_reason})")
+        return result.best.text, {"score": result.best.score, "feedback": result.best.feedback,
+                                  "rounds": len(result.rounds), "stop_reason": result.stop_reason,
+                                  "tokens": result.tokens_used}
+
+
+PATTERNS = {
+    "chaining": ChainingPattern,
+    "routing": RoutingPattern,
+    "parallelisation": SectioningPattern,
+    "voting": VotingPattern,
+    "orchestrator": OrchestratorPattern,
+    "evaluator": EvaluatorPattern,
+}
+
+
+class BatchDeferred(Deferred):
+    # the call has no answer in the batch results yet, so it goes in the next request file
+    pass
+
+
+class BatchRequestFailed(Exception):
+    pass
+
+
+class BatchRecord:
+    def __init__(self, id):
+        self.id = id
+        self.pending = {}
+        self.calls = Counter()
+
+
+def batch_body(kwargs):
+    # the Batch API does not stream; a streamed call is answered with one chunk instead
+    return {key: value for key, value in kwargs.items() if key != "stream"}
+
+
+def completion_chunk(completion):
+    choice = completion.choices[0]
+    return ChatCompletionChunk.model_validate({
+        "id": completion.id,
+        "object": "chat.completion.chunk",
+        "created": completion.created,
+        "model": completion.model,
+        "choices": [{"index": 0, "delta": {"role": "assistant", "content": choice.message.content},
+                     "finish_reason": choice.finish_reason}],
+    })
+
+
+async def replay_chunks(completion):
+    yield completion_chunk(completion)
+
+
+class BatchCompletions:
+    # A call's custom_id is its record, a hash of its body, and how many identical calls the
+    # record made before it, so a rerun of the record asks for the same ids in the same order.
+    def __init__(self, responses):
+        self.responses = responses
+
+    def answer(self, kwargs):
+        record = BATCH_RECORD.get()
+        body = batch_body(kwargs)
+        digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        record.calls[digest] += 1
+        custom_id = f"{record.id}:{digest}:{record.calls[digest]}"
+        line = self.responses.get(custom_id)
+        if line is None:
+            record.pending[custom_id] = body
+            raise BatchDeferred(custom_id)
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            error = line.get("error") or (response.get("body") or {}).get("error") or {}
+            raise BatchRequestFailed(f"{custom_id} failed in the batch: {error.get('message', error) or response.get('status_code')}")
+        return ChatCompletion.model_validate(response["body"])
+
+    def create(self, **kwargs):
+        completion = self.answer(kwargs)
+        return iter([completion_chunk(completion)]) if kwargs.get("stream") else completion
+
+
+class AsyncBatchCompletions(BatchCompletions):
+    async def create(self, **kwargs):
+        completion = self.answer(kwargs)
+        return replay_chunks(completion) if kwargs.get("stream") else completion
+
+
+class BatchClient:
+    # Stands in for the OpenAI client when a run goes through the Batch API: chat completions
+    # are answered from batch output files, and calls without an answer defer their record.
+    def __init__(self, responses, asynchronous=False):
+        completions_class = AsyncBatchCompletions if asynchronous else BatchCompletions
+        self.chat = SimpleNamespace(completions=completions_class(responses))
+
+
+def read_batch_results(paths):
+    responses = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    result = json.loads(line)
+                    responses[result["custom_id"]] = result
+    return responses
+
+
+class BatchRequestWriter:
+    # Writes Batch API input lines, starting another file (requests.2.jsonl, ...) when one is full.
+    def __init__(self, path, max_requests=BATCH_MAX_REQUESTS):
+        self.path = path
+        self.max_requests = max_requests
+        self.paths = []
+        self.file = None
+        self.count = 0
+        self.total = 0
+
+    def next_path(self):
+        if not self.paths:
+            return self.path
+        stem, extension = os.path.splitext(self.path)
+        return f"{stem}.{len(self.paths) + 1}{extension}"
+
+    def write(self, custom_id, body):
+        if self.file is None or self.count >= self.max_requests:
+            self.close()
+            self.paths.append(self.next_path())
+            self.file = open(self.paths[-1], "w", encoding="utf-8")
+            self.count = 0
+        self.file.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions",
+                                    "body": body}) + "\n")
+        self.file.flush()
+        self.count += 1
+        self.total += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def read_dataset(path, input_field="input", id_field="id"):
+    # records without an id are numbered by line, which stays stable while the file is only appended to
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            if line.strip():
+                record = json.loads(line)
+                yield str(record.get(id_field, number)), record[input_field]
+
+
+def finished_ids(path):
+    # records already answered in the output; failed ones are tried again on the next run
+    finished = set()
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # an interrupted run can leave its last line cut short
+                    continue
+                if result.get("error") is None:
+                    finished.add(result["id"])
+    return finished
+
+
+def open_output(path):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    file = open(path, "a+", encoding="utf-8")
+    if file.tell():
+        file.seek(file.tell() - 1)
+        if file.read(1) != "\n":
+            file.write("\n")
+    return file
+
+
+class BulkRunner:
+    # Runs a pattern over dataset records, a bounded number at a time, appending each result
+    # to the output as soon as it is ready so an interrupted run can resume from the output.
+    # With a batch writer, calls are collected into Batch API request files instead of sent.
+    def __init__(self, name, pattern, output_path, concurrency=DEFAULT_CONCURRENCY, batch_writer=None):
+        self.name = name
+        self.pattern = pattern
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.batch_writer = batch_writer
+        self.tracer = get_tracer()
+        self.counts = Counter()
+
+    async def run_record(self, record_id, text):
+        record = BatchRecord(record_id)
+        BATCH_RECORD.set(record)
+        started = time.perf_counter()
+        output, details, error = None, None, None
+        with self.tracer.span("record", page=f"Bulk {self.name}", session=BULK_SESSION, record=record_id):
+            try:
+                output, details = await self.pattern.run(text)
+            except Exception as exception:
+                error = str(exception) or type(exception).__name__
+        if record.pending:
+            # whatever the pattern made of its deferred calls, the record is answered on a later pass
+            for custom_id, body in record.pending.items():
+                self.batch_writer.write(custom_id, body)
+            self.counts["deferred"] += 1
+            return None
+        self.counts["failed" if error is not None else "finished"] += 1
+        return {"id": record_id, "pattern": self.name, "input": text, "output": output, "details": details,
+                "error": error, "latency": round(time.perf_counter() - started, 3)}
+
+    async def worker(self, records, output):
+        # the workers share one iterator, so only `concurrency` records are in memory at once
+        for record_id, text in records:
+            # a task runs in a copy of the worker's context, so one record's batch state stays out of the next
+            result = await asyncio.create_task(self.run_record(record_id, text))
+            if result is not None:
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output.flush()
+
+    async def run(self, records):
+        SESSION.set(BULK_SESSION)
+        done = finished_ids(self.output_path)
+        started = time.perf_counter()
+
+        def remaining():
+            for record_id, text in records:
+                self.counts["records"] += 1
+                if record_id in done:
+                    self.counts["skipped"] += 1
+                    continue
+                yield record_id, text
+
+        pending = remaining()
+        with open_output(self.output_path) as output:
+            await asyncio.gather(*[self.worker(pending, output) for _ in range(self.concurrency)])
+        elapsed = time.perf_counter() - started
+        summary = {key: self.counts[key] for key in ["records", "skipped", "finished", "failed", "deferred"]}
+        summary["elapsed"] = round(elapsed, 3)
+        summary["throughput"] = round((self.counts["finished"] + self.counts["failed"]) / elapsed, 3) if elapsed else 0.0
+        if self.batch_writer is not None:
+            self.batch_writer.close()
+            summary["batch requests"] = self.batch_writer.total
+            summary["batch files"] = self.batch_writer.paths
+        return summary
+
+
+def run_bulk(pattern, dataset, output, client=None, concurrency=DEFAULT_CONCURRENCY, batch_requests=None,
+             batch_results=(), input_field="input", id_field="id", requests_per_minute=None, tokens_per_minute=None):
+    # Without batch_requests every call goes to the API through the shared clients. With it,
+    # calls are answered from the batch_results files, records that still need calls write
+    # them to batch_requests, and running again with the new results moves each record on
+    # by one step of its pattern until all are answered.
+    batch_writer = None
+    if batch_requests is not None:
+        responses = read_batch_results(batch_results)
+        sync_client, async_client = BatchClient(responses), BatchClient(responses, asynchronous=True)
+        batch_writer = BatchRequestWriter(batch_requests)
+    else:
+        if requests_per_minute or tokens_per_minute:
+            get_rate_limiter().cap(requests_per_minute, tokens_per_minute)
+        client = client or get_client(os.environ.get("OPENAI_API_KEY"), os.environ.get("OPENAI_BASE_URL"))
+        sync_client, async_client = CachedClient(client, get_response_cache()), get_async_client_for(client)
+    runner = BulkRunner(pattern, PATTERNS[pattern](sync_client, async_client), output, concurrency, batch_writer)
+    return run_async(runner.run(read_dataset(dataset, input_field, id_field)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a pattern over a JSONL dataset of student questions.")
+    parser.add_argument("pattern", choices=list(PATTERNS))
+    parser.add_argument("dataset", help="JSONL file with one record per line")
+    parser.add_argument("output", help="JSONL file results are appended to; records already in it are skipped")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="records in flight at once")
+    parser.add_argument("--input-field", default="input")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--batch-requests", help="write calls to this Batch API input file instead of sending them")
+    parser.add_argument("--batch-results", action="append", default=[],
+                        help="Batch API output file answering earlier requests (repeatable)")
+    parser.add_argument("--rpm", type=int, help="requests per minute this run may use, leaving the rest of the key's limit to the app")
+    parser.add_argument("--tpm", type=int, help="tokens per minute this run may use, leaving the rest of the key's limit to the app")
+    args = parser.parse_args()
+
+    summary = run_bulk(args.pattern, args.dataset, args.output, concurrency=args.concurrency,
+                       batch_requests=args.batch_requests, batch_results=args.batch_results,
+                       input_field=args.input_field, id_field=args.id_field,
+                       requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    print(f"{summary['finished']} finished, {summary['failed']} failed, {summary['skipped']} already done "
+          f"of {summary['records']} records in {summary['elapsed']:g}s")
+    if args.batch_requests:
+        if summary["deferred"]:
+            print(f"{summary['deferred']} records need {summary['batch requests']} more calls, written to "
+                  f"{', '.join(summary['batch files'])}. Submit them to the Batch API and run again "
+                  f"with its output added to the --batch-results given this time.")
+        else:
+            print("Every record is answered.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import json
+import os
+import uuid
+from openai import OpenAI
+from bulk_runner import PATTERNS, run_bulk
+from clients import get_client
+from mock_openai import MockConfig, MockOpenAIServer
+
+
+def write_dataset(path, count, prefix=None):
+    # questions are unique per test so the shared response cache cannot answer them
+    prefix = prefix or uuid.uuid4().hex[:8]
+    with open(path, "w") as file:
+        for number in range(count):
+            file.write(json.dumps({"id": f"q{number}", "input": f"What is a derivative? ({prefix} {number})"}) + "\n")
+
+
+def read_results(path):
+    # skips a line an interrupted run cut short
+    results = []
+    with open(path) as file:
+        for line in file:
+            try:
+                results.append(json.loads(line))
+            except ValueError:
+                pass
+    return results
+
+
+def answer_batch(server, request_paths, results_path):
+    # plays the Batch API: answers each request line and writes it in the batch output format
+    client = OpenAI(api_key="mock-key", base_url=server.base_url, max_retries=0)
+    with open(results_path, "w") as output:
+        for path in request_paths:
+            with open(path) as file:
+                for line in file:
+                    request = json.loads(line)
+                    response = client.chat.completions.create(**request["body"])
+                    output.write(json.dumps({
+                        "id": f"batch_req_{uuid.uuid4().hex[:8]}",
+                        "custom_id": request["custom_id"],
+                        "response": {"status_code": 200, "request_id": "req", "body": response.model_dump()},
+                        "error": None,
+                    }) + "\n")
+
+
+def test_every_pattern_answers_every_record(tmp_path):
+    with MockOpenAIServer(MockConfig(latency=0, tokens_per_second=0)) as server:
+        client = get_client("mock-key", server.base_url)
+        for pattern in PATTERNS:
+            dataset, output = tmp_path / f"{pattern}.jsonl", tmp_path / f"{pattern}_results.jsonl"
+            write_dataset(dataset, 3)
+            summary = run_bulk(pattern, str(dataset), str(output), client=client, concurrency=2)
+            assert summary["finished"] == 3 and summary["failed"] == 0, pattern
+            results = read_results(output)
+            assert sorted(result["id"] for result in results) == ["q0", "q1", "q2"]
+            assert all(result["output"] and result["pattern"] == pattern for result in results)
+
+
+def test_resumes_from_the_output(tmp_path):
+    dataset, output = tmp_path / "questions.jsonl", tmp_path / "results.jsonl"
+    prefix = uuid.uuid4().hex[:8]
+    with MockOpenAIServer(MockConfig(latency=0, tokens_per_second=0)) as server:
+        client = get_client("mock-key", server.base_url)
+        write_dataset(dataset, 3, prefix)
+        run_bulk("routing", str(dataset), str(output), client=client)
+        # an interrupted run leaves a cut-off line behind
+        with open(output, "a") as file:
+            file.write('{"id": "q3", "outp')
+        write_dataset(dataset, 5, prefix)
+        requests_before = len(server.state.requests)
+        summary = run_bulk("routing", str(dataset), str(output), client=client)
+        assert summary["skipped"] == 3 and summary["finished"] == 2
+        assert len([request for request in server.state.requests[requests_before:]
+                    if request["path"] == "/v1/chat/completions"]) >= 2
+    finished = [result["id"] for result in read_results(output)]
+    assert sorted(finished) == ["q0", "q1", "q2", "q3", "q4"]
+
+
+def test_batch_passes_follow_the_chain(tmp_path):
+    dataset, output = tmp_path / "questions.jsonl", tmp_path / "results.jsonl"
+    write_dataset(dataset, 4)
+    results_paths = []
+    with MockOpenAIServer(MockConfig(latency=0, tokens_per_second=0)) as server:
+        # one pass per stage: each stage's call can only be made once the one before is answered
+        for stage in range(3):
+            requests = tmp_path / f"requests_{stage}.jsonl"
+            summary = run_bulk("chaining", str(dataset), str(output), batch_requests=str(requests),
+                               batch_results=results_paths)
+            assert summary["deferred"] == 4 and summary["batch requests"] == 4
+            results_paths.append(str(tmp_path / f"results_{stage}.jsonl"))
+            answer_batch(server, summary["batch files"], results_paths[-1])
+        summary = run_bulk("chaining", str(dataset), str(output), batch_requests=str(tmp_path / "requests_3.jsonl"),
+                           batch_results=results_paths)
+    assert summary["finished"] == 4 and summary["deferred"] == 0
+    results = read_results(output)
+    assert all(result["output"].startswith("Mock answer") and len(result["details"]["stages"]) == 3 for result in results)
+
+
+def test_batch_fans_out_in_one_pass(tmp_path):
+    dataset, output = tmp_path / "questions.jsonl", tmp_path / "results.jsonl"
+    write_dataset(dataset, 2)
+    summary = run_bulk("voting", str(dataset), str(output), batch_requests=str(tmp_path / "requests.jsonl"))
+    # the five identical votes get their own custom ids
+    assert summary["deferred"] == 2 and summary["batch requests"] == 10
+    with open(tmp_path / "requests.jsonl") as file:
+        requests = [json.loads(line) for line in file]
+    assert len({request["custom_id"] for request in requests}) == 10
+    assert all(request["url"] == "/v1/chat/completions" and "stream" not in request["body"] for request in requests)
+    assert not os.path.exists(output) or not read_results(output)
+
+
+def test_orchestrator_waits_for_its_workers_before_synthesising(tmp_path):
+    dataset, output = tmp_path / "questions.jsonl", tmp_path / "results.jsonl"
+    write_dataset(dataset, 2)
+    results_paths = []
+    with MockOpenAIServer(MockConfig(latency=0, tokens_per_second=0)) as server:
+        # the mock's plan chains two subtasks: plan, s1, s2, then synthesise
+        for stage in range(4):
+            requests = tmp_path / f"requests_{stage}.jsonl"
+            summary = run_bulk("orchestrator", str(dataset), str(output), batch_requests=str(requests),
+                               batch_results=results_paths)
+            assert summary["deferred"] == 2 and summary["batch requests"] == 2, stage
+            with open(requests) as file:
+                prompts = [json.loads(line)["body"]["messages"][-1]["content"] for line in file]
+            assert all("(no result:" not in prompt for prompt in prompts)
+            results_paths.append(str(tmp_path / f"results_{stage}.jsonl"))
+            answer_batch(server, summary["batch files"], results_paths[-1])
+        summary = run_bulk("orchestrator", str(dataset), str(output), batch_requests=str(tmp_path / "requests_4.jsonl"),
+                           batch_results=results_paths)
+    assert summary["finished"] == 2 and summary["deferred"] == 0
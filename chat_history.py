@@ -0,0 +1,47 @@
+import hashlib
+import streamlit as st
+
+
+PAGE_SIZE = 20
+# st.fragment arrived in Streamlit 1.37; older versions just rerun the history with the page
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda function: function)
+
+
+def message_id(message):
+    return hashlib.sha256(f"{message['role']}\0{message['content'] or ''}".encode("utf-8")).hexdigest()[:16]
+
+
+class ChatHistory:
+    # Draws only the newest page of messages, with earlier pages loaded on request. Paging
+    # starts again when the conversation is replaced, which is noticed by the message last
+    # seen no longer being where it was, not just by the count going down.
+    def __init__(self, key="messages", page_size=PAGE_SIZE):
+        self.key = key
+        self.page_size = page_size
+        state = st.session_state.setdefault(f"{key}_history", {"visible": page_size, "seen": 0, "last": None})
+        messages = st.session_state[key]
+        seen = state["seen"]
+        if seen > len(messages) or (seen and message_id(messages[seen - 1]) != state["last"]):
+            state["visible"] = page_size
+        state.update(seen=len(messages), last=message_id(messages[-1]) if messages else None)
+        self.state = state
+
+    def load_earlier(self):
+        self.state["visible"] += self.page_size
+
+    def display(self, first=0, greeting=None):
+        display_history(self, first, greeting)
+
+
+@fragment
+def display_history(history, first, greeting):
+    # clicking "load earlier" reruns only this fragment, not the page around it
+    messages = st.session_state[history.key]
+    start = max(first, len(messages) - history.state["visible"])
+    if start > first:
+        st.button(f"Load earlier messages ({start - first} hidden)", key=f"{history.key}_load_earlier",
+                  on_click=history.load_earlier)
+    elif greeting:
+        st.chat_message("assistant").markdown(greeting)
+    for index in range(start, len(messages)):
+        st.chat_message(messages[index]["role"]).markdown(messages[index]["content"])
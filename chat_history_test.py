@@ -0,0 +1,39 @@
+from streamlit.testing.v1 import AppTest
+
+
+def long_chat():
+    import streamlit as st
+    from chat_history import ChatHistory
+
+    if "messages" not in st.session_state:
+        st.session_state["messages"] = [
+            {"role": "user" if index % 2 else "assistant", "content": f"message {index}"} for index in range(45)
+        ]
+    ChatHistory(page_size=20).display(first=1, greeting="Hello, there.")
+
+
+def test_only_the_newest_page_is_drawn_until_more_is_loaded():
+    app = AppTest.from_function(long_chat).run()
+    assert len(app.chat_message) == 20
+    assert app.chat_message[-1].markdown[0].value == "message 44"
+
+    app.button[0].click().run()
+    assert len(app.chat_message) == 40
+
+    app.button[0].click().run()
+    assert len(app.chat_message) == 45
+    assert app.chat_message[0].markdown[0].value == "Hello, there."
+    assert not app.button
+
+
+def test_a_replaced_conversation_of_the_same_length_is_drawn_afresh():
+    app = AppTest.from_function(long_chat).run()
+    app.button[0].click().run()
+    assert len(app.chat_message) == 40
+
+    app.session_state["messages"] = [
+        {"role": "user" if index % 2 else "assistant", "content": f"new message {index}"} for index in range(45)
+    ]
+    app.run()
+    assert len(app.chat_message) == 20
+    assert app.chat_message[-1].markdown[0].value == "new message 44"
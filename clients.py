@@ -0,0 +1,120 @@
+import asyncio
+import os
+import threading
+import httpx
+import streamlit as st
+from openai import AsyncOpenAI, OpenAI
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit.runtime.scriptrunner_utils.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
+from recording import (AsyncRecordingTransport, AsyncReplayTransport, RecordingTransport, ReplayTransport,
+                       get_recorder, get_recording)
+from rate_limiter import SESSION, AsyncRateLimitedTransport, RateLimitedTransport, current_session, get_rate_limiter
+from response_cache import CachedClient, get_response_cache
+from tracing import TRACE, AsyncTracingTransport, TracingTransport, get_tracer
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+
+# One pool per API key and base URL is shared by every browser session in the process,
+# so sessions reuse warm keep-alive connections instead of each doing their own handshakes.
+POOL_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=60.0)
+TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+
+class EventLoopThread:
+    # The async client's connections belong to the loop they were opened on, so all
+    # async work runs on this single long-lived loop rather than a new asyncio.run per rerun.
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="openai-event-loop", daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine, timeout=None):
+        return self.submit(coroutine).result(timeout)
+
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+
+@st.cache_resource(show_spinner=False)
+def get_event_loop():
+    return EventLoopThread()
+
+
+def network_transport(asynchronous=False):
+    # OPENAI_REPLAY serves responses from a recording instead of the network;
+    # OPENAI_RECORD writes every exchange to one. OPENAI_REPLAY_SPEED scales the
+    # recorded timings (0 replays without waiting).
+    if os.environ.get("OPENAI_REPLAY"):
+        recording = get_recording(os.environ["OPENAI_REPLAY"])
+        speed = float(os.environ.get("OPENAI_REPLAY_SPEED", "1"))
+        return AsyncReplayTransport(recording, speed) if asynchronous else ReplayTransport(recording, speed)
+    if asynchronous:
+        transport = httpx.AsyncHTTPTransport(limits=POOL_LIMITS, http2=HTTP2)
+    else:
+        transport = httpx.HTTPTransport(limits=POOL_LIMITS, http2=HTTP2)
+    if os.environ.get("OPENAI_RECORD"):
+        recorder = get_recorder(os.environ["OPENAI_RECORD"])
+        return AsyncRecordingTransport(transport, recorder) if asynchronous else RecordingTransport(transport, recorder)
+    return transport
+
+
+# Retries happen in the rate-limited transport, which knows about quotas, so the SDK's own are off.
+@st.cache_resource(show_spinner=False)
+def get_client(api_key, base_url=None):
+    transport = RateLimitedTransport(network_transport(), get_rate_limiter())
+    transport = TracingTransport(transport, get_tracer())
+    http_client = httpx.Client(transport=transport, timeout=TIMEOUT, follow_redirects=True)
+    return OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+
+
+@st.cache_resource(show_spinner=False)
+def get_async_client(api_key, base_url=None):
+    transport = AsyncRateLimitedTransport(network_transport(asynchronous=True), get_rate_limiter())
+    transport = AsyncTracingTransport(transport, get_tracer())
+    http_client = httpx.AsyncClient(transport=transport, timeout=TIMEOUT, follow_redirects=True)
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+
+
+def get_async_client_for(client, cached=True):
+    base_url = str(client.base_url) if client.base_url else None
+    async_client = get_async_client(client.api_key, base_url)
+    return CachedClient(async_client, get_response_cache(), asynchronous=True) if cached else async_client
+
+
+async def in_session(coroutine, session, span=None):
+    SESSION.set(session)
+    TRACE.set(span)
+    return await coroutine
+
+
+def run_async(coroutine):
+    return get_event_loop().run(in_session(coroutine, current_session(), TRACE.get()))
+
+
+def submit_async(coroutine):
+    # schedules the coroutine without waiting; the returned concurrent future can be checked on a later rerun
+    return get_event_loop().submit(in_session(coroutine, current_session(), TRACE.get()))
+
+
+def bind_script_context(callback):
+    # Callbacks that draw Streamlit elements run on the shared loop thread, which has no
+    # session of its own. The calling script's context is attached for the length of each
+    # call and then taken off again, so the loop thread never keeps one session's context
+    # for another session's callback. The loop runs one callback at a time, so they cannot overlap.
+    ctx = get_script_run_ctx()
+
+    def bound(*args, **kwargs):
+        thread = threading.current_thread()
+        previous = get_script_run_ctx(suppress_warning=True)
+        add_script_run_ctx(thread, ctx)
+        try:
+            return callback(*args, **kwargs)
+        finally:
+            # add_script_run_ctx cannot detach a context, so reset the attribute get_script_run_ctx reads
+            setattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, previous)
+    return bound
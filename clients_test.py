@@ -0,0 +1,46 @@
+import threading
+from types import SimpleNamespace
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from clients import EventLoopThread, bind_script_context, get_async_client_for, get_client
+
+
+def session_context(session_id):
+    return SimpleNamespace(session_id=session_id, pages_manager=SimpleNamespace(main_script_hash="main"))
+
+
+def bind_in_session(ctx, callback):
+    # binds the callback on a thread running as that session's script would
+    bound = []
+
+    def script():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        bound.append(bind_script_context(callback))
+    thread = threading.Thread(target=script)
+    thread.start()
+    thread.join()
+    return bound[0]
+
+
+def test_callbacks_from_two_sessions_keep_their_own_context():
+    seen = []
+
+    def record():
+        seen.append(getattr(get_script_run_ctx(suppress_warning=True), "session_id", None))
+
+    first = bind_in_session(session_context("first"), record)
+    second = bind_in_session(session_context("second"), record)
+    loop = EventLoopThread()
+    done = threading.Event()
+    for callback in [first, second, first, record, done.set]:
+        loop.loop.call_soon_threadsafe(callback)
+    assert done.wait(5)
+    # nothing is left on the loop thread for a callback that was not bound
+    assert seen == ["first", "second", "first", None]
+    loop.loop.call_soon_threadsafe(loop.loop.stop)
+
+
+def test_sessions_share_one_pooled_client():
+    client = get_client("test-key", "http://127.0.0.1:9/v1")
+    assert get_client("test-key", "http://127.0.0.1:9/v1") is client
+    assert get_client("other-key", "http://127.0.0.1:9/v1") is not client
+    assert get_async_client_for(client).client is get_async_client_for(client).client
@@ -0,0 +1,124 @@
+from functools import lru_cache
+import streamlit as st
+from clients import get_async_client_for, submit_async
+from document_parsing import Tokenizer
+
+
+# Per-request history budgets, well under each model's context limit, so a long session
+# costs about the same per turn as a short one.
+MODEL_BUDGETS = {"gpt-3.5-turbo": 3000, "gpt-4o-mini": 6000, "gpt-4o": 6000}
+DEFAULT_BUDGET = 4000
+MESSAGE_OVERHEAD = 4
+SUMMARY_MODEL = "gpt-4o-mini"
+SUMMARY_PROMPT = (
+    "Update the running summary of this conversation with the new turns below. Keep names, facts, "
+    "decisions and open questions; drop pleasantries. Reply with the summary only."
+)
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    return Tokenizer()
+
+
+def count_tokens(message):
+    return MESSAGE_OVERHEAD + len(get_tokenizer().encode(message["content"] or ""))
+
+
+def new_state():
+    return {"counts": [], "total": 0, "summary": None, "summary_tokens": 0, "summarised": 0,
+            "summarised_tokens": 0, "pending": None}
+
+
+class ContextWindow:
+    # Token counts are worked out once per message and cached in state alongside the
+    # messages, so each turn only counts what was appended since the last one.
+    def __init__(self, client, model, messages, state, budget=None, submit=None):
+        self.client = client
+        self.model = model
+        self.messages = messages
+        self.state = state
+        self.budget = budget or MODEL_BUDGETS.get(model, DEFAULT_BUDGET)
+        self.submit = submit or submit_async
+        if not state or len(state["counts"]) > len(messages):
+            # a fresh session, or the messages were cleared since the counts were cached
+            state.clear()
+            state.update(new_state())
+
+    def append(self, message):
+        self.messages.append(message)
+        self.sync()
+
+    def sync(self):
+        counts = self.state["counts"]
+        for message in self.messages[len(counts):]:
+            counts.append(count_tokens(message))
+            self.state["total"] += counts[-1]
+
+    def unsummarised_tokens(self):
+        return self.state["total"] - self.state["summarised_tokens"]
+
+    def select(self):
+        # newest messages first until the budget runs out, behind the summary of everything older
+        self.sync()
+        self.collect_summary()
+        counts = self.state["counts"]
+        remaining = self.budget - self.state["summary_tokens"]
+        start = len(self.messages)
+        while start > self.state["summarised"] and counts[start - 1] <= remaining:
+            start -= 1
+            remaining -= counts[start]
+        if start == len(self.messages) and self.messages:
+            start -= 1  # always send the newest message, even on its own it is over budget
+        if self.unsummarised_tokens() > self.budget:
+            self.compact()
+        selected = [{"role": message["role"], "content": message["content"]} for message in self.messages[start:]]
+        if self.state["summary"]:
+            selected.insert(0, {"role": "system", "content": f"Summary of the earlier conversation: {self.state['summary']}"})
+        return selected
+
+    def compact(self):
+        # folds the older turns into the summary in the background, keeping the newest half of the budget verbatim
+        if self.state["pending"] is not None:
+            return
+        counts = self.state["counts"]
+        cut = len(self.messages)
+        kept = 0
+        while cut > self.state["summarised"] and kept + counts[cut - 1] <= self.budget // 2:
+            cut -= 1
+            kept += counts[cut]
+        if cut <= self.state["summarised"]:
+            return
+        turns = self.messages[self.state["summarised"]:cut]
+        self.state["pending"] = (cut, self.submit(self.summarise(self.state["summary"], turns)))
+
+    async def summarise(self, summary, turns):
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in turns)
+        response = await self.client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Summary so far: {summary or '(none)'}\n\nNew turns:\n{transcript}"},
+            ],
+        )
+        return response.choices[0].message.content
+
+    def collect_summary(self):
+        if self.state["pending"] is None or not self.state["pending"][1].done():
+            return
+        cut, future = self.state["pending"]
+        self.state["pending"] = None
+        if future.exception() is not None:
+            return
+        summary = future.result()
+        self.state["summary"] = summary
+        self.state["summary_tokens"] = count_tokens({"content": summary})
+        self.state["summarised_tokens"] += sum(self.state["counts"][self.state["summarised"]:cut])
+        self.state["summarised"] = cut
+
+
+def get_context_window(client, model, key="messages"):
+    return ContextWindow(
+        get_async_client_for(client, cached=False), model,
+        st.session_state[key], st.session_state.setdefault(f"{key}_context_window", {}),
+    )
@@ -0,0 +1,74 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+from context_window import ContextWindow, count_tokens
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, model, messages):
+        self.calls.append(messages)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="They asked about limits."))])
+
+
+def deferred():
+    # runs submitted coroutines only when run() is called, like a summary finishing between reruns
+    pending = []
+
+    def submit(coroutine):
+        future = Future()
+        pending.append((coroutine, future))
+        return future
+
+    def run():
+        for coroutine, future in pending:
+            try:
+                coroutine.send(None)
+            except StopIteration as stop:
+                future.set_result(stop.value)
+        pending.clear()
+    return submit, run
+
+
+def turn(number):
+    return [{"role": "user", "content": f"question {number} " + "word " * 20},
+            {"role": "assistant", "content": f"answer {number} " + "word " * 20}]
+
+
+def test_counts_are_cached_and_selection_fits_budget():
+    messages, state = [], {}
+    window = ContextWindow(SimpleNamespace(), "gpt-4o-mini", messages, state, budget=200,
+                           submit=lambda coroutine: coroutine.close() or Future())
+    for number in range(10):
+        for message in turn(number):
+            window.append(message)
+
+    assert state["total"] == sum(count_tokens(message) for message in messages)
+    selected = window.select()
+    assert sum(count_tokens(message) for message in selected) <= 200
+    assert selected[-1] == messages[-1]
+
+    messages.clear()
+    assert ContextWindow(SimpleNamespace(), "gpt-4o-mini", messages, state).state["total"] == 0
+
+
+def test_older_turns_are_compacted_in_the_background():
+    completions = FakeCompletions()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    messages, state = [], {}
+    submit, run = deferred()
+    window = ContextWindow(client, "gpt-4o-mini", messages, state, budget=200, submit=submit)
+    for number in range(10):
+        for message in turn(number):
+            window.append(message)
+
+    assert window.select()[0]["role"] != "system"
+    assert state["pending"] is not None and not completions.calls
+    run()
+
+    selected = window.select()
+    assert selected[0] == {"role": "system", "content": "Summary of the earlier conversation: They asked about limits."}
+    assert "question 0" in completions.calls[0][1]["content"]
+    assert 0 < state["summarised"] < len(messages)
+    assert window.unsummarised_tokens() <= 100
@@ -0,0 +1,171 @@
+import codecs
+import io
+import multiprocessing
+import os
+import re
+import streamlit as st
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from queue import Empty
+
+
+TEXT_BLOCK_BYTES = 64 * 1024
+QUEUE_SIZE = 256
+SENTENCE_END = re.compile(r"[.!?:]\s*$|\n")
+WORD = re.compile(r"\S+\s*")
+WAIT_INTERVAL = 0.05
+
+
+class Tokenizer:
+    # tiktoken when it is installed; otherwise whitespace-delimited words stand in for tokens
+    def __init__(self, encoding="o200k_base"):
+        try:
+            import tiktoken
+            self.encoding = tiktoken.get_encoding(encoding)
+        except (ImportError, OSError):
+            self.encoding = None
+
+    def encode(self, text):
+        return self.encoding.encode(text) if self.encoding else WORD.findall(text)
+
+    def decode(self, tokens):
+        return self.encoding.decode(tokens) if self.encoding else "".join(tokens)
+
+
+def iter_pages(name, content):
+    # yields (page number, text) one page at a time; plain text comes in fixed-size blocks
+    if name.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+        for number, page in enumerate(PdfReader(io.BytesIO(content)).pages, start=1):
+            yield number, (page.extract_text() or "") + "\n"
+        return
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for number, start in enumerate(range(0, len(content), TEXT_BLOCK_BYTES), start=1):
+        yield number, decoder.decode(content[start:start + TEXT_BLOCK_BYTES], final=start + TEXT_BLOCK_BYTES >= len(content))
+
+
+def boundary(tokenizer, tokens, size):
+    # prefer ending a chunk after a sentence or line in its last quarter
+    for index in range(size - 1, size * 3 // 4, -1):
+        if SENTENCE_END.search(tokenizer.decode(tokens[index:index + 1])):
+            return index + 1
+    return size
+
+
+def chunk_pages(pages, tokenizer=None, size=300, overlap=50):
+    # Only the current page's tokens and the overlap carried from the last chunk are ever held.
+    tokenizer = tokenizer or Tokenizer()
+    tokens = []
+    numbers = []
+    carried = 0
+    for number, text in pages:
+        page_tokens = tokenizer.encode(text)
+        tokens.extend(page_tokens)
+        numbers.extend([number] * len(page_tokens))
+        while len(tokens) >= size:
+            cut = boundary(tokenizer, tokens, size)
+            yield numbers[0], tokenizer.decode(tokens[:cut])
+            start = max(cut - overlap, 1)
+            del tokens[:start]
+            del numbers[:start]
+            carried = len(tokens)
+    if len(tokens) > carried and tokenizer.decode(tokens).strip():
+        yield numbers[0], tokenizer.decode(tokens)
+
+
+def parse_file(name, content, size=300, overlap=50):
+    for page, text in chunk_pages(iter_pages(name, content), size=size, overlap=overlap):
+        yield {"text": text, "source": name, "page": page}
+
+
+def parse_into_queue(name, content, queue, stop, size, overlap):
+    # runs in a worker process; a full queue blocks the worker until the consumer catches up
+    count = 0
+    try:
+        for chunk in parse_file(name, content, size, overlap):
+            if stop.is_set():
+                return
+            queue.put((name, "chunk", chunk))
+            count += 1
+    except Exception as error:
+        queue.put((name, "failed", f"failed: {error}"))
+        return
+    queue.put((name, "parsed", f"parsed {count} chunk(s)"))
+
+
+def report_crash(future, name, queue):
+    # a worker that dies outright never reaches its own final put, which would leave the consumer waiting
+    if not future.cancelled() and future.exception() is not None:
+        queue.put((name, "failed", f"failed: {future.exception()}"))
+
+
+@st.cache_resource(show_spinner=False)
+def get_parse_pool():
+    # One pool for the whole server. Spawned workers don't inherit locks other server threads
+    # hold mid-fork; they import this module for parse_into_queue, and the page that started
+    # them as __mp_main__, which is why pages only draw under `if __name__ == "__main__"`.
+    return ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context("spawn"))
+
+
+@st.cache_resource(show_spinner=False)
+def get_queue_manager():
+    return multiprocessing.get_context("spawn").Manager()
+
+
+def submit_parse(*args):
+    # a worker that dies breaks the whole pool, so a broken pool is replaced rather than kept until a restart
+    try:
+        return get_parse_pool().submit(parse_into_queue, *args)
+    except BrokenProcessPool:
+        get_parse_pool().shutdown(wait=False)
+        get_parse_pool.clear()
+        return get_parse_pool().submit(parse_into_queue, *args)
+
+
+def parse_uploads(files, size=300, overlap=50, on_progress=None):
+    # files is a list of (name, bytes); chunks are yielded as soon as any worker produces them
+    on_progress = on_progress or (lambda name, status: None)
+    if len(files) == 1:
+        name, content = files[0]
+        on_progress(name, "parsing")
+        count = 0
+        try:
+            for chunk in parse_file(name, content, size, overlap):
+                count += 1
+                yield chunk
+        except Exception as error:
+            on_progress(name, f"failed: {error}")
+            return
+        on_progress(name, f"parsed {count} chunk(s)")
+        return
+
+    manager = get_queue_manager()
+    queue = manager.Queue(maxsize=QUEUE_SIZE)
+    stop = manager.Event()
+    futures = []
+    try:
+        for name, content in files:
+            future = submit_parse(name, content, queue, stop, size, overlap)
+            future.add_done_callback(lambda future, name=name: report_crash(future, name, queue))
+            futures.append(future)
+            on_progress(name, "parsing")
+        remaining = len(files)
+        while remaining:
+            name, kind, item = queue.get()
+            if kind == "chunk":
+                yield item
+                continue
+            remaining -= 1
+            on_progress(name, item)
+    finally:
+        # The pool and manager are shared, so only this run's files are cancelled. If the consumer
+        # stopped early, workers still parsing see the stop flag at their next chunk, and draining
+        # the queue frees any waiting on it.
+        stop.set()
+        for future in futures:
+            future.cancel()
+        while not all(future.done() for future in futures):
+            try:
+                queue.get(timeout=WAIT_INTERVAL)
+            except Empty:
+                pass
@@ -0,0 +1,66 @@
+import os
+import sys
+import pytest
+from document_parsing import Tokenizer, chunk_pages, get_parse_pool, iter_pages, parse_uploads
+
+# spawned workers import __main__, and an AppTest elsewhere in the run leaves its unguarded script there
+MAIN = sys.modules["__main__"]
+
+
+@pytest.fixture(autouse=True)
+def main_module(monkeypatch):
+    monkeypatch.setitem(sys.modules, "__main__", MAIN)
+
+
+def test_chunks_overlap_and_end_on_sentences():
+    tokenizer = Tokenizer()
+    pages = [(1, "One two three four. " * 30), (2, "Five six seven eight. " * 30)]
+    chunks = list(chunk_pages(pages, tokenizer, size=50, overlap=10))
+
+    assert all(len(tokenizer.encode(text)) <= 50 for _, text in chunks)
+    assert all(text.rstrip().endswith(".") for _, text in chunks[:-1])
+    first, second = tokenizer.encode(chunks[0][1]), tokenizer.encode(chunks[1][1])
+    assert first[-10:] == second[:10]
+    assert chunks[0][0] == 1 and chunks[-1][0] == 2
+
+
+def test_text_is_read_in_blocks_without_splitting_characters():
+    content = ("é" * 40000).encode()
+    pages = list(iter_pages("notes.md", content))
+    assert len(pages) > 1
+    assert "".join(text for _, text in pages) == "é" * 40000
+
+
+def test_parse_uploads_across_processes():
+    files = [(f"week{week}.txt", f"Lecture {week} covers limits. ".encode() * 200) for week in range(3)]
+    progress = {}
+    chunks = list(parse_uploads(files, size=100, overlap=20, on_progress=progress.__setitem__))
+
+    assert {chunk["source"] for chunk in chunks} == {name for name, _ in files}
+    assert len(progress) == 3 and all(status.startswith("parsed") for status in progress.values())
+
+
+def test_uploads_share_one_spawned_pool():
+    files = [(f"week{week}.txt", b"Limits. " * 50) for week in range(2)]
+    list(parse_uploads(files, size=50, overlap=10))
+    pool = get_parse_pool()
+    list(parse_uploads(files, size=50, overlap=10))
+    assert get_parse_pool() is pool and pool._mp_context.get_start_method() == "spawn"
+
+
+def test_a_broken_pool_is_replaced():
+    pool = get_parse_pool()
+    # a worker that dies outright breaks the pool
+    assert pool.submit(os._exit, 1).exception() is not None
+    files = [(f"week{week}.txt", b"Limits. " * 50) for week in range(2)]
+    progress = {}
+    assert list(parse_uploads(files, size=50, overlap=10, on_progress=progress.__setitem__))
+    assert get_parse_pool() is not pool and all(status.startswith("parsed") for status in progress.values())
+
+
+def test_stopping_early_leaves_the_pool_free():
+    files = [(f"week{week}.txt", b"Limits and slopes. " * 20000) for week in range(3)]
+    chunks = parse_uploads(files, size=50, overlap=10)
+    next(chunks)
+    chunks.close()
+    assert len(list(parse_uploads(files[:2], size=5000, overlap=10))) > 0
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import time
+import openai
+from tracing import span
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class Budget:
+    def __init__(self, max_tokens=20000, max_seconds=60.0):
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+        self.tokens_used = 0
+        self.reserved = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def remaining_tokens(self):
+        return self.max_tokens - self.tokens_used - self.reserved
+
+    @property
+    def remaining_seconds(self):
+        return self.max_seconds - self.elapsed
+
+    def reserve(self, tokens):
+        # concurrent calls hold a worst-case reservation so together they cannot overshoot
+        if self.remaining_seconds <= 0:
+            raise BudgetExceeded("latency budget")
+        if tokens > self.remaining_tokens:
+            raise BudgetExceeded("token budget")
+        self.reserved += tokens
+
+    def settle(self, reserved, usage):
+        self.reserved -= reserved
+        self.tokens_used += usage.total_tokens if usage is not None else reserved
+        if self.tokens_used > self.max_tokens:
+            # the prompt estimate fell short of the real usage; nothing more may be spent
+            raise BudgetExceeded("token budget")
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+class Candidate:
+    def __init__(self, text, round, score=None, feedback=""):
+        self.text = text
+        self.round = round
+        self.score = score
+        self.feedback = feedback
+
+
+class OptimisationResult:
+    def __init__(self, best, rounds, stop_reason, budget):
+        self.best = best
+        self.rounds = rounds
+        self.stop_reason = stop_reason
+        self.tokens_used = budget.tokens_used
+        self.elapsed = budget.elapsed
+
+
+class EvaluatorOptimizer:
+    DEFAULT_MODEL = "gpt-4o-mini"
+    GENERATOR_INSTRUCTIONS = "You are a socratic tutor. Answer the student's request."
+    REVISION_INSTRUCTIONS = (
+        "You are a socratic tutor. Improve your previous answer to the student's request using the "
+        "evaluator's feedback. Reply with the improved answer only."
+    )
+    EVALUATOR_INSTRUCTIONS = (
+        "You evaluate tutor answers for accuracy, clarity and whether they guide the student to think "
+        'for themselves. Reply with JSON of the form {"score": <0-10>, "feedback": "..."}.'
+    )
+
+    def __init__(self, client, model=DEFAULT_MODEL, candidates_per_round=3, max_rounds=3, threshold=8.0,
+                 min_improvement=0.5, max_completion_tokens=600, budget_tokens=20000, budget_seconds=60.0):
+        self.client = client
+        self.model = model
+        self.candidates_per_round = candidates_per_round
+        self.max_rounds = max_rounds
+        self.threshold = threshold
+        self.min_improvement = min_improvement
+        self.max_completion_tokens = max_completion_tokens
+        self.budget_tokens = budget_tokens
+        self.budget_seconds = budget_seconds
+
+    async def call(self, budget, messages, max_tokens, **params):
+        reserved = sum(estimate_tokens(message["content"]) for message in messages) + max_tokens
+        budget.reserve(reserved)
+        usage = None
+        try:
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(model=self.model, messages=messages, max_tokens=max_tokens, **params),
+                timeout=max(budget.remaining_seconds, 0.01),
+            )
+            usage = response.usage
+        finally:
+            # a cancelled or failed call is charged its full reservation
+            budget.settle(reserved, usage)
+        return response.choices[0].message.content
+
+    async def generate(self, budget, task, previous):
+        if previous is None:
+            messages = [{"role": "system", "content": self.GENERATOR_INSTRUCTIONS},
+                        {"role": "user", "content": task}]
+        else:
+            messages = [{"role": "system", "content": self.REVISION_INSTRUCTIONS},
+                        {"role": "user", "content": f"Request: {task}\n\nPrevious answer:\n{previous.text}\n\n"
+                                                    f"Evaluator feedback:\n{previous.feedback}"}]
+        return await self.call(budget, messages, self.max_completion_tokens, temperature=1.0)
+
+    async def evaluate(self, budget, task, text):
+        content = await self.call(
+            budget,
+            [{"role": "system", "content": self.EVALUATOR_INSTRUCTIONS},
+             {"role": "user", "content": f"Request: {task}\n\nAnswer:\n{text}"}],
+            200,
+            temperature=0,
+            response_format={"type": "json_object"},
+        )
+        verdict = json.loads(content)
+        if not isinstance(verdict, dict):
+            raise ValueError("the verdict is not a JSON object")
+        return float(verdict.get("score", 0)), verdict.get("feedback", "")
+
+    async def candidate(self, budget, task, previous, round):
+        with span("stage", stage=f"round {round} generate"):
+            text = await self.generate(budget, task, previous)
+        with span("stage", stage=f"round {round} evaluate") as current:
+            score, feedback = await self.evaluate(budget, task, text)
+            current.set(score=score)
+        return Candidate(text, round, score, feedback)
+
+    async def run_round(self, budget, task, previous, round):
+        # candidates are generated and evaluated concurrently; the first one over the
+        # threshold cancels the rest of the round
+        tasks = [asyncio.create_task(self.candidate(budget, task, previous, round))
+                 for _ in range(self.candidates_per_round)]
+        candidates = []
+        budget_error = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    candidate = await next_done
+                except BudgetExceeded as error:
+                    budget_error = error
+                    continue
+                except asyncio.TimeoutError:
+                    budget_error = BudgetExceeded("latency budget")
+                    continue
+                except (json.JSONDecodeError, ValueError, TypeError):
+                    continue
+                except openai.APIError:
+                    # one failed call loses its candidate, not the round
+                    continue
+                candidates.append(candidate)
+                if candidate.score >= self.threshold:
+                    break
+        finally:
+            for task_ in tasks:
+                task_.cancel()
+            # let cancelled calls settle their reservations before the budget is reported
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if not candidates and budget_error is not None:
+            raise budget_error
+        return candidates
+
+    async def run(self, task, on_round=None):
+        budget = Budget(self.budget_tokens, self.budget_seconds)
+        best = None
+        rounds = []
+        stop_reason = "maximum rounds"
+        for round in range(1, self.max_rounds + 1):
+            try:
+                candidates = await self.run_round(budget, task, best, round)
+            except BudgetExceeded as error:
+                stop_reason = str(error)
+                break
+            rounds.append(candidates)
+            if on_round is not None:
+                on_round(round, candidates)
+            if not candidates:
+                stop_reason = "no candidate could be evaluated"
+                break
+            round_best = max(candidates, key=lambda candidate: candidate.score)
+            improvement = round_best.score - best.score if best else None
+            if best is None or round_best.score > best.score:
+                best = round_best
+            if best.score >= self.threshold:
+                stop_reason = "score threshold reached"
+                break
+            if improvement is not None and improvement < self.min_improvement:
+                stop_reason = "score stopped improving"
+                break
+            if budget.remaining_seconds <= 0:
+                stop_reason = "latency budget"
+                break
+        return OptimisationResult(best, rounds, stop_reason, budget)
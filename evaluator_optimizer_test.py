@@ -0,0 +1,77 @@
+import asyncio
+import json
+import httpx
+import openai
+from types import SimpleNamespace
+from evaluator_optimizer import EvaluatorOptimizer
+
+
+class FakeCompletions:
+    def __init__(self, scores, tokens=300):
+        self.scores = list(scores)
+        self.tokens = tokens
+        self.calls = 0
+
+    async def create(self, model, messages, max_tokens, temperature, response_format=None):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if not response_format:
+            content = "answer"
+        elif isinstance(self.scores[0], (int, float)):
+            content = json.dumps({"score": self.scores.pop(0), "feedback": "more examples"})
+        else:
+            content = json.dumps(self.scores.pop(0))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                               usage=SimpleNamespace(total_tokens=self.tokens))
+
+
+def optimizer(completions, **config):
+    return EvaluatorOptimizer(SimpleNamespace(chat=SimpleNamespace(completions=completions)), **config)
+
+
+def test_stops_once_threshold_is_reached():
+    completions = FakeCompletions([4, 9])
+    result = asyncio.run(optimizer(completions, candidates_per_round=1, threshold=8).run("task"))
+    assert result.stop_reason == "score threshold reached"
+    assert result.best.score == 9
+    assert len(result.rounds) == 2
+
+
+def test_stops_when_score_plateaus():
+    completions = FakeCompletions([5, 5.2, 5.1])
+    result = asyncio.run(optimizer(completions, candidates_per_round=1, min_improvement=0.5).run("task"))
+    assert result.stop_reason == "score stopped improving"
+    assert result.best.score == 5.2
+
+
+def test_token_budget_is_never_exceeded():
+    completions = FakeCompletions([1] * 20)
+    result = asyncio.run(optimizer(completions, candidates_per_round=3, max_rounds=10, min_improvement=-1,
+                                   max_completion_tokens=200, budget_tokens=2000).run("task"))
+    assert result.stop_reason == "token budget"
+    assert result.tokens_used <= 2000
+
+
+def test_stops_as_soon_as_real_usage_passes_the_budget():
+    # each call reports far more tokens than its prompt estimate reserved
+    completions = FakeCompletions([1] * 20, tokens=1500)
+    result = asyncio.run(optimizer(completions, candidates_per_round=1, max_rounds=10, min_improvement=-1,
+                                   max_completion_tokens=200, budget_tokens=2000).run("task"))
+    assert result.stop_reason == "token budget"
+    # the generation fits, the evaluation pushes usage over, and nothing is called after it
+    assert completions.calls == 2 and result.best is None
+
+
+class FailingCompletions(FakeCompletions):
+    # the first generation call fails at the API
+    async def create(self, model, messages, max_tokens, temperature, response_format=None):
+        if self.calls == 0:
+            self.calls += 1
+            raise openai.APIError("server error", httpx.Request("POST", "https://api.openai.com/v1/chat/completions"), body=None)
+        return await super().create(model, messages, max_tokens, temperature, response_format)
+
+
+def test_a_failed_call_or_malformed_verdict_only_loses_its_candidate():
+    completions = FailingCompletions([["not", "a", "verdict"], 7])
+    result = asyncio.run(optimizer(completions, candidates_per_round=3, max_rounds=1).run("task"))
+    assert [candidate.score for candidate in result.rounds[0]] == [7] and result.best.score == 7
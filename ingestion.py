@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import streamlit as st
+
+
+DEFAULT_REGISTRY_PATH = os.path.join(".cache", "uploaded_files.json")
+
+
+def account_of(client):
+    # uploaded files belong to the API key's account, so only that key may reuse them; the key is kept as a hash
+    return hashlib.sha256((getattr(client, "api_key", None) or "").encode("utf-8")).hexdigest()[:16]
+
+
+class UploadRegistry:
+    # Remembers which file contents each account has already uploaded, by SHA-256 of their
+    # bytes. One instance is shared by every session (see get_upload_registry), so its lock
+    # covers every write to the file.
+    def __init__(self, path=DEFAULT_REGISTRY_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as registry_file:
+                # entries saved before they were kept per account can't be attributed, so they are dropped
+                self.entries = {account: files for account, files in json.load(registry_file).items()
+                                if isinstance(files, dict)}
+
+    def get(self, account, digest):
+        with self.lock:
+            return self.entries.get(account, {}).get(digest)
+
+    def add(self, account, digest, file_id):
+        with self.lock:
+            self.entries.setdefault(account, {})[digest] = file_id
+            self.save()
+
+    def forget(self, account, file_ids):
+        with self.lock:
+            files = self.entries.get(account, {})
+            self.entries[account] = {digest: file_id for digest, file_id in files.items() if file_id not in file_ids}
+            self.save()
+
+    def save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as registry_file:
+            json.dump(self.entries, registry_file)
+
+
+@st.cache_resource(show_spinner=False)
+def get_upload_registry(path=DEFAULT_REGISTRY_PATH):
+    return UploadRegistry(path)
+
+
+class FileIngestion:
+    MAX_PARALLEL_UPLOADS = 6
+    INITIAL_POLL_INTERVAL = 0.5
+    MAX_POLL_INTERVAL = 8.0
+
+    def __init__(self, client, registry=None, on_progress=None, deadline=600.0):
+        self.client = client
+        self.deadline = deadline
+        self.registry = registry or get_upload_registry()
+        self.account = account_of(client)
+        self.on_progress = on_progress or (lambda name, status: None)
+
+    def upload(self, name, content, digest):
+        # runs on a worker thread, so progress is reported by the caller
+        uploaded = self.client.files.create(file=(name, content), purpose="assistants")
+        self.registry.add(self.account, digest, uploaded.id)
+        return uploaded.id
+
+    def upload_all(self, files):
+        # files is a list of (name, bytes); identical contents are only sent once
+        file_ids = []
+        pending = {}
+        for name, content in files:
+            digest = hashlib.sha256(content).hexdigest()
+            file_id = self.registry.get(self.account, digest)
+            if file_id is not None:
+                if file_id not in file_ids:
+                    file_ids.append(file_id)
+                self.on_progress(name, "already uploaded")
+            elif digest in pending:
+                self.on_progress(name, f"duplicate of {pending[digest][0]}")
+            else:
+                pending[digest] = (name, content)
+                self.on_progress(name, "uploading")
+
+        with ThreadPoolExecutor(max_workers=self.MAX_PARALLEL_UPLOADS) as executor:
+            futures = {
+                executor.submit(self.upload, name, content, digest): name
+                for digest, (name, content) in pending.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    file_ids.append(future.result())
+                    self.on_progress(futures[future], "uploaded")
+                except Exception as error:
+                    self.on_progress(futures[future], f"failed: {error}")
+        return file_ids
+
+    def wait_for_batch(self, vector_store_id, batch):
+        interval = self.INITIAL_POLL_INTERVAL
+        started = time.monotonic()
+        while batch.status == "in_progress":
+            remaining = self.deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                # stop indexing rather than leave the batch running unwatched
+                self.on_progress("vector store", f"timed out after {self.deadline:.0f}s, cancelling")
+                return self.client.vector_stores.file_batches.cancel(batch_id=batch.id, vector_store_id=vector_store_id)
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, self.MAX_POLL_INTERVAL)
+            batch = self.client.vector_stores.file_batches.retrieve(batch_id=batch.id, vector_store_id=vector_store_id)
+        return batch
+
+    def ingest(self, files, vector_store_id):
+        file_ids = self.upload_all(files)
+        if not file_ids:
+            return None
+        self.on_progress("vector store", f"indexing {len(file_ids)} file(s)")
+        batch = self.client.vector_stores.file_batches.create(vector_store_id=vector_store_id, file_ids=file_ids)
+        batch = self.wait_for_batch(vector_store_id, batch)
+        counts = batch.file_counts
+        self.on_progress("vector store", f"{batch.status}: {counts.completed} indexed, {counts.failed} failed")
+        if counts.failed:
+            # a registered file that failed to index may have been deleted remotely; upload it again next time
+            failed = self.client.vector_stores.file_batches.list_files(
+                batch_id=batch.id, vector_store_id=vector_store_id, filter="failed"
+            )
+            self.registry.forget(self.account, {vector_store_file.id for vector_store_file in failed})
+        return batch
+
+    def attach(self, assistant_id, vector_store_id):
+        return self.client.beta.assistants.update(
+            assistant_id=assistant_id,
+            tools=[{"type": "file_search"}],
+            tool_resources={"file_search": {"vector_store_ids": [vector_store_id]}},
+        )
@@ -0,0 +1,117 @@
+import hashlib
+import threading
+import time
+from types import SimpleNamespace
+from ingestion import FileIngestion, UploadRegistry, account_of
+
+
+class FakeFiles:
+    def __init__(self, fail=(), delay=0.0):
+        self.fail = set(fail)
+        self.delay = delay
+        self.uploaded = []
+        self.in_flight = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def create(self, file, purpose):
+        name, content = file
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if name in self.fail:
+                raise RuntimeError("upload rejected")
+            with self.lock:
+                self.uploaded.append(name)
+                return SimpleNamespace(id=f"file_{name}")
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class FakeFileBatches:
+    def __init__(self, statuses, failed=()):
+        self.statuses = list(statuses)
+        self.failed = list(failed)
+        self.cancelled = False
+
+    def batch(self, status):
+        return SimpleNamespace(id="vsfb_1", status=status,
+                               file_counts=SimpleNamespace(completed=2, failed=len(self.failed)))
+
+    def create(self, vector_store_id, file_ids):
+        self.file_ids = file_ids
+        return self.next_batch()
+
+    def retrieve(self, batch_id, vector_store_id):
+        return self.next_batch()
+
+    def next_batch(self):
+        # the last status repeats for as long as it is asked for
+        return self.batch(self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0])
+
+    def cancel(self, batch_id, vector_store_id):
+        self.cancelled = True
+        return self.batch("cancelling")
+
+    def list_files(self, batch_id, vector_store_id, filter):
+        return [SimpleNamespace(id=file_id) for file_id in self.failed]
+
+
+def ingestion(tmp_path, files, batches=None, deadline=5.0, api_key="sk-one", registry=None):
+    client = SimpleNamespace(api_key=api_key, files=files, vector_stores=SimpleNamespace(file_batches=batches))
+    progress = {}
+    ingestion = FileIngestion(client, registry or UploadRegistry(str(tmp_path / "registry.json")),
+                              lambda name, status: progress.__setitem__(name, status), deadline)
+    ingestion.INITIAL_POLL_INTERVAL = 0.001
+    return ingestion, progress
+
+
+def test_identical_contents_upload_once(tmp_path):
+    files = FakeFiles()
+    uploader, progress = ingestion(tmp_path, files)
+    assert uploader.upload_all([("a.pdf", b"notes"), ("b.pdf", b"notes")]) == ["file_a.pdf"]
+    assert progress["b.pdf"] == "duplicate of a.pdf"
+
+    # a later upload finds the contents in the saved registry
+    uploader, progress = ingestion(tmp_path, files)
+    assert uploader.upload_all([("c.pdf", b"notes")]) == ["file_a.pdf"]
+    assert files.uploaded == ["a.pdf"] and progress["c.pdf"] == "already uploaded"
+
+
+def test_uploads_are_only_reused_by_the_key_that_made_them(tmp_path):
+    files = FakeFiles()
+    registry = UploadRegistry(str(tmp_path / "registry.json"))
+    ingestion(tmp_path, files, registry=registry)[0].upload_all([("a.pdf", b"notes")])
+    # another user's key can't see that file, so it uploads its own copy
+    uploader, progress = ingestion(tmp_path, files, api_key="sk-two", registry=registry)
+    uploader.upload_all([("a.pdf", b"notes")])
+    assert files.uploaded == ["a.pdf", "a.pdf"] and progress["a.pdf"] != "already uploaded"
+    assert len(registry.entries) == 2 and "sk-one" not in str(registry.entries)
+    assert UploadRegistry(registry.path).get(account_of(uploader.client), hashlib.sha256(b"notes").hexdigest())
+
+
+def test_uploads_in_parallel_and_reports_failures(tmp_path):
+    files = FakeFiles(fail={"bad.pdf"}, delay=0.05)
+    uploader, progress = ingestion(tmp_path, files)
+    contents = [(f"{number}.pdf", str(number).encode()) for number in range(6)] + [("bad.pdf", b"bad")]
+    file_ids = uploader.upload_all(contents)
+    assert len(file_ids) == 6 and files.peak > 1
+    assert progress["bad.pdf"].startswith("failed")
+
+
+def test_forgets_files_that_failed_to_index(tmp_path):
+    batches = FakeFileBatches(["in_progress", "in_progress", "completed"], failed=["file_b.pdf"])
+    uploader, progress = ingestion(tmp_path, FakeFiles(), batches)
+    batch = uploader.ingest([("a.pdf", b"a"), ("b.pdf", b"b")], "vs_1")
+    assert batch.status == "completed"
+    assert list(uploader.registry.entries[uploader.account].values()) == ["file_a.pdf"]
+
+
+def test_cancels_a_batch_that_misses_the_deadline(tmp_path):
+    batches = FakeFileBatches(["in_progress"])
+    uploader, progress = ingestion(tmp_path, FakeFiles(), batches, deadline=0.05)
+    batch = uploader.ingest([("a.pdf", b"a")], "vs_1")
+    assert batches.cancelled and batch.status == "cancelling"
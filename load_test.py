@@ -0,0 +1,266 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import threading
+import time
+import streamlit
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from benchmark import PAGES, QUESTIONS, answer, cold_caches, git_commit, start_session
+from assistant import AssistantSettingsForm
+from mock_openai import MockConfig, MockOpenAIServer
+
+
+DEFAULT_LEVELS = [1, 2, 4, 8, 16]
+SAMPLE_INTERVAL = 0.1
+# concurrent_app_tests patches private AppTest internals, checked against this release only;
+# requirements-dev.txt pins it for that reason, and the app itself takes any supported release
+PATCHED_STREAMLIT = "1.66.0"
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 4)
+
+
+def rss_bytes():
+    # current resident memory where /proc exists, otherwise the peak getrusage reports
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def open_sockets():
+    try:
+        descriptors = os.listdir("/proc/self/fd")
+    except OSError:
+        return None
+    sockets = 0
+    for descriptor in descriptors:
+        try:
+            sockets += os.readlink(f"/proc/self/fd/{descriptor}").startswith("socket:")
+        except OSError:
+            pass
+    return sockets
+
+
+@contextmanager
+def concurrent_app_tests():
+    # AppTest expects one script run at a time. It installs a stand-in Runtime for each run
+    # and removes it when the run ends, which pulls it out from under every other session's
+    # run, so keep the most recent stand-in in place instead. It also compiles the script on
+    # every run, and Python 3.11's parser is not safe to call from several threads at once.
+    # Without these patches, sessions fail at random with "Runtime hasn't been created!".
+    if streamlit.__version__ != PATCHED_STREAMLIT:
+        raise RuntimeError(f"load_test patches Streamlit {PATCHED_STREAMLIT} internals, "
+                           f"but Streamlit {streamlit.__version__} is installed")
+    installed = []
+    compiling = threading.Lock()
+    instance, exists = Runtime.__dict__["instance"], Runtime.__dict__["exists"]
+    get_bytecode = ScriptCache.get_bytecode
+
+    def current(cls):
+        if cls._instance is not None:
+            installed[:] = [cls._instance]
+        return cls._instance or (installed[0] if installed else None)
+
+    def compile_one_at_a_time(self, script_path):
+        with compiling:
+            return get_bytecode(self, script_path)
+
+    Runtime.instance = classmethod(lambda cls: current(cls) or instance.__func__(cls))
+    Runtime.exists = classmethod(lambda cls: current(cls) is not None)
+    ScriptCache.get_bytecode = compile_one_at_a_time
+    try:
+        yield
+    finally:
+        Runtime.instance, Runtime.exists = instance, exists
+        ScriptCache.get_bytecode = get_bytecode
+
+
+def serve_mock(config, urls):
+    # runs in its own process so its threads, memory and sockets stay out of the measurements
+    server = MockOpenAIServer(config)
+    server.state.add_assistant(AssistantSettingsForm.DEFAULT_ASSISTANT_ID)
+    urls.put(server.base_url)
+    server.server.serve_forever()
+
+
+class Sampler:
+    # Samples sockets and busy script threads in the background while a stage runs.
+    def __init__(self):
+        self.busy = 0
+        self.lock = threading.Lock()
+        self.samples = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def enter(self):
+        with self.lock:
+            self.busy += 1
+
+    def leave(self):
+        with self.lock:
+            self.busy -= 1
+
+    def sample(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            self.samples.append((self.busy, open_sockets()))
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        busy = [sample[0] for sample in self.samples] or [0]
+        sockets = [sample[1] for sample in self.samples if sample[1] is not None]
+        return {
+            "busy script threads": round(statistics.mean(busy), 2),
+            "peak busy script threads": max(busy),
+            "sockets": round(statistics.mean(sockets), 1) if sockets else None,
+            "peak sockets": max(sockets) if sockets else None,
+        }
+
+
+def simulate_session(number, level, page, base_url, turns, sampler, results):
+    at = start_session(PAGES[page], base_url)
+    for turn in range(turns):
+        if not at.chat_input:
+            # the page failed to render, so this session cannot ask anything more
+            results.extend({"page": page, "latency": None, "busy": 0, "failed": True} for _ in range(turns - turn))
+            break
+        # a distinct question each turn so the response cache cannot answer for the mock
+        question = f"{QUESTIONS[turn % len(QUESTIONS)]} (session {number}, level {level}, turn {turn})"
+        sampler.enter()
+        try:
+            latency, busy = answer(at, question)
+        finally:
+            sampler.leave()
+        results.append({"page": page, "latency": latency, "busy": busy, "failed": bool(at.exception)})
+    return at
+
+
+def run_stage(level, pages, base_url, turns):
+    gc.collect()
+    memory_before = rss_bytes()
+    sockets_before = open_sockets()
+    sampler = Sampler()
+    results = []
+    sessions = []
+
+    def session(number):
+        sessions.append(simulate_session(number, level, pages[number % len(pages)], base_url, turns, sampler, results))
+
+    threads = [threading.Thread(target=session, args=(number,)) for number in range(level)]
+    started = time.monotonic()
+    sampler.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    usage = sampler.stop()
+    # sessions are still alive here, so the growth is what holding them costs
+    gc.collect()
+    memory_after = rss_bytes()
+    latencies = [result["latency"] for result in results if not result["failed"]]
+    busy = sum(result["busy"] for result in results)
+    return {
+        "sessions": level,
+        "turns": len(results),
+        "failed turns": sum(1 for result in results if result["failed"]),
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 3),
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "script thread occupancy": round(busy / elapsed, 3),
+        **usage,
+        "sockets before": sockets_before,
+        "memory per session": round(max(0, memory_after - memory_before) / level),
+    }
+
+
+def saturation(stages):
+    # the level after which adding sessions stopped adding throughput
+    best = max(stages, key=lambda stage: stage["throughput"])
+    return {"peak throughput": best["throughput"], "at sessions": best["sessions"]}
+
+
+def run_load_test(config, levels=DEFAULT_LEVELS, pages=None, turns=2):
+    pages = pages or list(PAGES)
+    urls = multiprocessing.Queue()
+    mock = multiprocessing.Process(target=serve_mock, args=(config, urls), daemon=True)
+    mock.start()
+    try:
+        base_url = urls.get(timeout=30)
+        with cold_caches(), concurrent_app_tests():
+            # one turn per page first, so imports and shared clients are not billed to the first stage
+            run_stage(len(pages), pages, base_url, 1)
+            stages = [run_stage(level, pages, base_url, turns) for level in levels]
+    finally:
+        mock.terminate()
+        mock.join()
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "mock": {"latency": config.latency, "jitter": config.jitter, "tokens per second": config.tokens_per_second,
+                 "error rate": config.error_rate},
+        "pages": pages,
+        "turns per session": turns,
+        "stages": stages,
+        "saturation": saturation(stages),
+    }
+
+
+def print_curve(results, baseline=None):
+    columns = ["sessions", "throughput", "p50", "p95", "p99", "script thread occupancy", "peak sockets", "memory per session"]
+    before = {stage["sessions"]: stage for stage in (baseline or {}).get("stages", [])}
+    print("  ".join(f"{column:>12.12}" for column in columns))
+    for stage in results["stages"]:
+        cells = [f"{stage[column]:>12g}" if stage[column] is not None else f"{'-':>12}" for column in columns]
+        if stage["sessions"] in before:
+            cells.append(f"(was {before[stage['sessions']]['throughput']:g} turns/s)")
+        print("  ".join(cells))
+    print(f"Throughput peaks at {results['saturation']['peak throughput']:g} turns/s "
+          f"with {results['saturation']['at sessions']} sessions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ramp concurrent sessions against the mock OpenAI API.")
+    parser.add_argument("--levels", default=",".join(map(str, DEFAULT_LEVELS)), help="comma-separated session counts")
+    parser.add_argument("--page", action="append", choices=list(PAGES), help="pages to spread sessions over (default: all)")
+    parser.add_argument("--turns", type=int, default=2, help="questions each session asks")
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output", default="load_test_results.json")
+    parser.add_argument("--baseline", help="earlier results to compare the curve against")
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency, args.jitter, args.tokens_per_second, error_rate=args.error_rate)
+    levels = [int(level) for level in args.levels.split(",")]
+    results = run_load_test(config, levels, args.page, args.turns)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    print_curve(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
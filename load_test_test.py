@@ -0,0 +1,16 @@
+import pytest
+import streamlit
+from load_test import PATCHED_STREAMLIT, run_load_test
+from mock_openai import MockConfig
+
+
+@pytest.mark.skipif(streamlit.__version__ != PATCHED_STREAMLIT,
+                    reason=f"the load test's AppTest patches target Streamlit {PATCHED_STREAMLIT}")
+def test_ramps_sessions_and_reports_the_curve():
+    results = run_load_test(MockConfig(latency=0, tokens_per_second=0), levels=[1, 3], pages=["Routing"], turns=2)
+    assert [stage["sessions"] for stage in results["stages"]] == [1, 3]
+    for stage in results["stages"]:
+        assert stage["turns"] == stage["sessions"] * 2 and stage["failed turns"] == 0
+        assert stage["throughput"] > 0 and stage["p50"] <= stage["p95"] <= stage["p99"]
+        assert stage["script thread occupancy"] > 0
+    assert results["saturation"]["at sessions"] in (1, 3)
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import numpy as np
+import streamlit as st
+from document_parsing import parse_uploads
+from semantic_cache import EMBEDDING_MODEL
+
+
+DEFAULT_DIRECTORY = os.path.join(".cache", "local_index")
+EMBEDDING_BATCH_SIZE = 64
+
+
+def embed_texts(client, texts, model=EMBEDDING_MODEL):
+    response = client.embeddings.create(model=model, input=texts)
+    vectors = np.asarray([item.embedding for item in response.data], dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def quantise(vectors):
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12).astype(np.float32)
+    return np.round(vectors / scales[:, None] * 127).astype(np.int8), scales
+
+
+def kmeans(vectors, clusters, iterations=10, seed=0):
+    generator = np.random.default_rng(seed)
+    centroids = vectors[generator.choice(len(vectors), clusters, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(clusters):
+            members = vectors[assignments == cluster]
+            if len(members):
+                centroid = members.mean(axis=0)
+                centroids[cluster] = centroid / max(np.linalg.norm(centroid), 1e-12)
+    return centroids
+
+
+class LocalIndex:
+    # Append-only on-disk index: vectors in a raw float32 (or int8 plus per-row scale) file
+    # that is memory-mapped read-only for search, chunk text in a JSONL sidecar, and an
+    # optional IVF partition (centroids plus one partition id per row) for large corpora.
+    IVF_MIN_VECTORS = 20000
+    SCORE_BLOCK = 65536
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, dimensions=1536, quantised=False):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.metadata_path = os.path.join(directory, "chunks.jsonl")
+        self.lock = threading.Lock()
+        self.manifest = {"dimensions": dimensions, "quantised": quantised, "count": 0, "clusters": 0}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as manifest_file:
+                self.manifest = json.load(manifest_file)
+        self.matrix = None
+        self.scales = None
+        self.centroids = None
+        self.partitions = None
+        self.offsets = None
+
+    @property
+    def count(self):
+        return self.manifest["count"]
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def save_manifest(self):
+        with open(self.manifest_path, "w") as manifest_file:
+            json.dump(self.manifest, manifest_file)
+
+    def load(self):
+        # maps the files lazily; nothing is read into RAM until rows are touched
+        if self.matrix is not None or not self.count:
+            return
+        dimensions = self.manifest["dimensions"]
+        if self.manifest["quantised"]:
+            self.matrix = np.memmap(self.path("vectors.i8"), dtype=np.int8, mode="r", shape=(self.count, dimensions))
+            self.scales = np.memmap(self.path("scales.f32"), dtype=np.float32, mode="r", shape=(self.count,))
+        else:
+            self.matrix = np.memmap(self.path("vectors.f32"), dtype=np.float32, mode="r", shape=(self.count, dimensions))
+        if self.manifest["clusters"]:
+            self.centroids = np.load(self.path("centroids.npy"))
+            self.partitions = np.memmap(self.path("partitions.i32"), dtype=np.int32, mode="r", shape=(self.count,))
+        self.offsets = []
+        with open(self.metadata_path, "rb") as metadata_file:
+            offset = 0
+            for line in metadata_file:
+                self.offsets.append(offset)
+                offset += len(line)
+
+    def unload(self):
+        self.matrix = self.scales = self.centroids = self.partitions = self.offsets = None
+
+    def add(self, chunks, vectors):
+        # chunks is a list of {"text", "source"} dicts matching the rows of vectors
+        with self.lock:
+            self.unload()
+            if self.manifest["quantised"]:
+                quantised, scales = quantise(vectors)
+                with open(self.path("vectors.i8"), "ab") as vector_file:
+                    vector_file.write(quantised.tobytes())
+                with open(self.path("scales.f32"), "ab") as scale_file:
+                    scale_file.write(scales.tobytes())
+            else:
+                with open(self.path("vectors.f32"), "ab") as vector_file:
+                    vector_file.write(vectors.astype(np.float32).tobytes())
+            with open(self.metadata_path, "a") as metadata_file:
+                for chunk in chunks:
+                    metadata_file.write(json.dumps(chunk) + "\n")
+            self.manifest["count"] += len(chunks)
+            if self.manifest["clusters"]:
+                self.assign_partitions(vectors)
+            self.save_manifest()
+        if self.manifest["clusters"] == 0 and self.count >= self.IVF_MIN_VECTORS:
+            self.build_partitions()
+
+    def assign_partitions(self, vectors):
+        centroids = np.load(self.path("centroids.npy"))
+        assignments = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+        with open(self.path("partitions.i32"), "ab") as partition_file:
+            partition_file.write(assignments.tobytes())
+
+    def build_partitions(self, clusters=None, sample_size=20000):
+        with self.lock:
+            self.unload()
+            self.manifest["clusters"] = 0
+            self.load()
+            sample = np.random.default_rng(0).choice(self.count, min(sample_size, self.count), replace=False)
+            clusters = min(clusters or max(1, int(np.sqrt(self.count))), len(sample))
+            centroids = kmeans(self.dequantise(np.sort(sample)), clusters)
+            np.save(self.path("centroids.npy"), centroids)
+            with open(self.path("partitions.i32"), "wb") as partition_file:
+                for start in range(0, self.count, 8192):
+                    rows = self.dequantise(np.arange(start, min(start + 8192, self.count)))
+                    partition_file.write(np.argmax(rows @ centroids.T, axis=1).astype(np.int32).tobytes())
+            self.manifest["clusters"] = clusters
+            self.save_manifest()
+            self.unload()
+
+    def dequantise(self, rows):
+        if self.scales is None:
+            return self.matrix[rows]
+        return self.matrix[rows].astype(np.float32) * (self.scales[rows] / 127)[:, None]
+
+    def scores(self, query, rows=None):
+        if rows is not None:
+            return self.dequantise(rows) @ query
+        # score the full matrix a block at a time so int8 rows are never all widened at once
+        return np.concatenate([
+            self.dequantise(slice(start, start + self.SCORE_BLOCK)) @ query
+            for start in range(0, self.count, self.SCORE_BLOCK)
+        ])
+
+    def search(self, query, k=4, probes=4):
+        with self.lock:
+            self.load()
+            if not self.count:
+                return []
+            rows = None
+            if self.centroids is not None:
+                nearest = np.argsort(self.centroids @ query)[::-1][:probes]
+                rows = np.flatnonzero(np.isin(self.partitions, nearest))
+                if not len(rows):
+                    rows = None
+            scores = self.scores(query, rows)
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            results = []
+            with open(self.metadata_path, "rb") as metadata_file:
+                for position in top:
+                    row = int(position if rows is None else rows[position])
+                    metadata_file.seek(self.offsets[row])
+                    chunk = json.loads(metadata_file.readline())
+                    chunk["score"] = float(scores[position])
+                    results.append(chunk)
+            return results
+
+    def clear(self):
+        with self.lock:
+            self.unload()
+            for name in os.listdir(self.directory):
+                os.remove(self.path(name))
+            self.manifest = {**self.manifest, "count": 0, "clusters": 0}
+
+
+class LocalRetriever:
+    def __init__(self, client, index, k=4):
+        self.client = client
+        self.index = index
+        self.k = k
+
+    def ingest(self, files, on_progress=None):
+        # files is a list of (name, bytes); chunks are embedded batch by batch as parsing yields them
+        count = 0
+        batch = []
+        for chunk in parse_uploads(files, on_progress=on_progress):
+            batch.append(chunk)
+            if len(batch) == EMBEDDING_BATCH_SIZE:
+                count += self.add(batch)
+                batch = []
+        if batch:
+            count += self.add(batch)
+        return count
+
+    def add(self, chunks):
+        self.index.add(chunks, embed_texts(self.client, [chunk["text"] for chunk in chunks]))
+        return len(chunks)
+
+    def retrieve(self, query):
+        query_vector = embed_texts(self.client, [query])[0]
+        return self.index.search(query_vector, self.k)
+
+    def context(self, query):
+        results = self.retrieve(query)
+        if not results:
+            return None
+        passages = "\n\n".join(
+            f"[{result['source']}, page {result.get('page', 1)}]\n{result['text']}" for result in results
+        )
+        return f"Use these course material excerpts when they are relevant:\n\n{passages}"
+
+
+def index_directory(api_key, assistant_id):
+    # One index per API key and assistant, so excerpts from one user's uploads never reach
+    # another's prompts and clearing an index leaves everyone else's alone. The key is only
+    # used as a hash.
+    account = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+    return os.path.join(DEFAULT_DIRECTORY, account, re.sub(r"[^\w-]", "_", assistant_id or "default"))
+
+
+@st.cache_resource
+def get_local_index(directory=DEFAULT_DIRECTORY):
+    return LocalIndex(directory)
+
+
+def get_local_index_for(client, assistant_id):
+    return get_local_index(index_directory(client.api_key, assistant_id))
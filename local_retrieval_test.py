@@ -0,0 +1,55 @@
+import numpy as np
+from local_retrieval import LocalIndex, index_directory
+
+
+def unit_vectors(count, dimensions=16, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def chunks(count, offset=0):
+    return [{"text": f"chunk {offset + row}", "source": "notes.md"} for row in range(count)]
+
+
+def test_search_persists_across_reopen(tmp_path):
+    vectors = unit_vectors(50)
+    index = LocalIndex(str(tmp_path), dimensions=16)
+    index.add(chunks(30), vectors[:30])
+    index.add(chunks(20, offset=30), vectors[30:])
+
+    reopened = LocalIndex(str(tmp_path))
+    results = reopened.search(vectors[42], k=3)
+    assert reopened.count == 50
+    assert results[0]["text"] == "chunk 42"
+    assert results[0]["score"] > results[1]["score"] >= results[2]["score"]
+    assert isinstance(reopened.matrix, np.memmap)
+
+
+def test_quantised_and_partitioned_search(tmp_path):
+    vectors = unit_vectors(400)
+    index = LocalIndex(str(tmp_path), dimensions=16, quantised=True)
+    index.add(chunks(400), vectors)
+    assert index.search(vectors[7], k=1)[0]["text"] == "chunk 7"
+
+    index.build_partitions(clusters=8)
+    index.add(chunks(1, offset=400), unit_vectors(1, seed=1))
+    assert index.manifest["clusters"] == 8
+    assert index.search(vectors[123], k=1, probes=2)[0]["text"] == "chunk 123"
+    assert index.search(unit_vectors(1, seed=1)[0], k=1)[0]["text"] == "chunk 400"
+
+    index.clear()
+    assert index.search(vectors[0]) == []
+
+
+
+def test_each_key_and_assistant_has_its_own_index(tmp_path):
+    directories = {index_directory(key, assistant) for key in ("sk-one", "sk-two") for assistant in ("asst_1", "asst_2")}
+    assert len(directories) == 4 and not any("sk-" in directory for directory in directories)
+    assert index_directory("sk-one", "../asst") != index_directory("sk-one", "asst")
+    assert ".." not in index_directory("sk-one", "../asst")
+
+    mine, theirs = (LocalIndex(str(tmp_path / index_directory(key, "asst_1")), dimensions=16) for key in ("sk-one", "sk-two"))
+    mine.add(chunks(5), unit_vectors(5))
+    theirs.add(chunks(5), unit_vectors(5, seed=1))
+    mine.clear()
+    assert mine.count == 0 and theirs.count == 5
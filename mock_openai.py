@@ -0,0 +1,486 @@
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+
+
+JSON_REPLY = json.dumps({
+    # one reply that satisfies every pattern asking for JSON: the orchestrator's plan and the evaluator's verdict
+    "subtasks": [
+        {"id": "s1", "description": "Explain the core idea", "depends_on": []},
+        {"id": "s2", "description": "Work through an example", "depends_on": ["s1"]},
+    ],
+    "score": 8,
+    "feedback": "Clear and correct.",
+})
+EMBEDDING_DIMENSIONS = 1536
+
+
+class MockConfig:
+    # latency is the median time before a response starts, spread log-normally by jitter;
+    # streamed and generated replies then take reply_tokens / tokens_per_second longer.
+    def __init__(self, latency=0.05, jitter=0.3, tokens_per_second=400.0, reply_tokens=60,
+                 error_rate=0.0, error_status=500, run_poll_after_ms=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.run_poll_after_ms = run_poll_after_ms
+        self.random = random.Random(seed)
+
+    def sample_latency(self):
+        return self.latency * self.random.lognormvariate(0, self.jitter) if self.latency else 0.0
+
+    def token_delay(self):
+        return 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def inject_error(self):
+        return self.error_rate and self.random.random() < self.error_rate
+
+
+def reply_for(messages, json_mode, reply_tokens):
+    if json_mode:
+        return JSON_REPLY
+    question = next((str(message.get("content")) for message in reversed(messages) if message.get("role") == "user"), "")
+    words = ["Mock", "answer", "about:"] + question.split()[:12]
+    filler = itertools.cycle("this is a placeholder sentence from the local mock server .".split())
+    while len(words) < reply_tokens:
+        words.append(next(filler))
+    return " ".join(words)
+
+
+def tokens_of(text):
+    return re.findall(r"\S+\s*", text)
+
+
+def embedding_for(text):
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], "little")
+    vector = np.random.default_rng(seed).normal(size=EMBEDDING_DIMENSIONS)
+    return (vector / np.linalg.norm(vector)).round(6).tolist()
+
+
+def page(items, query):
+    # cursor pagination as the API does it: order, after and limit
+    order = query.get("order", ["desc"])[0]
+    limit = int(query.get("limit", ["20"])[0])
+    items = sorted(items, key=lambda item: (item["created_at"], item["id"]), reverse=order == "desc")
+    after = query.get("after", [None])[0]
+    if after:
+        ids = [item["id"] for item in items]
+        items = items[ids.index(after) + 1:] if after in ids else []
+    data = items[:limit]
+    return {"object": "list", "data": data, "first_id": data[0]["id"] if data else None,
+            "last_id": data[-1]["id"] if data else None, "has_more": len(items) > limit}
+
+
+class MockState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counter = itertools.count(1)
+        self.assistants = {}
+        self.threads = {}
+        self.runs = {}
+        self.files = {}
+        self.vector_stores = {}
+        self.batches = {}
+        self.requests = []
+
+    def new_id(self, prefix):
+        return f"{prefix}_{next(self.counter):06d}"
+
+    def add_assistant(self, assistant_id=None, name="Mock tutor", instructions="You are a tutor.", model="gpt-4o-mini"):
+        assistant = {"id": assistant_id or self.new_id("asst"), "object": "assistant", "created_at": int(time.time()),
+                     "name": name, "description": None, "instructions": instructions, "model": model, "tools": [],
+                     "tool_resources": {}, "metadata": {}, "temperature": 1.0, "top_p": 1.0, "response_format": "auto"}
+        self.assistants[assistant["id"]] = assistant
+        return assistant
+
+    def add_message(self, thread_id, role, text, run_id=None, assistant_id=None):
+        message = {"id": self.new_id("msg"), "object": "thread.message", "created_at": int(time.time()),
+                   "thread_id": thread_id, "role": role, "status": "completed", "run_id": run_id,
+                   "assistant_id": assistant_id, "attachments": [], "metadata": {},
+                   "content": [{"type": "text", "text": {"value": text, "annotations": []}}]}
+        self.threads[thread_id]["messages"].append(message)
+        return message
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    ROUTES = [
+        ("POST", r"/v1/chat/completions", "chat_completions"),
+        ("POST", r"/v1/embeddings", "embeddings"),
+        ("GET", r"/v1/assistants", "list_assistants"),
+        ("POST", r"/v1/assistants", "create_assistant"),
+        ("GET", r"/v1/assistants/(?P<assistant_id>[^/]+)", "retrieve_assistant"),
+        ("POST", r"/v1/assistants/(?P<assistant_id>[^/]+)", "update_assistant"),
+        ("DELETE", r"/v1/assistants/(?P<assistant_id>[^/]+)", "delete_assistant"),
+        ("POST", r"/v1/threads", "create_thread"),
+        ("GET", r"/v1/threads/(?P<thread_id>[^/]+)/messages", "list_messages"),
+        ("POST", r"/v1/threads/(?P<thread_id>[^/]+)/messages", "create_message"),
+        ("POST", r"/v1/threads/(?P<thread_id>[^/]+)/runs", "create_run"),
+        ("GET", r"/v1/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)", "retrieve_run"),
+        ("POST", r"/v1/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)/cancel", "cancel_run"),
+        ("POST", r"/v1/files", "create_file"),
+        ("POST", r"/v1/vector_stores", "create_vector_store"),
+        ("POST", r"/v1/vector_stores/(?P<store_id>[^/]+)/file_batches", "create_file_batch"),
+        ("GET", r"/v1/vector_stores/(?P<store_id>[^/]+)/file_batches/(?P<batch_id>[^/]+)", "retrieve_file_batch"),
+        ("GET", r"/v1/vector_stores/(?P<store_id>[^/]+)/file_batches/(?P<batch_id>[^/]+)/files", "list_batch_files"),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        url = urlparse(self.path)
+        self.query = parse_qs(url.query)
+        length = int(self.headers.get("content-length") or 0)
+        self.raw_body = self.rfile.read(length) if length else b""
+        is_json = "json" in (self.headers.get("content-type") or "")
+        self.body = json.loads(self.raw_body) if is_json and self.raw_body else {}
+        self.record = {"method": method, "path": url.path, "started": time.monotonic(), "first_token": None,
+                       "finished": None, "status": None, "stream": bool(self.body.get("stream"))}
+        with self.state.lock:
+            self.state.requests.append(self.record)
+        try:
+            for route_method, pattern, name in self.ROUTES:
+                match = re.fullmatch(pattern, url.path)
+                if match and route_method == method:
+                    time.sleep(self.config.sample_latency())
+                    if self.config.inject_error():
+                        return self.send_error_json(self.config.error_status, "Injected error")
+                    return getattr(self, name)(**match.groupdict())
+            self.send_error_json(404, f"No mock for {method} {url.path}")
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up on the request, as cancelled speculative calls do
+            self.record["disconnected"] = True
+            self.close_connection = True
+        finally:
+            self.record["finished"] = time.monotonic()
+
+    def send_headers(self, status, content_type, extra=None):
+        self.record["status"] = status
+        self.send_response(status)
+        self.send_header("content-type", content_type)
+        self.send_header("x-ratelimit-limit-requests", "10000")
+        self.send_header("x-ratelimit-remaining-requests", "9999")
+        self.send_header("x-ratelimit-limit-tokens", "2000000")
+        self.send_header("x-ratelimit-remaining-tokens", "1999000")
+        for name, value in (extra or {}).items():
+            self.send_header(name, value)
+
+    def send_json(self, payload, status=200, extra=None):
+        data = json.dumps(payload).encode()
+        self.send_headers(status, "application/json", extra)
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status, message):
+        extra = {"retry-after-ms": "50"} if status == 429 else None
+        self.send_json({"error": {"message": message, "type": "mock_error", "code": None}}, status, extra)
+
+    def start_stream(self):
+        self.send_headers(200, "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+
+    def send_event(self, data, event=None):
+        text = (f"event: {event}\n" if event else "") + f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n"
+        chunk = text.encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.flush()
+
+    def end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def stream_tokens(self, text):
+        for token in tokens_of(text):
+            time.sleep(self.config.token_delay())
+            if self.record["first_token"] is None:
+                self.record["first_token"] = time.monotonic()
+            yield token
+
+    # chat completions and embeddings
+
+    def chat_completions(self):
+        model = self.body.get("model", "gpt-4o-mini")
+        json_mode = (self.body.get("response_format") or {}).get("type") == "json_object"
+        text = reply_for(self.body.get("messages", []), json_mode, self.body.get("max_tokens") or self.config.reply_tokens)
+        completion_id = self.state.new_id("chatcmpl")
+        created = int(time.time())
+        usage = {"prompt_tokens": len(json.dumps(self.body.get("messages", []))) // 4,
+                 "completion_tokens": len(tokens_of(text))}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if not self.body.get("stream"):
+            time.sleep(len(tokens_of(text)) * self.config.token_delay())
+            self.record["first_token"] = time.monotonic()
+            return self.send_json({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop", "logprobs": None,
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": usage,
+            })
+        self.start_stream()
+        chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model}
+        for token in self.stream_tokens(text):
+            self.send_event({**chunk, "choices": [{"index": 0, "delta": {"role": "assistant", "content": token},
+                                                   "finish_reason": None}]})
+        self.send_event({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self.send_event("[DONE]")
+        self.end_stream()
+
+    def embeddings(self):
+        inputs = self.body.get("input")
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        self.send_json({
+            "object": "list", "model": self.body.get("model"),
+            "data": [{"object": "embedding", "index": index, "embedding": embedding_for(text)}
+                     for index, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": sum(len(text) // 4 for text in inputs), "total_tokens": 0},
+        })
+
+    # assistants, threads and runs
+
+    def list_assistants(self):
+        with self.state.lock:
+            self.send_json(page(list(self.state.assistants.values()), self.query))
+
+    def create_assistant(self):
+        with self.state.lock:
+            assistant = self.state.add_assistant(None, self.body.get("name"), self.body.get("instructions"),
+                                                 self.body.get("model", "gpt-4o-mini"))
+        self.send_json(assistant)
+
+    def retrieve_assistant(self, assistant_id):
+        if assistant_id not in self.state.assistants:
+            return self.send_error_json(404, f"No assistant found with id '{assistant_id}'.")
+        self.send_json(self.state.assistants[assistant_id])
+
+    def update_assistant(self, assistant_id):
+        with self.state.lock:
+            self.state.assistants[assistant_id].update(self.body)
+        self.send_json(self.state.assistants[assistant_id])
+
+    def delete_assistant(self, assistant_id):
+        with self.state.lock:
+            self.state.assistants.pop(assistant_id, None)
+        self.send_json({"id": assistant_id, "object": "assistant.deleted", "deleted": True})
+
+    def create_thread(self):
+        thread = {"id": self.state.new_id("thread"), "object": "thread", "created_at": int(time.time()),
+                  "metadata": {}, "tool_resources": {}}
+        with self.state.lock:
+            self.state.threads[thread["id"]] = {"thread": thread, "messages": []}
+        self.send_json(thread)
+
+    def create_message(self, thread_id):
+        content = self.body.get("content")
+        with self.state.lock:
+            message = self.state.add_message(thread_id, self.body.get("role", "user"),
+                                             content if isinstance(content, str) else json.dumps(content))
+        self.send_json(message)
+
+    def list_messages(self, thread_id):
+        with self.state.lock:
+            messages = self.state.threads[thread_id]["messages"]
+            run_id = self.query.get("run_id", [None])[0]
+            if run_id:
+                messages = [message for message in messages if message["run_id"] == run_id]
+            self.send_json(page(messages, self.query))
+
+    def run_object(self, run):
+        return {key: value for key, value in run.items() if not key.startswith("_")}
+
+    def create_run(self, thread_id):
+        assistant = self.state.assistants.get(self.body.get("assistant_id"))
+        if assistant is None:
+            return self.send_error_json(404, "No assistant found.")
+        with self.state.lock:
+            messages = [{"role": message["role"], "content": message["content"][0]["text"]["value"]}
+                        for message in self.state.threads[thread_id]["messages"]]
+        text = reply_for(messages, False, self.config.reply_tokens)
+        run = {"id": self.state.new_id("run"), "object": "thread.run", "created_at": int(time.time()),
+               "thread_id": thread_id, "assistant_id": assistant["id"], "status": "queued",
+               "model": assistant["model"], "instructions": assistant["instructions"], "tools": [],
+               "required_action": None, "last_error": None, "incomplete_details": None, "usage": None,
+               "metadata": {}, "parallel_tool_calls": True,
+               "_text": text, "_ready_at": time.monotonic() + len(tokens_of(text)) * self.config.token_delay()}
+        with self.state.lock:
+            self.state.runs[run["id"]] = run
+        if not self.body.get("stream"):
+            return self.send_json(self.run_object(run))
+        self.stream_run(run)
+
+    def stream_run(self, run):
+        self.start_stream()
+        self.send_event(self.run_object(run), "thread.run.created")
+        run["status"] = "in_progress"
+        self.send_event(self.run_object(run), "thread.run.in_progress")
+        message = {"id": self.state.new_id("msg"), "object": "thread.message", "created_at": int(time.time()),
+                   "thread_id": run["thread_id"], "role": "assistant", "status": "in_progress", "run_id": run["id"],
+                   "assistant_id": run["assistant_id"], "attachments": [], "metadata": {}, "content": []}
+        self.send_event(message, "thread.message.created")
+        for token in self.stream_tokens(run["_text"]):
+            if run["status"] != "in_progress":
+                break
+            self.send_event({"id": message["id"], "object": "thread.message.delta",
+                             "delta": {"content": [{"index": 0, "type": "text", "text": {"value": token}}]}},
+                            "thread.message.delta")
+        if run["status"] == "in_progress":
+            with self.state.lock:
+                stored = self.state.add_message(run["thread_id"], "assistant", run["_text"], run["id"], run["assistant_id"])
+            self.send_event(stored, "thread.message.completed")
+            run["status"] = "completed"
+            self.send_event(self.run_object(run), "thread.run.completed")
+        else:
+            self.send_event(self.run_object(run), "thread.run.cancelled")
+        self.send_event("[DONE]", "done")
+        self.end_stream()
+
+    def retrieve_run(self, thread_id, run_id):
+        run = self.state.runs[run_id]
+        with self.state.lock:
+            if run["status"] in ("queued", "in_progress"):
+                if time.monotonic() >= run["_ready_at"]:
+                    self.state.add_message(thread_id, "assistant", run["_text"], run_id, run["assistant_id"])
+                    run["status"] = "completed"
+                    self.record["first_token"] = time.monotonic()
+                else:
+                    run["status"] = "in_progress"
+        extra = {"openai-poll-after-ms": str(self.config.run_poll_after_ms)} if self.config.run_poll_after_ms else None
+        self.send_json(self.run_object(run), extra=extra)
+
+    def cancel_run(self, thread_id, run_id):
+        run = self.state.runs[run_id]
+        with self.state.lock:
+            if run["status"] in ("queued", "in_progress", "requires_action"):
+                run["status"] = "cancelled"
+        self.send_json(self.run_object(run))
+
+    # files and vector stores
+
+    def create_file(self):
+        match = re.search(rb'filename="([^"]+)"', self.raw_body)
+        file = {"id": self.state.new_id("file"), "object": "file", "bytes": len(self.raw_body),
+                "created_at": int(time.time()), "filename": match.group(1).decode() if match else "upload",
+                "purpose": "assistants", "status": "processed"}
+        with self.state.lock:
+            self.state.files[file["id"]] = file
+        self.send_json(file)
+
+    def create_vector_store(self):
+        store = {"id": self.state.new_id("vs"), "object": "vector_store", "created_at": int(time.time()),
+                 "name": self.body.get("name"), "status": "completed", "usage_bytes": 0, "metadata": {},
+                 "file_counts": {"in_progress": 0, "completed": 0, "failed": 0, "cancelled": 0, "total": 0}}
+        with self.state.lock:
+            self.state.vector_stores[store["id"]] = store
+        self.send_json(store)
+
+    def batch_object(self, batch):
+        total = len(batch["_file_ids"])
+        done = time.monotonic() >= batch["_ready_at"]
+        batch["status"] = "completed" if done else "in_progress"
+        batch["file_counts"] = {"in_progress": 0 if done else total, "completed": total if done else 0,
+                                "failed": 0, "cancelled": 0, "total": total}
+        return {key: value for key, value in batch.items() if not key.startswith("_")}
+
+    def create_file_batch(self, store_id):
+        batch = {"id": self.state.new_id("vsfb"), "object": "vector_store.files_batch",
+                 "created_at": int(time.time()), "vector_store_id": store_id,
+                 "_file_ids": self.body.get("file_ids", []), "_ready_at": time.monotonic() + self.config.sample_latency()}
+        with self.state.lock:
+            self.state.batches[batch["id"]] = batch
+        self.send_json(self.batch_object(batch))
+
+    def retrieve_file_batch(self, store_id, batch_id):
+        self.send_json(self.batch_object(self.state.batches[batch_id]))
+
+    def list_batch_files(self, store_id, batch_id):
+        self.send_json({"object": "list", "data": [], "first_id": None, "last_id": None, "has_more": False})
+
+
+class MockOpenAIServer:
+    # A local stand-in for the OpenAI API, run on a background thread. Point a client at
+    # base_url; every request is logged in state.requests with its timings.
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockConfig()
+        self.state = MockState()
+        self.server = ThreadingHTTPServer((host, port), MockHandler)
+        self.server.daemon_threads = True
+        self.server.config = self.config
+        self.server.state = self.state
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-openai", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def requests_since(self, started):
+        with self.state.lock:
+            return [request for request in self.state.requests if request["started"] >= started]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI API for local development and benchmarks.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="median seconds before a response starts")
+    parser.add_argument("--jitter", type=float, default=0.3, help="log-normal spread of the latency")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--assistant-id", action="append", default=[], help="assistant ids to create up front")
+    args = parser.parse_args()
+    config = MockConfig(args.latency, args.jitter, args.tokens_per_second, error_rate=args.error_rate,
+                        error_status=args.error_status)
+    server = MockOpenAIServer(config, port=args.port)
+    for assistant_id in args.assistant_id:
+        server.state.add_assistant(assistant_id)
+    print(f"Mock OpenAI API on {server.base_url} (set OPENAI_BASE_URL to use it)")
+    server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import openai
+import pytest
+from openai import OpenAI
+from mock_openai import MockConfig, MockOpenAIServer
+
+
+def test_serves_chat_and_assistant_runs_through_the_sdk():
+    with MockOpenAIServer(MockConfig(latency=0, tokens_per_second=0)) as server:
+        server.state.add_assistant("asst_test")
+        client = OpenAI(api_key="mock-key", base_url=server.base_url, max_retries=0)
+
+        stream = client.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}], stream=True)
+        assert "".join(chunk.choices[0].delta.content or "" for chunk in stream).startswith("Mock answer about: hi")
+
+        thread = client.beta.threads.create()
+        client.beta.threads.messages.create(thread_id=thread.id, role="user", content="hello")
+        with client.beta.threads.runs.stream(thread_id=thread.id, assistant_id="asst_test") as events:
+            assert "".join(events.text_deltas).startswith("Mock answer about: hello")
+        run = client.beta.threads.runs.create_and_poll(thread_id=thread.id, assistant_id="asst_test", poll_interval_ms=10)
+        assert run.status == "completed"
+        assert len(client.beta.threads.messages.list(thread_id=thread.id).data) == 3
+
+        streamed = [request for request in server.state.requests if request["stream"]]
+        assert len(streamed) == 2 and all(request["first_token"] for request in streamed)
+
+
+def test_injects_errors():
+    with MockOpenAIServer(MockConfig(latency=0, error_rate=1.0, error_status=429)) as server:
+        client = OpenAI(api_key="mock-key", base_url=server.base_url, max_retries=1)
+        with pytest.raises(openai.RateLimitError):
+            client.embeddings.create(model="text-embedding-3-small", input="hi")
+        assert [request["status"] for request in server.state.requests] == [429, 429]
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import time
+from tracing import span
+
+
+class Deferred(Exception):
+    # raised by a client that answers calls later, as the bulk runner's batch mode does;
+    # the subtask has neither failed nor finished, so it is not given a result
+    pass
+
+
+class Subtask:
+    def __init__(self, id, description, depends_on=()):
+        self.id = id
+        self.description = description
+        self.depends_on = list(depends_on)
+
+
+class WorkerResult:
+    def __init__(self, subtask, output=None, error=None, started=0.0, finished=0.0, ready=0.0):
+        self.subtask = subtask
+        self.output = output
+        self.error = error
+        self.ready = ready
+        self.started = started
+        self.finished = finished
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def latency(self):
+        return self.finished - self.started
+
+    @property
+    def queued(self):
+        # time spent waiting for a free worker after its dependencies were done
+        return self.started - self.ready
+
+
+class TaskGraph:
+    def __init__(self, subtasks):
+        self.subtasks = {subtask.id: subtask for subtask in subtasks}
+        for subtask in subtasks:
+            # a plan may reference steps that do not exist; treat them as already satisfied
+            subtask.depends_on = [dependency for dependency in subtask.depends_on
+                                  if dependency in self.subtasks and dependency != subtask.id]
+        self.order = self.topological_order()
+
+    def topological_order(self):
+        remaining = {id: set(subtask.depends_on) for id, subtask in self.subtasks.items()}
+        order = []
+        while remaining:
+            ready = [id for id, dependencies in remaining.items() if not dependencies]
+            if not ready:
+                raise ValueError(f"Task plan has a dependency cycle between {sorted(remaining)}")
+            for id in ready:
+                order.append(id)
+                del remaining[id]
+            for dependencies in remaining.values():
+                dependencies.difference_update(ready)
+        return order
+
+    def critical_path(self, results):
+        # longest chain of worker latencies through the graph
+        longest = {}
+        for id in self.order:
+            subtask = self.subtasks[id]
+            upstream = max((longest[dependency] for dependency in subtask.depends_on), default=0.0)
+            result = results.get(id)
+            longest[id] = upstream + (result.latency if result else 0.0)
+        return max(longest.values(), default=0.0)
+
+
+class Orchestrator:
+    DEFAULT_MODEL = "gpt-4o-mini"
+    PLAN_INSTRUCTIONS = (
+        "You are the orchestrator for a team of tutor workers. Break the student's request into at most "
+        "{max_subtasks} subtasks that workers can complete independently. Only add a dependency when a "
+        "subtask truly needs another subtask's output. Reply with JSON of the form "
+        '{{"subtasks": [{{"id": "s1", "description": "...", "depends_on": []}}]}}.'
+    )
+    WORKER_INSTRUCTIONS = "You are a tutor worker. Complete only the subtask you are given, concisely."
+    SYNTHESIS_INSTRUCTIONS = (
+        "You are a socratic tutor. Combine the workers' results into one coherent answer to the student's request."
+    )
+
+    def __init__(self, client, model=DEFAULT_MODEL, max_workers=4, max_subtasks=6, timeout=60.0):
+        self.client = client
+        self.model = model
+        self.max_workers = max_workers
+        self.max_subtasks = max_subtasks
+        self.timeout = timeout
+
+    async def plan(self, request):
+        with span("stage", stage="plan"):
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                response_format={"type": "json_object"},
+                messages=[
+                    {"role": "system", "content": self.PLAN_INSTRUCTIONS.format(max_subtasks=self.max_subtasks)},
+                    {"role": "user", "content": request},
+                ],
+            )
+        return self.parse_plan(request, response.choices[0].message.content)
+
+    def parse_plan(self, request, content):
+        # a plan that is not the JSON asked for falls back to one worker doing the whole request
+        try:
+            plan = json.loads(content)
+            items = plan.get("subtasks") if isinstance(plan, dict) else None
+            if not isinstance(items, list) or not items:
+                raise ValueError("the plan has no list of subtasks")
+            subtasks = []
+            for index, item in enumerate(items[:self.max_subtasks]):
+                if not isinstance(item, dict):
+                    raise ValueError(f"subtask {index + 1} is not an object")
+                depends_on = item.get("depends_on") or []
+                if isinstance(depends_on, str):
+                    depends_on = [depends_on]
+                if not isinstance(depends_on, list):
+                    raise ValueError(f"subtask {index + 1} has malformed dependencies")
+                subtasks.append(Subtask(str(item.get("id", f"s{index + 1}")), str(item.get("description") or request),
+                                        [str(dependency) for dependency in depends_on]))
+            return TaskGraph(subtasks)
+        except (TypeError, ValueError):
+            return TaskGraph([Subtask("s1", request)])
+
+    async def work(self, request, subtask, dependency_results):
+        context = "\n\n".join(
+            f"Result of '{result.subtask.description}':\n{result.output}" for result in dependency_results
+        )
+        content = f"Student request: {request}\n\nYour subtask: {subtask.description}"
+        if context:
+            content += f"\n\nResults you can build on:\n{context}"
+        response = await asyncio.wait_for(
+            self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": self.WORKER_INSTRUCTIONS},
+                    {"role": "user", "content": content},
+                ],
+            ),
+            timeout=self.timeout,
+        )
+        return response.choices[0].message.content
+
+    async def execute(self, request, graph, on_complete=None):
+        # every subtask starts as soon as its own dependencies finish and a worker is free,
+        # so latency follows the critical path rather than the number of subtasks
+        semaphore = asyncio.Semaphore(self.max_workers)
+        origin = time.perf_counter()
+        tasks = {}
+
+        async def run(subtask):
+            dependencies = [await tasks[dependency] for dependency in subtask.depends_on]
+            ready = time.perf_counter() - origin
+            failed = [result for result in dependencies if not result.ok]
+            if failed:
+                result = WorkerResult(subtask, error=f"skipped: dependency {failed[0].subtask.id} failed",
+                                      started=ready, finished=ready, ready=ready)
+            else:
+                async with semaphore:
+                    started = time.perf_counter() - origin
+                    try:
+                        with span("stage", stage=f"subtask {subtask.id}", depends_on=list(subtask.depends_on)):
+                            output = await self.work(request, subtask, dependencies)
+                        result = WorkerResult(subtask, output=output, started=started,
+                                              finished=time.perf_counter() - origin, ready=ready)
+                    except Deferred:
+                        raise
+                    except asyncio.TimeoutError:
+                        result = WorkerResult(subtask, error=f"timed out after {self.timeout}s", started=started,
+                                              finished=time.perf_counter() - origin, ready=ready)
+                    except Exception as error:
+                        result = WorkerResult(subtask, error=str(error), started=started,
+                                              finished=time.perf_counter() - origin, ready=ready)
+            if on_complete is not None:
+                on_complete(result)
+            return result
+
+        for id in graph.order:
+            tasks[id] = asyncio.create_task(run(graph.subtasks[id]))
+        # every subtask gets its turn before a deferred call is raised, so one pass defers them all
+        results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return {result.subtask.id: result for result in results}
+
+    async def synthesise(self, request, graph, results):
+        worker_results = "\n\n".join(
+            f"Subtask {id}: {graph.subtasks[id].description}\n"
+            + (results[id].output if results[id].ok else f"(no result: {results[id].error})")
+            for id in graph.order
+        )
+        with span("stage", stage="synthesise"):
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                stream=True,
+                messages=[
+                    {"role": "system", "content": self.SYNTHESIS_INSTRUCTIONS},
+                    {"role": "user", "content": f"Student request: {request}\n\nWorker results:\n{worker_results}"},
+                ],
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import pytest
+from types import SimpleNamespace
+from orchestrator import Deferred, Orchestrator, Subtask, TaskGraph, WorkerResult
+
+
+class FakeCompletions:
+    def __init__(self, plan=None, delay=0.05):
+        self.plan = plan
+        self.delay = delay
+
+    async def create(self, model, messages, response_format=None, stream=False):
+        if response_format is not None:
+            content = self.plan
+        else:
+            await asyncio.sleep(self.delay)
+            content = "done: " + messages[-1]["content"].split("Your subtask: ")[-1].split("\n")[0]
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def orchestrator(plan=None, delay=0.05, max_workers=4):
+    client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(plan, delay)))
+    return Orchestrator(client, max_workers=max_workers)
+
+
+def test_rejects_cycles_and_drops_dangling_dependencies():
+    with pytest.raises(ValueError, match="cycle"):
+        TaskGraph([Subtask("a", "A", ["b"]), Subtask("b", "B", ["a"])])
+    graph = TaskGraph([Subtask("a", "A", ["missing", "a"]), Subtask("b", "B", ["a"])])
+    assert graph.subtasks["a"].depends_on == [] and graph.order == ["a", "b"]
+
+
+def test_critical_path_follows_the_longest_chain():
+    graph = TaskGraph([Subtask("a", "A"), Subtask("b", "B", ["a"]), Subtask("c", "C")])
+    results = {
+        "a": WorkerResult(graph.subtasks["a"], "x", started=0.0, finished=1.0),
+        "b": WorkerResult(graph.subtasks["b"], "x", started=1.0, finished=3.0),
+        "c": WorkerResult(graph.subtasks["c"], "x", started=0.0, finished=2.5),
+    }
+    assert graph.critical_path(results) == 3.0
+
+
+def test_independent_workers_overlap_and_dependents_wait():
+    graph = TaskGraph([Subtask("a", "A"), Subtask("b", "B"), Subtask("c", "C", ["a", "b"])])
+    results = asyncio.run(orchestrator(delay=0.1).execute("request", graph))
+    assert all(result.ok for result in results.values())
+    assert results["a"].started < results["b"].finished and results["b"].started < results["a"].finished
+    assert results["c"].started >= max(results["a"].finished, results["b"].finished)
+    assert results["c"].output == "done: C"
+
+
+@pytest.mark.parametrize("plan", [
+    "not json",
+    json.dumps(["s1"]),
+    json.dumps({"subtasks": "explain it"}),
+    json.dumps({"subtasks": ["explain it"]}),
+    json.dumps({"subtasks": [{"id": "a", "depends_on": ["b"]}, {"id": "b", "depends_on": ["a"]}]}),
+    None,
+])
+def test_a_malformed_plan_falls_back_to_one_worker(plan):
+    graph = asyncio.run(orchestrator(plan).plan("What is a derivative?"))
+    assert graph.order == ["s1"] and graph.subtasks["s1"].description == "What is a derivative?"
+
+
+def test_a_string_dependency_is_read_as_one_id():
+    plan = json.dumps({"subtasks": [{"id": "a", "description": "A"},
+                                    {"id": "b", "description": "B", "depends_on": "a"}]})
+    graph = asyncio.run(orchestrator(plan).plan("request"))
+    assert graph.subtasks["b"].depends_on == ["a"]
+
+
+def test_a_deferred_call_is_raised_after_every_ready_subtask_has_asked():
+    asked = []
+
+    class DeferringCompletions:
+        async def create(self, model, messages, response_format=None, stream=False):
+            asked.append(messages[-1]["content"].split("Your subtask: ")[-1].split("\n")[0])
+            raise Deferred()
+
+    orchestrator = Orchestrator(SimpleNamespace(chat=SimpleNamespace(completions=DeferringCompletions())))
+    graph = TaskGraph([Subtask("a", "A"), Subtask("b", "B"), Subtask("c", "C", ["a"])])
+    with pytest.raises(Deferred):
+        asyncio.run(orchestrator.execute("request", graph))
+    # c waits on a, so it never asks
+    assert sorted(asked) == ["A", "B"]
@@ -3,6 +3,7 @@ from openai import OpenAI
 import pandas as pd
 from abstract_page import AbstractPage
 from assistant import AssistantSettings, AssistantsDisplay, AssistantSettingsForm, ChatInterface
+from local_retrieval import LocalRetriever, get_local_index_for
 
 class AugmentedLLMPage(AbstractPage):
     def __init__(self):
@@ -29,12 +30,13 @@ class AugmentedLLMPage(AbstractPage):
 
     def display(self):
         self.display_title_and_description()
-        self.display_tabs(["Chat", "Assistants", "Settings"])
+        self.display_tabs(["Chat", "Assistants", "Settings", "Local index"])
 
     def display_tabs(self, tab_names):
         self.tabs = streamlit.tabs(tab_names)
         with self.tabs[0]:
-            self.chat_interface = ChatInterface(assistant_id=streamlit.session_state.selected_assistant)
+            retriever = LocalRetriever(self.client, self.local_index()) if streamlit.session_state.get("use_local_index") else None
+            self.chat_interface = ChatInterface(assistant_id=streamlit.session_state.selected_assistant, retriever=retriever, page=self.title)
             self.user_chat_message_content = self.chat_interface.display()
         with self.tabs[1]:
             assistants_display = AssistantsDisplay()
@@ -42,6 +44,25 @@ class AugmentedLLMPage(AbstractPage):
         with self.tabs[2]:
             settings_form = AssistantSettingsForm()
             settings_form.display()
+        with self.tabs[3]:
+            self.display_local_index()
+
+    def local_index(self):
+        # each API key and assistant has its own index
+        return get_local_index_for(self.client, streamlit.session_state.selected_assistant)
+
+    def display_local_index(self):
+        index = self.local_index()
+        streamlit.toggle("Add excerpts from the local index to each question", key="use_local_index")
+        streamlit.caption(f"{index.count} chunk(s) indexed for the selected assistant" + (f" in {index.manifest['clusters']} partitions" if index.manifest["clusters"] else ""))
+        uploaded_files = streamlit.file_uploader("Add file(s) to the local index", type=["txt", "md", "pdf"], accept_multiple_files=True, key="local_index_files")
+        if streamlit.button("Index files", disabled=not uploaded_files):
+            with streamlit.spinner("Embedding chunks..."):
+                added = LocalRetriever(self.client, index).ingest([(file.name, file.getvalue()) for file in uploaded_files])
+            streamlit.success(f"Indexed {added} chunk(s).")
+        if streamlit.button("Clear local index", disabled=not index.count):
+            index.clear()
+            streamlit.rerun()
 
 
 # Main Function
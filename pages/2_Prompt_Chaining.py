@@ -1,9 +1,46 @@
 import streamlit as st
 from abstract_page import AbstractPage
-from assistant import ChatInterface
+from clients import bind_script_context, get_async_client_for, run_async
+from prompt_chaining import ChainExecutor, Stage, StageCache, must_contain, until_marker, when_complete
+
+
+GATES = {
+    "When complete": lambda value: when_complete,
+    "Until marker": until_marker,
+    "Must contain": must_contain,
+}
 
 
 class PromptChainingPage(AbstractPage):
+    DEFAULT_STAGES = [
+        {
+            "name": "Outline",
+            "template": "List the key concepts a student needs to understand to answer this question, "
+                        "one per line, then write END.\n\nQuestion: {input}",
+            "model": "gpt-4o-mini",
+            "temperature": 0.0,
+            "gate": "Until marker",
+            "gate_value": "END",
+        },
+        {
+            "name": "Draft",
+            "template": "Using these key concepts:\n{previous}\n\nWrite a clear, student-friendly answer to: {input}",
+            "model": "gpt-4o-mini",
+            "temperature": 0.0,
+            "gate": "When complete",
+            "gate_value": "",
+        },
+        {
+            "name": "Socratic rewrite",
+            "template": "Rewrite this answer in the style of a socratic tutor, ending with one question "
+                        "that checks the student's understanding:\n\n{previous}",
+            "model": "gpt-4o-mini",
+            "temperature": 0.0,
+            "gate": "When complete",
+            "gate_value": "",
+        },
+    ]
+
     def __init__(self):
         super().__init__(
             title="🔗 Prompt Chaining",
@@ -12,6 +49,11 @@ class PromptChainingPage(AbstractPage):
         )
         self.client = st.session_state.client
         self.user_chat_message_content = None
+        if "prompt_chain_stages" not in st.session_state:
+            st.session_state["prompt_chain_stages"] = [dict(stage) for stage in self.DEFAULT_STAGES]
+        if "prompt_chain_cache" not in st.session_state:
+            st.session_state["prompt_chain_cache"] = {}
+        self.stage_configs = st.session_state["prompt_chain_stages"]
 
     def display(self):
         self.display_title_and_description()
@@ -20,10 +62,86 @@ class PromptChainingPage(AbstractPage):
     def display_tabs(self, tab_names):
         self.tabs = st.tabs(tab_names)
         with self.tabs[0]:
-            st.write("This is the Construct tab")
+            self.display_construct()
         with self.tabs[1]:
-            self.chat_interface = ChatInterface('asst_pTXwNaRFg48IXBe3cw2exyv5')
-            self.user_chat_message_content = self.chat_interface.display()
+            self.user_chat_message_content = self.display_chat(self.respond)
+
+    def display_construct(self):
+        st.caption("Templates can use `{input}` for the student's message and `{previous}` for the "
+                   "gated output of the stage before. Unchanged stages are served from the cache.")
+        for index, config in enumerate(self.stage_configs):
+            with st.expander(f"Stage {index + 1}: {config['name']}", expanded=False):
+                config["name"] = st.text_input("Name", config["name"], key=f"chain_name_{index}")
+                config["template"] = st.text_area("Prompt template", config["template"], key=f"chain_template_{index}")
+                config["model"] = st.radio("Model", ["gpt-4o-mini", "gpt-4o"], index=["gpt-4o-mini", "gpt-4o"].index(config["model"]),
+                                           key=f"chain_model_{index}", horizontal=True)
+                config["temperature"] = st.slider("Temperature", 0.0, 2.0, config["temperature"], key=f"chain_temperature_{index}")
+                config["gate"] = st.selectbox("Gate", list(GATES), index=list(GATES).index(config["gate"]), key=f"chain_gate_{index}")
+                if config["gate"] != "When complete":
+                    config["gate_value"] = st.text_input("Gate text", config["gate_value"], key=f"chain_gate_value_{index}")
+
+        add_column, remove_column, clear_column = st.columns(3)
+        with add_column:
+            st.button("Add stage", on_click=self.add_stage, icon="➕")
+        with remove_column:
+            st.button("Remove last stage", on_click=self.remove_stage, disabled=len(self.stage_configs) < 2, icon="➖")
+        with clear_column:
+            st.button("Clear cache", on_click=st.session_state["prompt_chain_cache"].clear, icon="🧹")
+
+        test_input = st.text_input("Test input", "What is a derivative?")
+        if st.button("Run chain", type="primary"):
+            self.run_chain(test_input)
+
+    def add_stage(self):
+        self.stage_configs.append({
+            "name": f"Stage {len(self.stage_configs) + 1}",
+            "template": "{previous}",
+            "model": "gpt-4o-mini",
+            "temperature": 0.0,
+            "gate": "When complete",
+            "gate_value": "",
+        })
+
+    def remove_stage(self):
+        self.stage_configs.pop()
+
+    def build_stages(self):
+        return [
+            Stage(config["name"], config["template"], config["model"], config["temperature"],
+                  GATES[config["gate"]](config["gate_value"]))
+            for config in self.stage_configs
+        ]
+
+    def run_chain(self, user_input):
+        stages = self.build_stages()
+        placeholders = []
+        for stage in stages:
+            st.write(f"**{stage.name}**")
+            placeholders.append(st.empty())
+        executor = ChainExecutor(
+            get_async_client_for(self.client),
+            StageCache(st.session_state["prompt_chain_cache"]),
+            bind_script_context(lambda index, text: placeholders[index].markdown(text)),
+        )
+        results = run_async(executor.run(stages, user_input))
+        for index, result in enumerate(results):
+            if isinstance(result, Exception):
+                placeholders[index].error(str(result))
+            elif result.cached:
+                placeholders[index].markdown(f"{result.output}\n\n:green[cached]")
+            else:
+                placeholders[index].markdown(
+                    f"{result.output}\n\n:gray[first token {result.first_token_latency or 0:.2f}s, total {result.latency:.2f}s]"
+                )
+        return results
+
+    def respond(self, prompt):
+        with st.expander("Chain stages"):
+            results = self.run_chain(prompt)
+        final = results[-1]
+        content = final.output if not isinstance(final, Exception) else f"The chain stopped early: {final}"
+        st.markdown(content)
+        return content
 
 
 # Main Function
@@ -32,4 +150,4 @@ def main():
     page.display()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,22 +1,59 @@
 import streamlit as st
 from abstract_page import AbstractPage
-from assistant import ChatInterface
+from clients import bind_script_context, get_async_client_for, run_async
+from context_window import get_context_window
+from response_cache import CachedClient, get_response_cache
+from routing import Route, Router, SpeculativeRouter, llm_classifier
 
 
 class RoutingPage(AbstractPage):
+    DEFAULT_MODEL = "gpt-4o-mini"
+    DEFAULT_ROUTES = [
+        {
+            "name": "Concept explanation",
+            "instructions": "You are a socratic tutor. Explain the concept the student asks about step by step, "
+                            "then ask a question that checks their understanding.",
+            "examples": "What is a derivative?\nCan you explain recursion?\nHow does photosynthesis work?\n"
+                        "I don't understand what entropy means\nWhat's the difference between mitosis and meiosis?",
+            "keywords": "explain, what is, what does, meaning of",
+        },
+        {
+            "name": "Assessment help",
+            "instructions": "You are a tutor helping with an assessment. Never give the answer directly; guide the "
+                            "student with hints and questions so they can solve it themselves.",
+            "examples": "How do I solve question 3 of the assignment?\nCan you check my answer to this problem?\n"
+                        "I'm stuck on the homework exercise\nIs my proof correct?\nHelp me with my lab report",
+            "keywords": "assignment, homework, quiz, problem set",
+        },
+        {
+            "name": "Study planning",
+            "instructions": "You are a study coach. Help the student plan revision, manage time and prepare for exams.",
+            "examples": "How should I study for the final exam?\nI have three exams next week, how do I plan?\n"
+                        "Give me a revision timetable\nHow can I stop procrastinating?\nTips for exam preparation",
+            "keywords": "exam, revision, timetable, study plan",
+        },
+    ]
+
     def __init__(self):
         super().__init__(
             title="🚦 Routing",
             description="""
-            > 'Routing classifies an input and directs it to a specialized followup task. This 
-            workflow allows for separation of concerns, and building more specialized prompts. 
-            Without this workflow, optimizing for one kind of input can hurt performance on other 
+            > 'Routing classifies an input and directs it to a specialized followup task. This
+            workflow allows for separation of concerns, and building more specialized prompts.
+            Without this workflow, optimizing for one kind of input can hurt performance on other
             inputs.'
             """,
             initial_message_content="Hello! I am a tutor assistant that can help you understand your course material."
         )
         self.client = st.session_state.client
         self.user_chat_message_content = None
+        if "routing_config" not in st.session_state:
+            st.session_state["routing_config"] = {
+                "routes": [dict(route) for route in self.DEFAULT_ROUTES],
+                "threshold": 0.3,
+                "speculative": False,
+            }
+        self.config = st.session_state["routing_config"]
 
     def display(self):
         self.display_title_and_description()
@@ -25,12 +62,112 @@ class RoutingPage(AbstractPage):
     def display_tabs(self, tab_names):
         self.tabs = st.tabs(tab_names)
         with self.tabs[0]:
-            st.write("This is the Construct tab")
+            self.display_construct()
         with self.tabs[1]:
-            self.chat_interface = ChatInterface('asst_pTXwNaRFg48IXBe3cw2exyv5')
-            self.user_chat_message_content = self.chat_interface.display()
-        
+            self.user_chat_message_content = self.display_chat(self.respond)
+
+    def display_construct(self):
+        st.caption("Messages are routed by keyword rules first, then by similarity to the example "
+                   "utterances. Only low-confidence messages fall back to an LLM classification call.")
+        for index, route in enumerate(self.config["routes"]):
+            with st.expander(route["name"]):
+                route["instructions"] = st.text_area("Specialist instructions", route["instructions"], key=f"route_instructions_{index}")
+                route["examples"] = st.text_area("Example utterances (one per line)", route["examples"], key=f"route_examples_{index}")
+                route["keywords"] = st.text_input("Keywords (comma separated)", route["keywords"], key=f"route_keywords_{index}")
+        self.config["threshold"] = st.slider("Local confidence threshold", 0.0, 1.0, self.config["threshold"])
+        self.config["speculative"] = st.toggle(
+            "Speculative execution", self.config["speculative"],
+            help="Start the most frequent route's specialist while the LLM classifier runs, "
+                 "and cancel it if the classifier picks a different route.",
+        )
+
+        router = self.get_router()
+        st.write("**Route decisions by source**")
+        st.write({source: router.counts[source] for source in ["memo", "keyword", "local", "llm"]})
+        stats = self.get_speculative_router().stats
+        st.write("**Speculation**")
+        st.write({
+            "hits": stats.hits,
+            "misses": stats.misses,
+            "hit rate": round(stats.hit_rate, 2),
+            "decided locally (not speculated)": stats.skipped,
+            "estimated wasted tokens (speculative prompt + discarded completion)": stats.wasted_tokens,
+        })
+
+    def build_routes(self):
+        return [
+            Route(
+                route["name"],
+                route["instructions"],
+                [example for example in route["examples"].splitlines() if example.strip()],
+                [keyword.strip() for keyword in route["keywords"].split(",") if keyword.strip()],
+            )
+            for route in self.config["routes"]
+        ]
+
+    def get_router(self):
+        # keep the router, and its memo of recent decisions, until the routes are edited
+        signature = repr({key: value for key, value in self.config.items() if key != "speculative"})
+        if st.session_state.get("router_signature") != signature:
+            st.session_state["router"] = Router(
+                self.build_routes(),
+                llm_classify=llm_classifier(CachedClient(self.client, get_response_cache()), self.DEFAULT_MODEL),
+                threshold=self.config["threshold"],
+            )
+            st.session_state["speculative_router"] = SpeculativeRouter(st.session_state["router"])
+            st.session_state["router_signature"] = signature
+        return st.session_state["router"]
+
+    def get_speculative_router(self):
+        self.get_router()
+        return st.session_state["speculative_router"]
 
+    def specialist_messages(self, route, history=None):
+        # history is trimmed to the model's token budget, with older turns summarised
+        history = get_context_window(self.client, self.DEFAULT_MODEL).select() if history is None else history
+        return [{"role": "system", "content": route.instructions}] + history
+
+    def display_decision(self, decision):
+        st.caption(f"Routed to **{decision.route.name}** by {decision.source} "
+                   f"(confidence {decision.confidence:.2f}, {decision.latency * 1000:.2f} ms)")
+
+    def respond(self, prompt):
+        if self.config["speculative"]:
+            return self.respond_speculatively(prompt)
+        decision = self.get_router().route(prompt)
+        self.display_decision(decision)
+        stream = self.client.chat.completions.create(
+            model=self.DEFAULT_MODEL,
+            messages=self.specialist_messages(decision.route),
+            stream=True,
+        )
+        return st.write_stream(stream)
+
+    def respond_speculatively(self, prompt):
+        caption = st.empty()
+        placeholder = st.empty()
+        client = get_async_client_for(self.client)
+        history = get_context_window(self.client, self.DEFAULT_MODEL).select()
+
+        async def specialist(route, text):
+            stream = await client.chat.completions.create(
+                model=self.DEFAULT_MODEL,
+                messages=self.specialist_messages(route, history),
+                stream=True,
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+        speculative_router = self.get_speculative_router()
+        decision, content = run_async(
+            speculative_router.respond(prompt, specialist, bind_script_context(placeholder.markdown),
+                                       lambda route: self.specialist_messages(route, history))
+        )
+        with caption.container():
+            self.display_decision(decision)
+        placeholder.markdown(content)
+        return content
 
 
 # Main Function
@@ -39,4 +176,4 @@ def main():
     page.display()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,14 +1,22 @@
 import streamlit as st
 from abstract_page import AbstractPage
-from assistant import ChatInterface
+from clients import get_async_client_for, run_async
+from parallelisation import AGGREGATORS, ParallelEngine
 
 
 class ParallelisationPage(AbstractPage):
+    DEFAULT_SECTIONS = [
+        ("Explanation", "Explain the core idea behind the student's question in plain language."),
+        ("Worked example", "Give one short worked example that illustrates the student's question."),
+        ("Misconceptions", "List the common misconceptions students have about the student's question."),
+    ]
+    DEFAULT_VOTING_INSTRUCTIONS = "Answer the student's question. Reply with the final answer only, in as few words as possible."
+
     def __init__(self):
         super().__init__(
             title="🚦 Parallelisation",
             description="""> '
-            LLMs can sometimes work simultaneously on a task and have their outputs aggregated 
+            LLMs can sometimes work simultaneously on a task and have their outputs aggregated
             programmatically. This workflow, parallelization, manifests in two key variations:
             **Sectioning**: Breaking a task into independent subtasks run in parallel.
             **Voting**: Running the same task multiple times to get diverse outputs.'
@@ -17,6 +25,21 @@ class ParallelisationPage(AbstractPage):
         )
         self.client = st.session_state.client
         self.user_chat_message_content = None
+        self.initialise_config()
+
+    def initialise_config(self):
+        if "parallelisation_config" not in st.session_state:
+            st.session_state["parallelisation_config"] = {
+                "mode": "Sectioning",
+                "model": ParallelEngine.DEFAULT_MODEL,
+                "fan_out": len(self.DEFAULT_SECTIONS),
+                "max_concurrency": 5,
+                "timeout": 30.0,
+                "aggregator": "Concatenation",
+                "sections": "\n".join(f"{name}: {instructions}" for name, instructions in self.DEFAULT_SECTIONS),
+                "voting_instructions": self.DEFAULT_VOTING_INSTRUCTIONS,
+            }
+        self.config = st.session_state["parallelisation_config"]
 
     def display(self):
         self.display_title_and_description()
@@ -25,10 +48,56 @@ class ParallelisationPage(AbstractPage):
     def display_tabs(self, tab_names):
         self.tabs = st.tabs(tab_names)
         with self.tabs[0]:
-            st.write("This is the Construct tab")
+            self.display_construct()
         with self.tabs[1]:
-            self.chat_interface = ChatInterface('asst_pTXwNaRFg48IXBe3cw2exyv5')
-            self.user_chat_message_content = self.chat_interface.display()
+            self.user_chat_message_content = self.display_chat(self.respond)
+
+    def display_construct(self):
+        config = self.config
+        config["mode"] = st.radio("Variation", ["Sectioning", "Voting"], index=["Sectioning", "Voting"].index(config["mode"]))
+        config["model"] = st.radio("Model", ["gpt-4o-mini", "gpt-4o"], index=["gpt-4o-mini", "gpt-4o"].index(config["model"]))
+        if config["mode"] == "Sectioning":
+            config["sections"] = st.text_area("Sections (one `name: instructions` per line)", config["sections"])
+            config["fan_out"] = len(self.parse_sections(config["sections"]))
+            st.caption(f"Fan-out width: **{config['fan_out']}** sections")
+        else:
+            config["voting_instructions"] = st.text_area("Voting instructions", config["voting_instructions"])
+            config["fan_out"] = st.slider("Fan-out width (samples)", 1, 15, config["fan_out"])
+        config["max_concurrency"] = st.slider("Maximum concurrent calls", 1, 15, config["max_concurrency"])
+        config["timeout"] = st.number_input("Per-call timeout (seconds)", 1.0, 120.0, config["timeout"])
+        aggregator_names = list(AGGREGATORS)
+        config["aggregator"] = st.selectbox("Aggregator", aggregator_names, index=aggregator_names.index(config["aggregator"]))
+
+    def parse_sections(self, text):
+        sections = []
+        for line in text.splitlines():
+            name, _, instructions = line.partition(":")
+            if name.strip() and instructions.strip():
+                sections.append((name.strip(), instructions.strip()))
+        return sections
+
+    async def run_engine(self, prompt):
+        config = self.config
+        engine = ParallelEngine(get_async_client_for(self.client), config["model"], config["max_concurrency"], config["timeout"])
+        aggregator = AGGREGATORS[config["aggregator"]]()
+        if config["mode"] == "Sectioning":
+            return await engine.section(prompt, self.parse_sections(config["sections"]), aggregator)
+        return await engine.vote(prompt, config["fan_out"], config["voting_instructions"], aggregator)
+
+    def respond(self, prompt):
+        with st.spinner(f"Running {self.config['fan_out']} calls in parallel..."):
+            result = run_async(self.run_engine(prompt))
+        content = result.aggregate or "All parallel calls failed, please try again."
+        st.markdown(content)
+        with st.expander(f"{len(result.succeeded)}/{len(result.results)} calls succeeded in {result.wall_time:.2f}s "
+                         f"(sequential would be {result.sequential_time:.2f}s)"):
+            for branch in result.results:
+                st.write(f"**{branch.name}** ({branch.latency:.2f}s)")
+                if branch.ok:
+                    st.write(branch.output)
+                else:
+                    st.error(branch.error)
+        return content
 
 
 # Main Function
@@ -37,4 +106,4 @@ def main():
     page.display()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
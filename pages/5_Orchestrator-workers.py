@@ -1,18 +1,27 @@
 import streamlit as st
 from abstract_page import AbstractPage
-from assistant import ChatInterface
+from clients import bind_script_context, get_async_client_for, run_async
+from orchestrator import Orchestrator
 
 
 class OrchestratorWorkersPage(AbstractPage):
     def __init__(self):
         super().__init__(
             title="🤖 Orchestrator Workers",
-            description="""> 'In the orchestrator-workers workflow, a central LLM dynamically breaks 
+            description="""> 'In the orchestrator-workers workflow, a central LLM dynamically breaks
             down tasks, delegates them to worker LLMs, and synthesizes their results.'""",
             initial_message_content="Hello! I am a tutor assistant that can help you understand your course material."
         )
         self.client = st.session_state.client
         self.user_chat_message_content = None
+        if "orchestrator_config" not in st.session_state:
+            st.session_state["orchestrator_config"] = {
+                "model": Orchestrator.DEFAULT_MODEL,
+                "max_workers": 4,
+                "max_subtasks": 6,
+                "timeout": 60.0,
+            }
+        self.config = st.session_state["orchestrator_config"]
 
     def display(self):
         self.display_title_and_description()
@@ -21,10 +30,87 @@ class OrchestratorWorkersPage(AbstractPage):
     def display_tabs(self, tab_names):
         self.tabs = st.tabs(tab_names)
         with self.tabs[0]:
-            st.write("This is the Construct tab")
+            self.display_construct()
         with self.tabs[1]:
-            self.chat_interface = ChatInterface('asst_pTXwNaRFg48IXBe3cw2exyv5')
-            self.user_chat_message_content = self.chat_interface.display()
+            self.user_chat_message_content = self.display_chat(self.respond)
+
+    def display_construct(self):
+        config = self.config
+        config["model"] = st.radio("Model", ["gpt-4o-mini", "gpt-4o"], index=["gpt-4o-mini", "gpt-4o"].index(config["model"]))
+        config["max_workers"] = st.slider("Worker pool size", 1, 10, config["max_workers"])
+        config["max_subtasks"] = st.slider("Maximum subtasks in a plan", 1, 12, config["max_subtasks"])
+        config["timeout"] = st.number_input("Per-worker timeout (seconds)", 1.0, 300.0, config["timeout"])
+
+        last_run = st.session_state.get("orchestrator_last_run")
+        if last_run:
+            st.write("**Worker timings for the last request**")
+            st.caption(f"Total {last_run['total']:.2f}s, critical path {last_run['critical_path']:.2f}s, "
+                       f"sum of worker latencies {last_run['worker_sum']:.2f}s")
+            st.dataframe(last_run["timings"], hide_index=True)
+
+    async def run(self, prompt, show_plan, on_complete, show_answer):
+        config = self.config
+        orchestrator = Orchestrator(get_async_client_for(self.client), config["model"], config["max_workers"],
+                                    config["max_subtasks"], config["timeout"])
+        graph = await orchestrator.plan(prompt)
+        show_plan(graph)
+        results = await orchestrator.execute(prompt, graph, on_complete)
+        answer = ""
+        async for delta in orchestrator.synthesise(prompt, graph, results):
+            answer += delta
+            show_answer(answer)
+        return graph, results, answer
+
+    def respond(self, prompt):
+        with st.status("Orchestrating workers...") as status:
+            st.write("**Plan**")
+            plan_placeholder = st.empty()
+            results_container = st.container()
+        answer_placeholder = st.empty()
+
+        def show_plan(graph):
+            plan_placeholder.markdown("\n".join(
+                f"- **{id}** {graph.subtasks[id].description}"
+                + (f" _(after {', '.join(graph.subtasks[id].depends_on)})_" if graph.subtasks[id].depends_on else "")
+                for id in graph.order
+            ))
+
+        def on_complete(result):
+            with results_container:
+                status_text = f"{result.latency:.2f}s" if result.ok else result.error
+                with st.expander(f"{result.subtask.id}: {result.subtask.description} ({status_text})"):
+                    st.write(result.output or result.error)
+
+        graph, results, answer = run_async(self.run(
+            prompt,
+            bind_script_context(show_plan),
+            bind_script_context(on_complete),
+            bind_script_context(answer_placeholder.markdown),
+        ))
+        status.update(label=f"{len(results)} workers finished", state="complete")
+        self.record_timings(graph, results)
+        return answer
+
+    def record_timings(self, graph, results):
+        timings = [
+            {
+                "subtask": id,
+                "depends on": ", ".join(graph.subtasks[id].depends_on),
+                "ready (s)": round(results[id].ready, 2),
+                "queued (s)": round(results[id].queued, 2),
+                "started (s)": round(results[id].started, 2),
+                "finished (s)": round(results[id].finished, 2),
+                "latency (s)": round(results[id].latency, 2),
+                "status": "ok" if results[id].ok else results[id].error,
+            }
+            for id in graph.order
+        ]
+        st.session_state["orchestrator_last_run"] = {
+            "timings": timings,
+            "total": max((result.finished for result in results.values()), default=0.0),
+            "critical_path": graph.critical_path(results),
+            "worker_sum": sum(result.latency for result in results.values()),
+        }
 
 # Main Function
 def main():
@@ -32,4 +118,4 @@ def main():
     page.display()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
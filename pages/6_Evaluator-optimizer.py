@@ -1,18 +1,30 @@
 import streamlit as st
 from abstract_page import AbstractPage
-from assistant import ChatInterface
+from clients import bind_script_context, get_async_client_for, run_async
+from evaluator_optimizer import EvaluatorOptimizer
 
 
 class EvaluatorOptimizerPage(AbstractPage):
     def __init__(self):
         super().__init__(
             title="🚦 Evaluator Optimizer",
-            description="""> 'In the evaluator-optimizer workflow, one LLM call generates a response 
+            description="""> 'In the evaluator-optimizer workflow, one LLM call generates a response
             while another provides evaluation and feedback in a loop.'""",
             initial_message_content="Hello! I am a tutor assistant that can help you understand your course material."
         )
         self.client = st.session_state.client
         self.user_chat_message_content = None
+        if "evaluator_optimizer_config" not in st.session_state:
+            st.session_state["evaluator_optimizer_config"] = {
+                "model": EvaluatorOptimizer.DEFAULT_MODEL,
+                "candidates_per_round": 3,
+                "max_rounds": 3,
+                "threshold": 8.0,
+                "min_improvement": 0.5,
+                "budget_tokens": 20000,
+                "budget_seconds": 60.0,
+            }
+        self.config = st.session_state["evaluator_optimizer_config"]
 
     def display(self):
         self.display_title_and_description()
@@ -21,10 +33,42 @@ class EvaluatorOptimizerPage(AbstractPage):
     def display_tabs(self, tab_names):
         self.tabs = st.tabs(tab_names)
         with self.tabs[0]:
-            st.write("This is the Construct tab")
+            self.display_construct()
         with self.tabs[1]:
-            self.chat_interface = ChatInterface('asst_pTXwNaRFg48IXBe3cw2exyv5')
-            self.user_chat_message_content = self.chat_interface.display()
+            self.user_chat_message_content = self.display_chat(self.respond)
+
+    def display_construct(self):
+        config = self.config
+        config["model"] = st.radio("Model", ["gpt-4o-mini", "gpt-4o"], index=["gpt-4o-mini", "gpt-4o"].index(config["model"]))
+        config["candidates_per_round"] = st.slider("Candidates per round", 1, 8, config["candidates_per_round"])
+        config["max_rounds"] = st.slider("Maximum rounds", 1, 10, config["max_rounds"])
+        config["threshold"] = st.slider("Stop when the evaluator scores at least", 0.0, 10.0, config["threshold"])
+        config["min_improvement"] = st.slider("Stop when a round improves the score by less than", 0.0, 5.0, config["min_improvement"])
+        config["budget_tokens"] = st.number_input("Token budget per request", 1000, 200000, config["budget_tokens"], step=1000)
+        config["budget_seconds"] = st.number_input("Latency budget per request (seconds)", 1.0, 600.0, config["budget_seconds"])
+
+    async def run(self, prompt, on_round):
+        optimizer = EvaluatorOptimizer(get_async_client_for(self.client), **self.config)
+        return await optimizer.run(prompt, on_round)
+
+    def respond(self, prompt):
+        with st.status("Generating and evaluating candidates...") as status:
+            def on_round(round, candidates):
+                st.write(f"**Round {round}**: scores "
+                         + ", ".join(f"{candidate.score:g}" for candidate in sorted(candidates, key=lambda c: -c.score)))
+
+            result = run_async(self.run(prompt, bind_script_context(on_round)))
+            status.update(
+                label=f"Stopped: {result.stop_reason} ({result.tokens_used} tokens, {result.elapsed:.1f}s)",
+                state="complete" if result.best else "error",
+            )
+        if result.best is None:
+            content = f"I couldn't produce an answer within the budget ({result.stop_reason})."
+        else:
+            content = result.best.text
+            st.caption(f"Evaluator score {result.best.score:g}/10: {result.best.feedback}")
+        st.markdown(content)
+        return content
 
 # Main Function
 def main():
@@ -32,4 +76,4 @@ def main():
     page.display()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
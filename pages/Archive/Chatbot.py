@@ -1,5 +1,6 @@
-from openai import OpenAI
 import streamlit as st
+from clients import get_client
+from context_window import get_context_window
 
 with st.sidebar:
     openai_api_key = st.text_input("OpenAI API Key", key="chatbot_api_key", type="password")
@@ -20,10 +21,11 @@ if prompt := st.chat_input():
         st.info("Please add your OpenAI API key to continue.")
         st.stop()
 
-    client = OpenAI(api_key=openai_api_key)
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    client = get_client(openai_api_key)
+    context_window = get_context_window(client, "gpt-3.5-turbo")
+    context_window.append({"role": "user", "content": prompt})
     st.chat_message("user").write(prompt)
-    response = client.chat.completions.create(model="gpt-3.5-turbo", messages=st.session_state.messages)
+    response = client.chat.completions.create(model="gpt-3.5-turbo", messages=context_window.select())
     msg = response.choices[0].message.content
-    st.session_state.messages.append({"role": "assistant", "content": msg})
+    context_window.append({"role": "assistant", "content": msg})
     st.chat_message("assistant").write(msg)
@@ -1,7 +1,8 @@
-from openai import OpenAI
 import streamlit as st
 from streamlit_feedback import streamlit_feedback
 import trubrics
+from clients import get_client
+from context_window import get_context_window
 
 with st.sidebar:
     openai_api_key = st.text_input("OpenAI API Key", key="feedback_api_key", type="password")
@@ -34,8 +35,10 @@ if prompt := st.chat_input(placeholder="Tell me a joke about sharks"):
     if not openai_api_key:
         st.info("Please add your OpenAI API key to continue.")
         st.stop()
-    client = OpenAI(api_key=openai_api_key)
-    response = client.chat.completions.create(model="gpt-3.5-turbo", messages=messages)
+    client = get_client(openai_api_key)
+    response = client.chat.completions.create(
+        model="gpt-3.5-turbo", messages=get_context_window(client, "gpt-3.5-turbo").select()
+    )
     st.session_state["response"] = response.choices[0].message.content
     with st.chat_message("assistant"):
         messages.append({"role": "assistant", "content": st.session_state["response"]})
@@ -0,0 +1,159 @@
+import asyncio
+import re
+import time
+from collections import Counter
+from tracing import span
+
+
+class BranchResult:
+    def __init__(self, name, output=None, error=None, latency=0.0, usage=None):
+        self.name = name
+        self.output = output
+        self.error = error
+        self.latency = latency
+        self.usage = usage
+
+    @property
+    def ok(self):
+        return self.error is None and self.output is not None
+
+
+class FanOutResult:
+    def __init__(self, results, wall_time, aggregate):
+        self.results = results
+        self.wall_time = wall_time
+        self.aggregate = aggregate
+
+    @property
+    def succeeded(self):
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def sequential_time(self):
+        # what the same calls would have cost one after another
+        return sum(result.latency for result in self.results)
+
+
+def normalise_answer(text):
+    return re.sub(r"[^\w\s]", "", text).strip().lower()
+
+
+class MajorityVote:
+    name = "Majority vote"
+
+    def __call__(self, results):
+        outputs = [result.output for result in results if result.ok]
+        if not outputs:
+            return None
+        counts = Counter(normalise_answer(output) for output in outputs)
+        winner, _ = counts.most_common(1)[0]
+        return next(output for output in outputs if normalise_answer(output) == winner)
+
+
+class Concatenate:
+    name = "Concatenation"
+
+    def __init__(self, separator="\n\n", headings=True):
+        self.separator = separator
+        self.headings = headings
+
+    def __call__(self, results):
+        parts = []
+        for result in results:
+            if not result.ok:
+                continue
+            parts.append(f"#### {result.name}\n{result.output}" if self.headings else result.output)
+        return self.separator.join(parts) if parts else None
+
+
+def agreement_score(result, results):
+    # self-consistency: the candidate sharing the most words with the others scores highest
+    words = set(normalise_answer(result.output).split())
+    others = [other for other in results if other is not result and other.ok]
+    if not words or not others:
+        return 0.0
+    overlaps = []
+    for other in others:
+        other_words = set(normalise_answer(other.output).split())
+        overlaps.append(len(words & other_words) / len(words | other_words))
+    return sum(overlaps) / len(overlaps)
+
+
+class BestOf:
+    name = "Best-of scorer"
+
+    def __init__(self, scorer=agreement_score):
+        self.scorer = scorer
+
+    def __call__(self, results):
+        candidates = [result for result in results if result.ok]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda result: self.scorer(result, results)).output
+
+
+AGGREGATORS = {
+    MajorityVote.name: MajorityVote,
+    Concatenate.name: Concatenate,
+    BestOf.name: BestOf,
+}
+
+
+class ParallelEngine:
+    DEFAULT_MODEL = "gpt-4o-mini"
+
+    def __init__(self, client, model=DEFAULT_MODEL, max_concurrency=5, timeout=30.0):
+        self.client = client
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+
+    async def complete(self, semaphore, name, messages, temperature):
+        async with semaphore:
+            with span("branch", branch=name):
+                start = time.perf_counter()
+                try:
+                    response = await asyncio.wait_for(
+                        self.client.chat.completions.create(
+                            model=self.model,
+                            messages=messages,
+                            temperature=temperature,
+                        ),
+                        timeout=self.timeout,
+                    )
+                except asyncio.TimeoutError:
+                    return BranchResult(name, error=f"timed out after {self.timeout}s",
+                                        latency=time.perf_counter() - start)
+                except Exception as error:
+                    return BranchResult(name, error=str(error), latency=time.perf_counter() - start)
+                return BranchResult(
+                    name,
+                    output=response.choices[0].message.content,
+                    latency=time.perf_counter() - start,
+                    usage=response.usage,
+                )
+
+    async def fan_out(self, branches, aggregator, temperature=0.0):
+        # branches is a list of (name, messages); failed or timed out branches are kept as partial results
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            self.complete(semaphore, name, messages, temperature) for name, messages in branches
+        ])
+        return FanOutResult(list(results), time.perf_counter() - start, aggregator(results))
+
+    async def section(self, task, sections, aggregator=None):
+        branches = [
+            (name, [{"role": "system", "content": instructions}, {"role": "user", "content": task}])
+            for name, instructions in sections
+        ]
+        return await self.fan_out(branches, aggregator or Concatenate())
+
+    async def vote(self, task, samples, instructions, aggregator=None, temperature=1.0):
+        messages = [{"role": "system", "content": instructions}, {"role": "user", "content": task}]
+        branches = [(f"Sample {index + 1}", messages) for index in range(samples)]
+        return await self.fan_out(branches, aggregator or MajorityVote(), temperature=temperature)
@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+from parallelisation import BestOf, BranchResult, Concatenate, MajorityVote, ParallelEngine
+
+
+class FakeCompletions:
+    def __init__(self, replies, delay=0.05):
+        self.replies = list(replies)
+        self.delay = delay
+
+    async def create(self, model, messages, temperature):
+        reply = self.replies.pop(0)
+        await asyncio.sleep(reply.get("delay", self.delay))
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        message = SimpleNamespace(content=reply["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def fake_client(replies, delay=0.05):
+    return SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(replies, delay)))
+
+
+def test_fan_out_runs_concurrently():
+    engine = ParallelEngine(fake_client([{"content": "4"}] * 6, delay=0.1), max_concurrency=6)
+    result = asyncio.run(engine.vote("2 + 2?", 6, "Answer only."))
+    assert result.aggregate == "4"
+    assert result.wall_time < 0.3
+    assert result.sequential_time >= 0.6
+
+
+def test_partial_results_survive_timeouts_and_errors():
+    replies = [{"content": "a"}, {"content": "b", "delay": 1.0}, {"error": "boom"}]
+    engine = ParallelEngine(fake_client(replies), timeout=0.2)
+    result = asyncio.run(engine.section("task", [("A", "x"), ("B", "y"), ("C", "z")]))
+    assert [branch.name for branch in result.succeeded] == ["A"]
+    assert "timed out" in result.failed[0].error
+    assert result.failed[1].error == "boom"
+    assert result.aggregate == "#### A\na"
+
+
+def test_aggregators():
+    results = [BranchResult("1", "Paris."), BranchResult("2", "paris"), BranchResult("3", "Lyon"),
+               BranchResult("4", error="timed out")]
+    assert MajorityVote()(results) == "Paris."
+    assert Concatenate(headings=False)(results) == "Paris.\n\nparis\n\nLyon"
+    assert BestOf(lambda result, _: len(result.output))(results) == "Paris."
@@ -0,0 +1,58 @@
+import pandas as pd
+import streamlit as st
+from rate_limiter import current_session
+from tracing import get_tracer
+
+
+def span_label(span):
+    detail = span.attributes.get("stage") or span.attributes.get("branch") or span.attributes.get("endpoint")
+    return "· " * span.depth + span.name + (f" {detail}" if detail else "")
+
+
+def waterfall_rows(spans):
+    # one bar per span, offset from the start of the turn; numbered so equal labels stay apart
+    origin = min(span.started for span in spans)
+    return pd.DataFrame([
+        {
+            "span": f"{index + 1:02d} {span_label(span)}",
+            "kind": span.name,
+            "start ms": round((span.started - origin) * 1000, 1),
+            "end ms": round((span.started - origin + span.duration) * 1000, 1),
+            "ttft ms": round(span.attributes["ttft"] * 1000, 1) if "ttft" in span.attributes else None,
+            "model": span.attributes.get("model"),
+            "tokens": span.attributes.get("prompt_tokens", 0) + span.attributes.get("completion_tokens", 0),
+            "status": span.attributes.get("error") or span.status,
+        }
+        for index, span in enumerate(spans)
+    ])
+
+
+WATERFALL_SPEC = {
+    "mark": {"type": "bar", "tooltip": True},
+    "encoding": {
+        "y": {"field": "span", "type": "nominal", "sort": None, "title": None},
+        "x": {"field": "start ms", "type": "quantitative", "title": "ms since the question"},
+        "x2": {"field": "end ms"},
+        "color": {"field": "kind", "type": "nominal", "legend": None},
+    },
+}
+
+
+def display_profiling_panel():
+    tracer = get_tracer()
+    with st.sidebar.expander("Profiling"):
+        spans = tracer.latest_trace(current_session())
+        root = next((span for span in spans if span.parent_id is None), None)
+        if root is None:
+            st.caption("No turns traced in this session yet.")
+        else:
+            st.caption(
+                f"Last turn took {root.duration:.2f}s, first token after {root.attributes['ttft']:.2f}s, "
+                f"{root.attributes['calls']} call(s), {root.attributes['tokens']} token(s), "
+                f"{root.attributes['cache_hits']} cache hit(s), {root.attributes['retries']} retry(s)."
+            )
+            st.vega_lite_chart(waterfall_rows(spans), WATERFALL_SPEC)
+        aggregates = tracer.aggregates()
+        if aggregates:
+            st.write("**Recent turns by page**")
+            st.dataframe(pd.DataFrame.from_dict(aggregates, orient="index"))
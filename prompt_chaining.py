@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import json
+import time
+from tracing import span
+
+
+class GateFailed(Exception):
+    pass
+
+
+# A gate looks at a stage's output so far and returns the text to hand downstream once it is
+# satisfied, or None to keep waiting. It must return the same text for a prefix and for the
+# full output, otherwise downstream cache keys would change between runs.
+def when_complete(text, done):
+    return text if done else None
+
+
+def until_marker(marker):
+    def gate(text, done):
+        if marker in text:
+            return text.split(marker, 1)[0].strip()
+        return text if done else None
+    return gate
+
+
+def must_contain(keyword):
+    def gate(text, done):
+        if not done:
+            return None
+        return text if keyword.lower() in text.lower() else None
+    return gate
+
+
+class Stage:
+    DEFAULT_MODEL = "gpt-4o-mini"
+
+    def __init__(self, name, template, model=DEFAULT_MODEL, temperature=0.0, gate=when_complete):
+        self.name = name
+        self.template = template
+        self.model = model
+        self.temperature = temperature
+        self.gate = gate
+
+    def render(self, inputs):
+        return self.template.format(**inputs)
+
+
+class StageResult:
+    def __init__(self, stage, prompt, output, cached, latency, first_token_latency):
+        self.stage = stage
+        self.prompt = prompt
+        self.output = output
+        self.cached = cached
+        self.latency = latency
+        self.first_token_latency = first_token_latency
+
+
+class StageCache:
+    def __init__(self, store=None):
+        self.store = {} if store is None else store
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, stage, prompt):
+        payload = json.dumps({
+            "template": stage.template,
+            "prompt": prompt,
+            "model": stage.model,
+            "params": {"temperature": stage.temperature},
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        output = self.store.get(key)
+        if output is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return output
+
+    def set(self, key, output):
+        self.store[key] = output
+
+
+class ChainExecutor:
+    def __init__(self, client, cache=None, on_delta=None):
+        self.client = client
+        self.cache = cache or StageCache()
+        self.on_delta = on_delta or (lambda index, text: None)
+
+    def offer(self, stage, gate_future, text, done):
+        if gate_future.done():
+            return
+        passed = stage.gate(text, done)
+        if passed is not None:
+            gate_future.set_result(passed)
+        elif done:
+            gate_future.set_exception(GateFailed(f"Stage '{stage.name}' did not pass its gate."))
+
+    async def run_stage(self, index, stage, user_input, upstream, gate_future):
+        try:
+            return await self.execute_stage(index, stage, user_input, upstream, gate_future)
+        except Exception as error:
+            # fail the gate too so downstream stages stop waiting on this one
+            if not gate_future.done():
+                gate_future.set_exception(error)
+            raise
+
+    async def execute_stage(self, index, stage, user_input, upstream, gate_future):
+        previous = await upstream
+        # the span starts once the gate opens, so waiting on the previous stage is not counted
+        with span("stage", stage=stage.name) as current:
+            prompt = stage.render({"input": user_input, "previous": previous})
+            key = self.cache.key(stage, prompt)
+            start = time.perf_counter()
+            cached = self.cache.get(key)
+            if cached is not None:
+                current.set(cache_hit=True)
+                self.on_delta(index, cached)
+                self.offer(stage, gate_future, cached, True)
+                return StageResult(stage, prompt, cached, True, 0.0, 0.0)
+
+            text = ""
+            first_token_latency = None
+            stream = await self.client.chat.completions.create(
+                model=stage.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=stage.temperature,
+                stream=True,
+            )
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if first_token_latency is None:
+                    first_token_latency = time.perf_counter() - start
+                text += delta
+                self.on_delta(index, text)
+                # downstream may start here, before this stage has finished streaming
+                self.offer(stage, gate_future, text, False)
+            self.cache.set(key, text)
+            self.offer(stage, gate_future, text, True)
+            return StageResult(stage, prompt, text, False, time.perf_counter() - start, first_token_latency)
+
+    async def run(self, stages, user_input):
+        loop = asyncio.get_running_loop()
+        gates = [loop.create_future() for _ in stages]
+        start = loop.create_future()
+        start.set_result(user_input)
+        upstreams = [start] + gates[:-1]
+        results = await asyncio.gather(*[
+            self.run_stage(index, stage, user_input, upstreams[index], gates[index])
+            for index, stage in enumerate(stages)
+        ], return_exceptions=True)
+        for gate in gates:
+            # nobody awaits the last gate, and later gates fail with their upstream
+            if gate.done() and not gate.cancelled():
+                gate.exception()
+        return results
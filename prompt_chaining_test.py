@@ -0,0 +1,79 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from prompt_chaining import (ChainExecutor, GateFailed, Stage, StageCache, must_contain, until_marker,
+                             when_complete)
+
+
+class FakeCompletions:
+    # streams the reply for each prompt word by word, noting when each stream started and ended
+    def __init__(self, replies, delay=0.02):
+        self.replies = replies
+        self.delay = delay
+        self.started = {}
+        self.finished = {}
+
+    async def create(self, model, messages, temperature, stream):
+        prompt = messages[-1]["content"]
+        self.started[prompt] = time.perf_counter()
+        reply = self.replies[prompt]
+
+        async def chunks():
+            for word in reply.split(" "):
+                await asyncio.sleep(self.delay)
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))])
+            self.finished[prompt] = time.perf_counter()
+        return chunks()
+
+
+def fake_client(replies, delay=0.02):
+    return SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(replies, delay)))
+
+
+def test_gates_pass_on_the_right_prefix():
+    gate = until_marker("END")
+    assert gate("concept one", False) is None
+    assert gate("concept one END", False) == "concept one"
+    assert gate("concept one END and more", True) == "concept one"
+    assert gate("no marker", True) == "no marker"
+    assert when_complete("partial", False) is None and when_complete("full", True) == "full"
+    assert must_contain("derivative")("the Derivative is", False) is None
+    assert must_contain("derivative")("the Derivative is", True) == "the Derivative is"
+    assert must_contain("derivative")("something else", True) is None
+
+
+def test_downstream_starts_before_upstream_finishes():
+    stages = [Stage("Outline", "{input}", gate=until_marker("END")), Stage("Draft", "Draft from: {previous}")]
+    client = fake_client({
+        "question": "limits slopes END " + "padding " * 10,
+        "Draft from: limits slopes": "the answer",
+    })
+    results = asyncio.run(ChainExecutor(client).run(stages, "question"))
+    completions = client.chat.completions
+    assert results[0].output.startswith("limits slopes END padding") and results[1].output == "the answer "
+    # the draft's prompt holds only the gated prefix, and it was sent while the outline still streamed
+    assert completions.started["Draft from: limits slopes"] < completions.finished["question"]
+
+
+def test_a_failed_gate_stops_downstream_stages():
+    stages = [Stage("Check", "{input}", gate=must_contain("derivative")), Stage("Next", "{previous}")]
+    results = asyncio.run(ChainExecutor(fake_client({"question": "no match here"})).run(stages, "question"))
+    assert results[0].output == "no match here " and isinstance(results[1], GateFailed)
+
+
+def test_cache_reuses_only_identical_stages():
+    cache = StageCache()
+    stage = Stage("Outline", "{input}")
+    key = cache.key(stage, "question")
+    assert cache.key(Stage("Renamed", "{input}"), "question") == key
+    assert cache.key(stage, "other question") != key
+    assert cache.key(Stage("Outline", "{input}", model="gpt-4o"), "question") != key
+    assert cache.key(Stage("Outline", "Q: {input}"), "question") != key
+    assert cache.key(Stage("Outline", "{input}", temperature=0.7), "question") != key
+
+    client = fake_client({"question": "answer"})
+    executor = ChainExecutor(client, cache)
+    asyncio.run(executor.run([stage], "question"))
+    client.chat.completions.started.clear()
+    results = asyncio.run(executor.run([stage], "question"))
+    assert results[0].cached and results[0].output == "answer " and not client.chat.completions.started
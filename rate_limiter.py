@@ -0,0 +1,371 @@
+import asyncio
+import contextvars
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+import httpx
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200000
+DEFAULT_COMPLETION_TOKENS = 512
+WAIT_INTERVAL = 0.02
+
+# Requests made off the script thread (run service workers, the shared event loop) carry
+# the session they were made for in this variable, so fairness still sees who asked.
+SESSION = contextvars.ContextVar("rate_limit_session", default=None)
+
+
+def current_session():
+    session = SESSION.get()
+    if session is None:
+        ctx = get_script_run_ctx()
+        session = ctx.session_id if ctx is not None else "anonymous"
+    return session
+
+
+def request_cost(request):
+    # which model's limits a request counts against, and roughly how many tokens it will use
+    if "json" not in request.headers.get("content-type", ""):
+        return "default", 0
+    try:
+        body = json.loads(request.content)
+    except ValueError:
+        return "default", 0
+    completion_tokens = body.get("max_completion_tokens") or body.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return body.get("model") or "default", len(request.content) // 4 + completion_tokens
+
+
+def limits_key(request):
+    # An API key's limits are its own, so one student's 429s don't slow anyone else. The key
+    # is only kept as a hash, together with the host so a proxy or mock is told apart.
+    model, tokens = request_cost(request)
+    authorization = f"{request.url.host} {request.headers.get('authorization', '')}"
+    return (hashlib.sha256(authorization.encode("utf-8")).hexdigest()[:12], model), tokens
+
+
+def retry_delay(attempt, headers, base=0.5, cap=20.0):
+    if headers.get("retry-after-ms"):
+        return float(headers["retry-after-ms"]) / 1000
+    if headers.get("retry-after", "").replace(".", "", 1).isdigit():
+        return float(headers["retry-after"])
+    # full jitter keeps sessions that were throttled together from retrying together
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.ceiling = None
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def time_until(self, amount, now):
+        self.refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) * 60 / self.capacity
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def observe(self, limit, remaining, now):
+        # the server's view is authoritative; it also counts other processes using the key
+        self.refill(now)
+        if limit:
+            self.capacity = min(float(limit), self.ceiling or float(limit))
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+
+    def cap(self, ceiling):
+        # never uses more than ceiling per minute, whatever the server allows
+        self.ceiling = float(ceiling)
+        self.capacity = min(self.capacity, self.ceiling)
+        self.level = min(self.level, self.ceiling)
+
+
+class ModelLimits:
+    def __init__(self, initial_concurrency, max_concurrency):
+        self.requests = TokenBucket(DEFAULT_REQUESTS_PER_MINUTE)
+        self.tokens = TokenBucket(DEFAULT_TOKENS_PER_MINUTE)
+        self.concurrency = float(initial_concurrency)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.throttled = 0
+
+    def cap(self, requests_per_minute=None, tokens_per_minute=None):
+        if requests_per_minute:
+            self.requests.cap(requests_per_minute)
+        if tokens_per_minute:
+            self.tokens.cap(tokens_per_minute)
+
+    def succeeded(self):
+        # additive increase: roughly one more slot per window of successful requests
+        self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+
+    def throttle(self):
+        # multiplicative decrease on a 429
+        self.concurrency = max(1.0, self.concurrency / 2)
+        self.throttled += 1
+
+
+class RateLimiter:
+    # Shared by every client in the process. Limits belong to an API key and model, so each
+    # (account, model) key has its own buckets, and a request waits until its key has a free
+    # concurrency slot and enough request and token budget. When several are waiting, the
+    # session with the fewest requests in flight goes first, then the one served least
+    # recently, so a session's 20-way fan-out takes turns with a single question rather
+    # than queueing ahead of it.
+    def __init__(self, initial_concurrency=8, max_concurrency=64):
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.buckets = {}
+        self.sessions = Counter()
+        self.last_served = {}
+        self.waiting = {}
+        self.tickets = itertools.count()
+        self.ceilings = (None, None)
+        self.lock = threading.Lock()
+
+    def limits(self, key):
+        if key not in self.buckets:
+            self.buckets[key] = ModelLimits(self.initial_concurrency, self.max_concurrency)
+            self.buckets[key].cap(*self.ceilings)
+        return self.buckets[key]
+
+    def cap(self, requests_per_minute=None, tokens_per_minute=None):
+        # Limits are per API key, but each process only sees its own requests. A process
+        # sharing the key with another, such as a bulk run beside the app, can stay under a
+        # share of the key's limits so the other still gets through.
+        with self.lock:
+            self.ceilings = (requests_per_minute, tokens_per_minute)
+            for limits in self.buckets.values():
+                limits.cap(requests_per_minute, tokens_per_minute)
+
+    def ticket(self, session, key):
+        ticket = next(self.tickets)
+        with self.lock:
+            self.waiting[ticket] = (session, key)
+        return ticket
+
+    def try_acquire(self, ticket, session, key, tokens):
+        # returns 0 once the request may go, otherwise how long to wait before asking again
+        with self.lock:
+            limits = self.limits(key)
+            rivals = [self.priority(other, order) for order, (other, rival_key) in self.waiting.items()
+                      if rival_key == key]
+            if min(rivals) != self.priority(session, ticket):
+                return WAIT_INTERVAL
+            if limits.in_flight >= int(limits.concurrency):
+                return WAIT_INTERVAL
+            now = time.monotonic()
+            wait = max(limits.requests.time_until(1, now), limits.tokens.time_until(tokens, now))
+            if wait > 0:
+                return wait
+            limits.requests.take(1)
+            limits.tokens.take(tokens)
+            limits.in_flight += 1
+            self.sessions[session] += 1
+            self.last_served[session] = ticket
+            del self.waiting[ticket]
+            return 0
+
+    def priority(self, session, ticket):
+        return self.sessions[session], self.last_served.get(session, -1), ticket
+
+    def abandon(self, ticket):
+        with self.lock:
+            self.waiting.pop(ticket, None)
+
+    def release(self, session, key, status=None, headers=None):
+        with self.lock:
+            limits = self.limits(key)
+            limits.in_flight -= 1
+            self.sessions[session] -= 1
+            if self.sessions[session] <= 0:
+                del self.sessions[session]
+                if all(other != session for other, _ in self.waiting.values()):
+                    self.last_served.pop(session, None)
+            if status == 429:
+                limits.throttle()
+            elif status is not None and status < 400:
+                limits.succeeded()
+            if headers is not None:
+                self.observe(limits, headers)
+
+    def observe(self, limits, headers):
+        now = time.monotonic()
+        for bucket, kind in ((limits.requests, "requests"), (limits.tokens, "tokens")):
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if limit or remaining:
+                bucket.observe(limit and float(limit), remaining and float(remaining), now)
+
+    def stats(self):
+        with self.lock:
+            return {
+                f"{key[1]} ({key[0]})": {
+                    "concurrency": round(limits.concurrency, 1),
+                    "in flight": limits.in_flight,
+                    "throttled": limits.throttled,
+                    "requests left": int(limits.requests.level),
+                    "tokens left": int(limits.tokens.level),
+                }
+                for key, limits in self.buckets.items()
+            }
+
+
+class ReleasingStream(httpx.SyncByteStream):
+    # Gives the request's slot back once its body has been read or abandoned, so a streamed
+    # completion counts as in flight for as long as the connection is busy with it.
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+
+    def __iter__(self):
+        yield from self.stream
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.release()
+
+
+class AsyncReleasingStream(ReleasingStream, httpx.AsyncByteStream):
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self.release()
+
+
+def hold_until_closed(response, limiter, session, key, asynchronous=False):
+    released = []
+
+    def release():
+        if not released:
+            released.append(True)
+            limiter.release(session, key, response.status_code, response.headers)
+
+    if response.is_closed:
+        # the body was read up front, as in-memory transports do
+        release()
+    else:
+        response.stream = (AsyncReleasingStream if asynchronous else ReleasingStream)(response.stream, release)
+    return response
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    def __init__(self, transport, limiter, max_retries=5):
+        self.transport = transport
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    def acquire(self, session, key, tokens):
+        # returns how long the request queued for its slot
+        started = time.monotonic()
+        ticket = self.limiter.ticket(session, key)
+        try:
+            while wait := self.limiter.try_acquire(ticket, session, key, tokens):
+                time.sleep(wait)
+        finally:
+            self.limiter.abandon(ticket)
+        return time.monotonic() - started
+
+    def handle_request(self, request):
+        request.read()  # so the body can be sent again on a retry
+        key, tokens = limits_key(request)
+        session = current_session()
+        queued = 0.0
+        for attempt in range(self.max_retries + 1):
+            queued += self.acquire(session, key, tokens)
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                self.limiter.release(session, key)
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(retry_delay(attempt, {}))
+                continue
+            except BaseException:
+                self.limiter.release(session, key)
+                raise
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                # read by the tracing transport
+                response.extensions["retries"] = attempt
+                response.extensions["queued"] = queued
+                return hold_until_closed(response, self.limiter, session, key)
+            self.limiter.release(session, key, response.status_code, response.headers)
+            response.close()
+            time.sleep(retry_delay(attempt, response.headers))
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport, limiter, max_retries=5):
+        self.transport = transport
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    async def acquire(self, session, key, tokens):
+        started = time.monotonic()
+        ticket = self.limiter.ticket(session, key)
+        try:
+            while wait := self.limiter.try_acquire(ticket, session, key, tokens):
+                await asyncio.sleep(wait)
+        finally:
+            self.limiter.abandon(ticket)
+        return time.monotonic() - started
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        key, tokens = limits_key(request)
+        session = current_session()
+        queued = 0.0
+        for attempt in range(self.max_retries + 1):
+            queued += await self.acquire(session, key, tokens)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError:
+                self.limiter.release(session, key)
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(retry_delay(attempt, {}))
+                continue
+            except BaseException:
+                # a cancelled task must still give its slot back
+                self.limiter.release(session, key)
+                raise
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                # read by the tracing transport
+                response.extensions["retries"] = attempt
+                response.extensions["queued"] = queued
+                return hold_until_closed(response, self.limiter, session, key, asynchronous=True)
+            self.limiter.release(session, key, response.status_code, response.headers)
+            await response.aclose()
+            await asyncio.sleep(retry_delay(attempt, response.headers))
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+@st.cache_resource(show_spinner=False)
+def get_rate_limiter():
+    return RateLimiter()
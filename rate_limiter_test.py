@@ -0,0 +1,103 @@
+import json
+import httpx
+from rate_limiter import RateLimiter, RateLimitedTransport, limits_key
+
+
+def completion_request(model="gpt-4o-mini", api_key="sk-one"):
+    return httpx.Request("POST", "https://api.openai.com/v1/chat/completions", headers={"authorization": f"Bearer {api_key}"},
+                         json={"model": model, "messages": [{"role": "user", "content": "hi"}], "max_tokens": 10})
+
+
+def model_limits(limiter, model, api_key="sk-one"):
+    return limiter.limits(limits_key(completion_request(model, api_key))[0])
+
+
+def model_stats(limiter, model, api_key="sk-one"):
+    account, model = limits_key(completion_request(model, api_key))[0]
+    return limiter.stats()[f"{model} ({account})"]
+
+
+def test_retries_throttled_requests_and_reads_quota_headers():
+    statuses = [429, 503, 200]
+
+    def handler(request):
+        status = statuses.pop(0)
+        headers = {"retry-after-ms": "1", "x-ratelimit-limit-requests": "60", "x-ratelimit-remaining-requests": "5"}
+        return httpx.Response(status, headers=headers, json={"ok": status == 200})
+
+    limiter = RateLimiter(initial_concurrency=8)
+    client = httpx.Client(transport=RateLimitedTransport(httpx.MockTransport(handler), limiter))
+    response = client.send(completion_request())
+
+    assert response.status_code == 200 and json.loads(response.content) == {"ok": True}
+    stats = model_stats(limiter, "gpt-4o-mini")
+    assert stats["throttled"] == 1 and stats["in flight"] == 0
+    assert stats["concurrency"] < 8 and stats["requests left"] <= 5
+    assert model_limits(limiter, "gpt-4o-mini").requests.capacity == 60
+
+
+def test_each_api_key_has_its_own_limits():
+    def handler(request):
+        if request.headers["authorization"] == "Bearer sk-one":
+            return httpx.Response(429, headers={"retry-after-ms": "1", "x-ratelimit-remaining-requests": "0"})
+        return httpx.Response(200)
+
+    limiter = RateLimiter(initial_concurrency=8)
+    client = httpx.Client(transport=RateLimitedTransport(httpx.MockTransport(handler), limiter, max_retries=0))
+    client.send(completion_request(api_key="sk-one"))
+    client.send(completion_request(api_key="sk-two"))
+    assert model_stats(limiter, "gpt-4o-mini", "sk-one")["throttled"] == 1
+    two = model_stats(limiter, "gpt-4o-mini", "sk-two")
+    assert two["throttled"] == 0 and two["concurrency"] >= 8 and two["requests left"] > 0
+    assert all("sk-" not in key for key in limiter.stats())
+
+
+def test_a_capped_limiter_stays_under_its_share_of_the_key():
+    def handler(request):
+        return httpx.Response(200, headers={"x-ratelimit-limit-requests": "500", "x-ratelimit-limit-tokens": "200000"})
+
+    limiter = RateLimiter()
+    client = httpx.Client(transport=RateLimitedTransport(httpx.MockTransport(handler), limiter))
+    client.send(completion_request())
+    limiter.cap(requests_per_minute=100, tokens_per_minute=50000)
+    client.send(completion_request("gpt-4o"))
+    for model in ("gpt-4o-mini", "gpt-4o"):
+        limits = model_limits(limiter, model)
+        # the server's larger limits don't lift the cap
+        assert limits.requests.capacity == 100 and limits.tokens.capacity == 50000
+        assert model_stats(limiter, model)["requests left"] <= 100
+
+
+def test_least_busy_session_goes_first():
+    limiter = RateLimiter(initial_concurrency=1)
+    assert limiter.try_acquire(limiter.ticket("fan-out", "gpt-4o-mini"), "fan-out", "gpt-4o-mini", 10) == 0
+    waiting = [("fan-out", limiter.ticket("fan-out", "gpt-4o-mini")) for _ in range(3)]
+    waiting.append(("single", limiter.ticket("single", "gpt-4o-mini")))
+    # the only slot is taken, so nobody else may go
+    assert all(limiter.try_acquire(ticket, session, "gpt-4o-mini", 10) for session, ticket in waiting)
+
+    granted = []
+    while waiting:
+        limiter.release(granted[-1] if granted else "fan-out", "gpt-4o-mini")
+        ready = [(session, ticket) for session, ticket in waiting
+                 if limiter.try_acquire(ticket, session, "gpt-4o-mini", 10) == 0]
+        assert len(ready) == 1
+        granted.append(ready[0][0])
+        waiting.remove(ready[0])
+
+    # the single question overtakes the fan-out's queued requests
+    assert granted == ["single", "fan-out", "fan-out", "fan-out"]
+
+
+def test_a_streamed_response_holds_its_slot_until_closed():
+    limiter = RateLimiter(initial_concurrency=1)
+
+    def handler(request):
+        return httpx.Response(200, stream=httpx.ByteStream(b"data: chunk\n\n"))
+
+    client = httpx.Client(transport=RateLimitedTransport(httpx.MockTransport(handler), limiter))
+    response = client.send(completion_request(), stream=True)
+    assert model_stats(limiter, "gpt-4o-mini")["in flight"] == 1
+    response.read()
+    response.close()
+    assert model_stats(limiter, "gpt-4o-mini")["in flight"] == 0
@@ -0,0 +1,239 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+import httpx
+import streamlit as st
+
+
+DEFAULT_PATH = os.path.join(".cache", "recordings", "traffic.jsonl.gz")
+# headers the client reads; the rest of a recorded response's headers are dropped
+KEPT_HEADERS = ("content-type", "content-encoding", "openai-poll-after-ms", "retry-after", "retry-after-ms", "x-request-id")
+
+
+class RecordingMissing(LookupError):
+    pass
+
+
+def open_log(path, mode):
+    # .gz logs are compressed; anything else is plain JSONL
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    return gzip.open(path, mode + "t", encoding="utf-8") if path.endswith(".gz") else open(path, mode, encoding="utf-8")
+
+
+def request_key(request):
+    # The host is left out so traffic recorded against the API replays under any base URL.
+    # JSON bodies are compared with their keys sorted, and a multipart body without its
+    # random boundary.
+    content = request.content
+    content_type = request.headers.get("content-type", "")
+    if "json" in content_type and content:
+        try:
+            content = json.dumps(json.loads(content), sort_keys=True).encode()
+        except ValueError:
+            pass
+    elif "boundary=" in content_type:
+        content = content.replace(content_type.split("boundary=", 1)[1].encode(), b"BOUNDARY")
+    query = "&".join(sorted(request.url.query.decode().split("&"))) if request.url.query else ""
+    digest = hashlib.sha256(content).hexdigest()[:32]
+    return f"{request.method} {request.url.path}?{query} {digest}"
+
+
+def encode_chunk(chunk):
+    try:
+        return {"text": chunk.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(chunk).decode("ascii")}
+
+
+def decode_chunk(chunk):
+    return chunk["text"].encode("utf-8") if "text" in chunk else base64.b64decode(chunk["base64"])
+
+
+class Recorder:
+    # Appends one line per exchange: the request's key and summary, the response status
+    # and headers, and each body chunk with the seconds since the previous one arrived.
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open_log(path, "a")
+
+    def write(self, request, response, chunks):
+        entry = {
+            "key": request_key(request),
+            "method": request.method,
+            "url": str(request.url),
+            "status": response.status_code,
+            "headers": {name: value for name, value in response.headers.items() if name in KEPT_HEADERS},
+            "chunks": [{"delay": round(delay, 4), **encode_chunk(chunk)} for delay, chunk in chunks],
+        }
+        with self.lock:
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class RecordingStream(httpx.SyncByteStream):
+    def __init__(self, stream, recorder, request, response, started):
+        self.stream = stream
+        self.recorder = recorder
+        self.request = request
+        self.response = response
+        self.last = started
+        self.chunks = []
+
+    def capture(self, chunk):
+        now = time.monotonic()
+        self.chunks.append((now - self.last, chunk))
+        self.last = now
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self.capture(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.recorder.write(self.request, self.response, self.chunks)
+
+
+class AsyncRecordingStream(RecordingStream, httpx.AsyncByteStream):
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.capture(chunk)
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self.recorder.write(self.request, self.response, self.chunks)
+
+
+class RecordingTransport(httpx.BaseTransport):
+    # Sits next to the network, so every attempt, retries included, is recorded as sent.
+    def __init__(self, transport, recorder):
+        self.transport = transport
+        self.recorder = recorder
+
+    def handle_request(self, request):
+        request.read()
+        started = time.monotonic()
+        response = self.transport.handle_request(request)
+        response.stream = RecordingStream(response.stream, self.recorder, request, response, started)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport, recorder):
+        self.transport = transport
+        self.recorder = recorder
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        started = time.monotonic()
+        response = await self.transport.handle_async_request(request)
+        response.stream = AsyncRecordingStream(response.stream, self.recorder, request, response, started)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class Recording:
+    # Recorded exchanges by request key, served in the order they were recorded. A key
+    # asked for more often than it was recorded (a run polled once more than last time)
+    # gets its last response again.
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.exchanges = {}
+        self.lock = threading.Lock()
+        with open_log(path, "r") as file:
+            try:
+                for line in file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.exchanges.setdefault(entry["key"], deque()).append(entry)
+            except (EOFError, json.JSONDecodeError):
+                # the recorder was still writing, or stopped mid-line; keep what is complete
+                pass
+
+    def next(self, request):
+        key = request_key(request)
+        with self.lock:
+            queue = self.exchanges.get(key)
+            if not queue:
+                raise RecordingMissing(f"No recorded response for {request.method} {request.url.path} in {self.path}")
+            return queue.popleft() if len(queue) > 1 else queue[0]
+
+
+class ReplayStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    # speed scales the recorded gaps between chunks: 1 replays in real time, 10 ten
+    # times faster, and 0 sends everything at once
+    def __init__(self, chunks, speed):
+        self.chunks = chunks
+        self.speed = speed
+
+    def delay(self, chunk):
+        return chunk["delay"] / self.speed if self.speed else 0
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            time.sleep(self.delay(chunk))
+            yield decode_chunk(chunk)
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(self.delay(chunk))
+            yield decode_chunk(chunk)
+
+
+def replay_response(recording, request, speed):
+    entry = recording.next(request)
+    return httpx.Response(entry["status"], headers=entry["headers"], stream=ReplayStream(entry["chunks"], speed),
+                          request=request)
+
+
+class ReplayTransport(httpx.BaseTransport):
+    # Stands in for the network: nothing leaves the process and no tokens are spent.
+    def __init__(self, recording, speed=1.0):
+        self.recording = recording
+        self.speed = speed
+
+    def handle_request(self, request):
+        request.read()
+        return replay_response(self.recording, request, self.speed)
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, recording, speed=1.0):
+        self.recording = recording
+        self.speed = speed
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        return replay_response(self.recording, request, self.speed)
+
+
+@st.cache_resource(show_spinner=False)
+def get_recorder(path):
+    return Recorder(path)
+
+
+@st.cache_resource(show_spinner=False)
+def get_recording(path):
+    return Recording(path)
@@ -0,0 +1,43 @@
+import pytest
+from benchmark import PAGES, answer, cold_caches, start_session
+from clients import get_client
+from mock_openai import MockConfig, MockOpenAIServer
+from recording import RecordingMissing, get_recorder
+
+
+def ask(page, base_url, questions):
+    at = start_session(PAGES[page], base_url)
+    for question in questions:
+        answer(at, question)
+    assert not at.exception, at.exception
+    return [message["content"] for message in at.session_state["messages"]]
+
+
+@pytest.mark.parametrize("page", ["Prompt chaining", "Orchestrator-workers"])
+def test_replays_recorded_pages_without_the_network(page, tmp_path, monkeypatch):
+    path = str(tmp_path / "traffic.jsonl.gz")
+    questions = ["What is a derivative?", "Why does the chain rule work?"]
+    monkeypatch.setenv("OPENAI_RECORD", path)
+    with cold_caches(), MockOpenAIServer(MockConfig(latency=0.01, tokens_per_second=2000)) as server:
+        recorded = ask(page, server.base_url, questions)
+        calls = len(server.state.requests)
+        get_recorder(path).close()
+    base_url = server.base_url
+
+    monkeypatch.delenv("OPENAI_RECORD")
+    monkeypatch.setenv("OPENAI_REPLAY", path)
+    monkeypatch.setenv("OPENAI_REPLAY_SPEED", "0")
+    # the server has stopped, so every answer has to come from the recording
+    with cold_caches():
+        assert ask(page, base_url, questions) == recorded
+    assert calls > 0
+
+
+def test_unrecorded_requests_fail_loudly(tmp_path, monkeypatch):
+    path = tmp_path / "empty.jsonl"
+    path.write_text("")
+    monkeypatch.setenv("OPENAI_REPLAY", str(path))
+    with cold_caches():
+        client = get_client("replay-key", "http://127.0.0.1:9/v1")
+        with pytest.raises(RecordingMissing):
+            client.embeddings.create(model="text-embedding-3-small", input="hi")
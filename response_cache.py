@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+import streamlit as st
+from openai.types.chat import ChatCompletion
+from openai.types.completion_usage import CompletionUsage
+from tracing import span
+
+
+DEFAULT_PATH = os.path.join(".cache", "responses.sqlite")
+
+
+def normalise_messages(messages):
+    # only line endings and surrounding whitespace are ignored; inside a message, layout can matter (code, indentation)
+    return [
+        {"role": message["role"], "content": str(message["content"]).replace("\r\n", "\n").strip()}
+        for message in messages
+    ]
+
+
+class ResponseCache:
+    # Exact-match cache for model responses with an in-process LRU in front of SQLite.
+    # Requests sampled above max_temperature are never cached, so callers that want
+    # diverse samples (voting, candidate generation) always reach the model.
+    def __init__(self, path=DEFAULT_PATH, memory_entries=512, ttl=7 * 24 * 3600,
+                 max_disk_bytes=64 * 1024 * 1024, max_temperature=0.0):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self.max_temperature = max_temperature
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.connection.commit()
+
+    def key(self, model, instructions, messages, params=None):
+        payload = json.dumps({
+            "model": model,
+            "instructions": instructions or "",
+            "messages": normalise_messages(messages),
+            "params": params or {},
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def cacheable(self, params, max_temperature=None):
+        # the API samples at temperature 1 when none is given
+        temperature = params.get("temperature")
+        temperature = 1.0 if temperature is None else temperature
+        limit = self.max_temperature if max_temperature is None else max_temperature
+        if temperature > limit or params.get("n", 1) != 1:
+            self.bypassed += 1
+            return False
+        return True
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self.memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self.memory[key]
+
+            row = self.connection.execute(
+                "SELECT value, expires FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                if row is not None:
+                    self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self.connection.commit()
+                self.misses += 1
+                return None
+            value, expires = row
+            self.connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+            self.remember(key, expires, value)
+            self.disk_hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        size = len(value.encode("utf-8"))
+        with self.lock:
+            self.remember(key, expires, value)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, expires, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, expires, now),
+            )
+            self.evict_disk(now)
+            self.connection.commit()
+
+    def remember(self, key, expires, value):
+        self.memory[key] = (expires, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def evict_disk(self, now):
+        self.connection.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        # drop least recently used rows until we are back under the limit
+        for key, size in self.connection.execute(
+            "SELECT key, size FROM responses ORDER BY last_used ASC"
+        ).fetchall():
+            if total <= self.max_disk_bytes:
+                break
+            self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.memory.pop(key, None)
+            total -= size
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.connection.execute("DELETE FROM responses")
+            self.connection.commit()
+
+    def stats(self):
+        with self.lock:
+            entries, disk_bytes = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "memory hits": self.memory_hits,
+            "disk hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit rate": round(hits / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "bytes stored": disk_bytes,
+            "memory entries": len(self.memory),
+        }
+
+
+def completion_params(kwargs):
+    return {key: value for key, value in kwargs.items() if key not in ("model", "messages")}
+
+
+def from_cache(value):
+    response = ChatCompletion.model_validate_json(value)
+    # a cached answer costs nothing, so do not report the original call's usage again
+    response.usage = CompletionUsage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+    return response
+
+
+class CachedCompletions:
+    def __init__(self, completions, cache):
+        self.completions = completions
+        self.cache = cache
+
+    def create(self, **kwargs):
+        if kwargs.get("stream") or not self.cache.cacheable(kwargs):
+            return self.completions.create(**kwargs)
+        key = self.cache.key(kwargs["model"], None, kwargs["messages"], completion_params(kwargs))
+        value = self.cache.get(key)
+        if value is not None:
+            with span("cache", model=kwargs["model"], cache_hit=True):
+                return from_cache(value)
+        response = self.completions.create(**kwargs)
+        self.cache.set(key, response.model_dump_json())
+        return response
+
+
+class AsyncCachedCompletions(CachedCompletions):
+    async def create(self, **kwargs):
+        if kwargs.get("stream") or not self.cache.cacheable(kwargs):
+            return await self.completions.create(**kwargs)
+        key = self.cache.key(kwargs["model"], None, kwargs["messages"], completion_params(kwargs))
+        value = self.cache.get(key)
+        if value is not None:
+            with span("cache", model=kwargs["model"], cache_hit=True):
+                return from_cache(value)
+        response = await self.completions.create(**kwargs)
+        self.cache.set(key, response.model_dump_json())
+        return response
+
+
+class CachedClient:
+    # Drop-in wrapper for OpenAI/AsyncOpenAI that serves chat completions from the cache.
+    def __init__(self, client, cache, asynchronous=False):
+        self.client = client
+        completions_class = AsyncCachedCompletions if asynchronous else CachedCompletions
+        self.chat = SimpleNamespace(completions=completions_class(client.chat.completions, cache))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache():
+    return ResponseCache()
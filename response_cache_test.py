@@ -0,0 +1,48 @@
+import time
+from response_cache import ResponseCache
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    cache = ResponseCache(path, memory_entries=1)
+    first = cache.key("gpt-4o-mini", "tutor", [{"role": "user", "content": "What is a derivative?"}])
+    second = cache.key("gpt-4o-mini", "tutor", [{"role": "user", "content": "What is an integral?"}])
+    cache.set(first, "rate of change")
+    cache.set(second, "area under a curve")
+
+    assert cache.get(second) == "area under a curve"
+    assert cache.get(first) == "rate of change"
+    assert cache.memory_hits == 1 and cache.disk_hits == 1
+
+    reopened = ResponseCache(path)
+    assert reopened.get(first) == "rate of change"
+    assert cache.key("gpt-4o-mini", "tutor", [{"role": "user", "content": " What is a derivative?\r\n"}]) == first
+
+
+def test_layout_inside_a_message_is_part_of_the_key(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    nested = "Why does this fail?\nfor x in xs:\n    if x:\n        print(x)"
+    flat = "Why does this fail?\nfor x in xs:\n    if x:\n    print(x)"
+    assert cache.key("gpt-4o-mini", "tutor", [{"role": "user", "content": nested}]) != \
+        cache.key("gpt-4o-mini", "tutor", [{"role": "user", "content": flat}])
+    assert cache.key("gpt-4o-mini", "tutor", [{"role": "user", "content": nested}]) == \
+        cache.key("gpt-4o-mini", "tutor", [{"role": "user", "content": nested.replace("\n", "\r\n")}])
+
+
+def test_ttl_size_limit_and_temperature_bypass(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), max_disk_bytes=10)
+    cache.set("expired", "old", ttl=-1)
+    assert cache.get("expired") is None
+
+    cache.set("a", "12345")
+    time.sleep(0.01)
+    cache.set("b", "1234567")
+    assert cache.stats()["bytes stored"] <= 10
+    cache.memory.clear()
+    assert cache.get("a") is None
+    assert cache.get("b") == "1234567"
+
+    assert cache.cacheable({"temperature": 0})
+    assert not cache.cacheable({"temperature": 1.0})
+    assert not cache.cacheable({})
+    assert cache.cacheable({}, max_temperature=1.0)
@@ -0,0 +1,254 @@
+import asyncio
+import math
+import re
+import time
+from collections import Counter, OrderedDict
+import numpy as np
+from context_window import count_tokens, get_tokenizer
+from tracing import span
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class Route:
+    def __init__(self, name, instructions, examples, keywords=()):
+        self.name = name
+        self.instructions = instructions
+        self.examples = list(examples)
+        self.keywords = [keyword.lower() for keyword in keywords]
+
+
+class RouteDecision:
+    def __init__(self, route, confidence, source, latency):
+        self.route = route
+        self.confidence = confidence
+        self.source = source
+        self.latency = latency
+
+
+class KeywordRules:
+    def __init__(self, routes):
+        self.patterns = [
+            (route.name, re.compile(r"\b(" + "|".join(re.escape(keyword) for keyword in route.keywords) + r")\b"))
+            for route in routes if route.keywords
+        ]
+
+    def match(self, text):
+        # only trust a rule when exactly one route's keywords fire
+        text = text.lower()
+        matches = {name for name, pattern in self.patterns if pattern.search(text)}
+        return matches.pop() if len(matches) == 1 else None
+
+
+class CentroidClassifier:
+    def __init__(self):
+        self.route_names = []
+        self.vocabulary = {}
+        self.idf = None
+        self.centroids = None
+
+    def fit(self, routes):
+        documents = [(route.name, tokenize(example)) for route in routes for example in route.examples]
+        self.route_names = [route.name for route in routes]
+        self.vocabulary = {}
+        for _, tokens in documents:
+            for token in tokens:
+                self.vocabulary.setdefault(token, len(self.vocabulary))
+
+        document_frequency = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for _, tokens in documents:
+            for token in set(tokens):
+                document_frequency[self.vocabulary[token]] += 1
+        self.idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+
+        self.centroids = np.zeros((len(routes), len(self.vocabulary)), dtype=np.float32)
+        for name, tokens in documents:
+            self.centroids[self.route_names.index(name)] += self.vectorise_tokens(tokens)
+        norms = np.linalg.norm(self.centroids, axis=1, keepdims=True)
+        self.centroids /= np.where(norms == 0, 1, norms)
+        return self
+
+    def vectorise_tokens(self, tokens):
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for token, count in Counter(tokens).items():
+            index = self.vocabulary.get(token)
+            if index is not None:
+                vector[index] = (1 + math.log(count)) * self.idf[index]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def scores(self, text):
+        return self.centroids @ self.vectorise_tokens(tokenize(text))
+
+    def predict(self, text):
+        scores = self.scores(text)
+        best = int(np.argmax(scores))
+        return self.route_names[best], float(scores[best])
+
+
+def llm_classifier(client, model="gpt-4o-mini"):
+    def classify(text, routes):
+        names = [route.name for route in routes]
+        response = client.chat.completions.create(
+            model=model,
+            temperature=0,
+            max_tokens=10,
+            messages=[
+                {"role": "system", "content": "Classify the student's message into exactly one of these routes: "
+                                              + ", ".join(names) + ". Reply with the route name only."},
+                {"role": "user", "content": text},
+            ],
+        )
+        answer = response.choices[0].message.content.strip().lower()
+        return next((name for name in names if name.lower() in answer), names[0])
+    return classify
+
+
+class Router:
+    def __init__(self, routes, llm_classify=None, threshold=0.3, memo_size=256):
+        self.routes = {route.name: route for route in routes}
+        self.keyword_rules = KeywordRules(routes)
+        self.classifier = CentroidClassifier().fit(routes)
+        self.llm_classify = llm_classify
+        self.threshold = threshold
+        self.memo_size = memo_size
+        self.memo = OrderedDict()
+        self.counts = Counter()
+        self.route_counts = Counter()
+
+    def local_decision(self, text):
+        # None means the local stages are not confident and the LLM has to decide
+        key = " ".join(tokenize(text))
+        if key in self.memo:
+            self.memo.move_to_end(key)
+            name, confidence = self.memo[key]
+            return name, confidence, "memo"
+        name = self.keyword_rules.match(text)
+        if name is not None:
+            return name, 1.0, "keyword"
+        name, confidence = self.classifier.predict(text)
+        if confidence >= self.threshold or self.llm_classify is None:
+            return name, confidence, "local"
+        return None
+
+    def decide(self, text):
+        decision = self.local_decision(text)
+        if decision is None:
+            name, confidence = self.classifier.predict(text)
+            decision = (self.llm_classify(text, list(self.routes.values())), confidence, "llm")
+        name, confidence, source = decision
+        if source != "memo":
+            self.memo[" ".join(tokenize(text))] = (name, confidence)
+            if len(self.memo) > self.memo_size:
+                self.memo.popitem(last=False)
+        return decision
+
+    def route(self, text):
+        start = time.perf_counter()
+        with span("stage", stage="route") as current:
+            name, confidence, source = self.decide(text)
+            current.set(route=name, source=source)
+        self.counts[source] += 1
+        self.route_counts[name] += 1
+        return RouteDecision(self.routes[name], confidence, source, time.perf_counter() - start)
+
+    def most_likely_route(self):
+        if self.route_counts:
+            return self.routes[self.route_counts.most_common(1)[0][0]]
+        return next(iter(self.routes.values()))
+
+
+class SpeculationStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        # Estimated with the repo's tokenizer: a cancelled stream ends before its usage chunk,
+        # so the API never reports what a miss cost.
+        self.wasted_prompt_tokens = 0
+        self.wasted_completion_tokens = 0
+
+    @property
+    def wasted_tokens(self):
+        return self.wasted_prompt_tokens + self.wasted_completion_tokens
+
+    @property
+    def hit_rate(self):
+        attempts = self.hits + self.misses
+        return self.hits / attempts if attempts else 0.0
+
+
+class SpeculativeRouter:
+    # Starts the specialist for the historically most frequent route while the LLM classifier
+    # runs, and only shows its output once the classifier agrees.
+    def __init__(self, router):
+        self.router = router
+        self.stats = SpeculationStats()
+
+    async def speculate(self, generator, queue):
+        try:
+            with span("stage", stage="speculative answer"):
+                async for delta in generator:
+                    await queue.put(delta)
+        finally:
+            # closes the underlying HTTP stream as soon as a miss cancels us
+            await generator.aclose()
+            queue.put_nowait(None)
+
+    async def respond(self, text, specialist, on_delta, messages=None):
+        # specialist(route, text) returns an async generator of text deltas; messages(route), when
+        # given, is the prompt it sends, so a miss can count the prompt tokens it wasted
+        if self.router.local_decision(text) is not None:
+            self.stats.skipped += 1
+            decision = self.router.route(text)
+            return decision, await self.forward(specialist(decision.route, text), on_delta)
+
+        predicted = self.router.most_likely_route()
+        queue = asyncio.Queue()
+        task = asyncio.create_task(self.speculate(specialist(predicted, text), queue))
+        try:
+            decision = await asyncio.to_thread(self.router.route, text)
+        except Exception:
+            task.cancel()
+            raise
+
+        if decision.route.name == predicted.name:
+            self.stats.hits += 1
+            output = ""
+            while (delta := await queue.get()) is not None:
+                output += delta
+                on_delta(output)
+            await task
+            return decision, output
+
+        self.stats.misses += 1
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            # a failed speculative call does not matter once it has been replaced
+            pass
+        # a miss never reads the queue, so it holds every delta the speculation produced
+        discarded = "".join(delta for delta in iter_queue(queue) if delta is not None)
+        self.stats.wasted_completion_tokens += len(get_tokenizer().encode(discarded))
+        if messages is not None:
+            self.stats.wasted_prompt_tokens += sum(count_tokens(message) for message in messages(predicted))
+        return decision, await self.forward(specialist(decision.route, text), on_delta)
+
+    async def forward(self, generator, on_delta):
+        output = ""
+        with span("stage", stage="answer"):
+            async for delta in generator:
+                output += delta
+                on_delta(output)
+        return output
+
+
+def iter_queue(queue):
+    while not queue.empty():
+        yield queue.get_nowait()
@@ -0,0 +1,64 @@
+import asyncio
+from context_window import count_tokens, get_tokenizer
+from routing import CentroidClassifier, KeywordRules, Route, Router, SpeculativeRouter
+
+
+ROUTES = [
+    Route("concept", "", ["what is a derivative", "explain recursion", "how does photosynthesis work"],
+          ["explain"]),
+    Route("assessment", "", ["how do I solve question 3 of the assignment", "check my homework answer"],
+          ["assignment", "homework"]),
+]
+
+
+def test_keyword_rules_need_a_single_match():
+    rules = KeywordRules(ROUTES)
+    assert rules.match("Can you explain limits?") == "concept"
+    assert rules.match("Explain my assignment") is None
+    assert rules.match("Unrelated message") is None
+
+
+def test_centroid_classifier_prefers_closest_route():
+    classifier = CentroidClassifier().fit(ROUTES)
+    name, confidence = classifier.predict("how does recursion work")
+    assert name == "concept"
+    assert confidence > 0
+
+
+def test_router_falls_back_to_llm_and_memoises():
+    calls = []
+
+    def llm_classify(text, routes):
+        calls.append(text)
+        return "assessment"
+
+    router = Router(ROUTES, llm_classify=llm_classify, threshold=0.5)
+    assert router.route("zzz qqq").source == "llm"
+    assert router.route("ZZZ   qqq!").source == "memo"
+    assert router.route("ZZZ qqq").route.name == "assessment"
+    assert calls == ["zzz qqq"]
+    assert router.route("check my assignment").source == "keyword"
+
+
+def test_speculative_router_cancels_on_miss():
+    async def specialist(route, text):
+        for delta in ["a", "b"]:
+            await asyncio.sleep(0.01)
+            yield f"{route.name}:{delta} "
+
+    router = Router(ROUTES, llm_classify=lambda text, routes: "assessment", threshold=1.1)
+    speculative = SpeculativeRouter(router)
+    prompt = [{"role": "system", "content": "Explain the idea step by step."}, {"role": "user", "content": "zzz"}]
+    decision, output = asyncio.run(speculative.respond("zzz", specialist, lambda text: None, lambda route: prompt))
+    assert decision.route.name == "assessment"
+    assert output == "assessment:a assessment:b "
+    assert speculative.stats.misses == 1
+    # the speculation's whole prompt is wasted, and at most both of its deltas
+    assert speculative.stats.wasted_prompt_tokens == sum(count_tokens(message) for message in prompt)
+    assert speculative.stats.wasted_completion_tokens <= len(get_tokenizer().encode("concept:a concept:b "))
+    assert speculative.stats.wasted_tokens == \
+        speculative.stats.wasted_prompt_tokens + speculative.stats.wasted_completion_tokens
+
+    decision, output = asyncio.run(speculative.respond("yyy", specialist, lambda text: None))
+    assert output == "assessment:a assessment:b "
+    assert speculative.stats.hits == 1
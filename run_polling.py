@@ -0,0 +1,99 @@
+import time
+
+
+TERMINAL_RUN_STATUSES = {"completed", "failed", "cancelled", "expired", "incomplete"}
+CANCEL_TIMEOUT = 10.0
+
+
+class RunOutcome:
+    # How a polled run ended. status is the run's own status, or "timed out" when the
+    # deadline passed first and the run was cancelled.
+    def __init__(self, status, run, polls, elapsed):
+        self.status = status
+        self.run = run
+        self.polls = polls
+        self.elapsed = elapsed
+
+    @property
+    def completed(self):
+        return self.status == "completed"
+
+    @property
+    def required_action(self):
+        return getattr(self.run, "required_action", None)
+
+    @property
+    def error(self):
+        return getattr(self.run, "last_error", None) or getattr(self.run, "incomplete_details", None)
+
+    def describe(self):
+        if self.status == "requires_action":
+            tools = ", ".join(call.function.name for call in self.required_action.submit_tool_outputs.tool_calls)
+            return f"The assistant asked to call {tools}, which this page cannot run, so the run was cancelled."
+        if self.status == "timed out":
+            return f"The assistant did not answer within {self.elapsed:.0f} seconds, so the run was cancelled."
+        if self.error is not None:
+            return f"The assistant run {self.status}: {getattr(self.error, 'message', None) or self.error.reason}"
+        return f"The assistant run ended with status {self.status}."
+
+
+class RunWaiter:
+    # Polls every INITIAL_INTERVAL for the first few checks, since short answers finish
+    # quickly, then backs off towards MAX_INTERVAL. A poll-after hint from the server
+    # takes precedence over the schedule.
+    INITIAL_INTERVAL = 0.2
+    FAST_POLLS = 5
+    BACKOFF = 1.5
+    MAX_INTERVAL = 3.0
+
+    def __init__(self, client, deadline=120.0):
+        self.client = client
+        self.deadline = deadline
+
+    def interval(self, polls, hint):
+        if hint is not None:
+            return hint
+        if polls < self.FAST_POLLS:
+            return self.INITIAL_INTERVAL
+        return min(self.MAX_INTERVAL, self.INITIAL_INTERVAL * self.BACKOFF ** (polls - self.FAST_POLLS + 1))
+
+    def retrieve(self, run):
+        response = self.client.beta.threads.runs.with_raw_response.retrieve(thread_id=run.thread_id, run_id=run.id)
+        hint = response.headers.get("openai-poll-after-ms")
+        return response.parse(), float(hint) / 1000 if hint else None
+
+    def run(self, params, cancelled=None):
+        return self.wait(self.client.beta.threads.runs.create(**params), cancelled)
+
+    def wait(self, run, cancelled=None):
+        # cancelled is an optional threading.Event; setting it stops the wait and cancels the run
+        started = time.monotonic()
+        polls = 0
+        hint = None
+        while run.status not in TERMINAL_RUN_STATUSES:
+            elapsed = time.monotonic() - started
+            if run.status == "requires_action":
+                # nothing here submits tool outputs, and the thread stays locked until the run ends
+                return RunOutcome("requires_action", cancel_run(self.client, run), polls, elapsed)
+            if elapsed >= self.deadline:
+                return RunOutcome("timed out", cancel_run(self.client, run), polls, elapsed)
+            pause = min(self.interval(polls, hint), self.deadline - elapsed)
+            if cancelled is not None and cancelled.wait(pause):
+                return RunOutcome("cancelled", cancel_run(self.client, run), polls, elapsed)
+            if cancelled is None:
+                time.sleep(pause)
+            run, hint = self.retrieve(run)
+            polls += 1
+        return RunOutcome(run.status, run, polls, time.monotonic() - started)
+
+
+def cancel_run(client, run, timeout=CANCEL_TIMEOUT):
+    # a thread takes no new messages while a run is active, so wait for the cancel to land
+    if run.status in TERMINAL_RUN_STATUSES:
+        return run
+    run = client.beta.threads.runs.cancel(thread_id=run.thread_id, run_id=run.id)
+    deadline = time.monotonic() + timeout
+    while run.status not in TERMINAL_RUN_STATUSES and time.monotonic() < deadline:
+        time.sleep(RunWaiter.INITIAL_INTERVAL)
+        run = client.beta.threads.runs.retrieve(thread_id=run.thread_id, run_id=run.id)
+    return run
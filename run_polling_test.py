@@ -0,0 +1,70 @@
+import threading
+from types import SimpleNamespace
+from run_polling import RunWaiter
+
+
+class FakeRuns:
+    def __init__(self, statuses, hint=None):
+        self.statuses = list(statuses)
+        self.hint = hint
+        self.retrieved = 0
+        self.cancelled = False
+        self.with_raw_response = SimpleNamespace(retrieve=self.raw_retrieve)
+
+    def run(self, status):
+        return SimpleNamespace(id="run_1", thread_id="thread_1", status=status, last_error=None,
+                               required_action=SimpleNamespace(submit_tool_outputs=SimpleNamespace(
+                                   tool_calls=[SimpleNamespace(function=SimpleNamespace(name="lookup_grades"))])))
+
+    def create(self, **params):
+        return self.run("queued")
+
+    def retrieve(self, thread_id, run_id):
+        return self.run("cancelled" if self.cancelled else self.statuses[0])
+
+    def raw_retrieve(self, thread_id, run_id):
+        self.retrieved += 1
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        headers = {"openai-poll-after-ms": str(self.hint)} if self.hint else {}
+        return SimpleNamespace(headers=headers, parse=lambda: self.run(status))
+
+    def cancel(self, thread_id, run_id):
+        self.cancelled = True
+        return self.run("cancelling")
+
+
+def waiter(runs, deadline=5.0):
+    waiter = RunWaiter(SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=runs))), deadline)
+    waiter.INITIAL_INTERVAL = 0.001
+    return waiter
+
+
+def test_schedule_backs_off_and_defers_to_server_hint():
+    schedule = RunWaiter(None)
+    intervals = [schedule.interval(polls, None) for polls in range(12)]
+    assert intervals[:5] == [0.2] * 5
+    assert intervals[5] < intervals[6] < intervals[8] and intervals[-1] == 3.0
+    assert schedule.interval(0, 1.5) == 1.5
+
+
+def test_outcomes_are_structured():
+    runs = FakeRuns(["in_progress", "in_progress", "completed"])
+    outcome = waiter(runs).run({"thread_id": "thread_1", "assistant_id": "asst"})
+    assert outcome.completed and outcome.polls == 3
+
+    runs = FakeRuns(["requires_action"])
+    outcome = waiter(runs).run({})
+    assert outcome.status == "requires_action" and runs.cancelled
+    assert "lookup_grades" in outcome.describe()
+
+
+def test_deadline_and_cancellation_cancel_the_run():
+    runs = FakeRuns(["in_progress"])
+    outcome = waiter(runs, deadline=0.05).run({})
+    assert outcome.status == "timed out" and runs.cancelled and outcome.run.status == "cancelled"
+
+    runs = FakeRuns(["in_progress"], hint=10)
+    cancelled = threading.Event()
+    cancelled.set()
+    outcome = waiter(runs).run({}, cancelled=cancelled)
+    assert outcome.status == "cancelled" and runs.cancelled and runs.retrieved == 0
@@ -0,0 +1,110 @@
+import contextvars
+import inspect
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from rate_limiter import SESSION, current_session
+
+
+class Job:
+    # Written by one worker thread and read by the session that submitted it; the worker
+    # never touches session state, so everything the UI needs is recorded here.
+    def __init__(self, context=None):
+        self.id = uuid.uuid4().hex
+        self.context = context or {}
+        self.status = "queued"
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.run = None
+        self.messages = []
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self.last_polled = time.monotonic()
+
+    @property
+    def done(self):
+        return self.finished.is_set()
+
+    def text(self):
+        return "".join(self.chunks)
+
+    def poll(self):
+        self.last_polled = time.monotonic()
+        return self
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+
+class RunService:
+    # Model calls run on this pool instead of the script thread, so a session waiting on a
+    # slow run holds a pool worker rather than a Streamlit script thread, and its page
+    # stays responsive. Jobs nobody has polled for a while belong to sessions that
+    # navigated away or closed the tab, and are cancelled.
+    def __init__(self, max_workers=32, abandon_after=15.0):
+        self.abandon_after = abandon_after
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="run-service")
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.reaper = threading.Thread(target=self.reap, name="run-service-reaper", daemon=True)
+        self.reaper.start()
+
+    def submit(self, function, *args, context=None):
+        # function(job, *args) either returns a result or yields text chunks as they arrive
+        job = Job(context)
+        with self.lock:
+            self.jobs[job.id] = job
+        # the worker carries on the caller's context, such as the span the job is traced under
+        context = contextvars.copy_context()
+        self.executor.submit(context.run, self.execute, job, function, args, current_session())
+        return job
+
+    def execute(self, job, function, args, session):
+        job.status = "running"
+        SESSION.set(session)
+        try:
+            if job.cancelled.is_set():
+                return
+            result = function(job, *args)
+            if inspect.isgenerator(result):
+                for chunk in result:
+                    job.chunks.append(chunk)
+                    if job.cancelled.is_set():
+                        result.close()
+                        break
+            else:
+                job.result = result
+            job.status = "completed"
+        except Exception as error:
+            job.error = error
+            job.status = "failed"
+        finally:
+            if job.cancelled.is_set() and job.status != "failed":
+                job.status = "cancelled"
+            with self.lock:
+                self.jobs.pop(job.id, None)
+            job.finished.set()
+
+    def reap(self):
+        while True:
+            time.sleep(self.abandon_after / 3)
+            cutoff = time.monotonic() - self.abandon_after
+            with self.lock:
+                abandoned = [job for job in self.jobs.values() if job.last_polled < cutoff]
+            for job in abandoned:
+                job.cancel()
+
+    def stats(self):
+        with self.lock:
+            return {"active jobs": len(self.jobs)}
+
+
+@st.cache_resource
+def get_run_service():
+    return RunService()
@@ -0,0 +1,44 @@
+import threading
+import time
+from run_service import RunService
+
+
+def test_streamed_returned_and_failed_jobs():
+    service = RunService(max_workers=2)
+
+    def stream(job, words):
+        for word in words:
+            yield word
+
+    streamed = service.submit(stream, ["a ", "derivative"], context={"question": "?"})
+    returned = service.submit(lambda job: 42)
+    failed = service.submit(lambda job: 1 / 0)
+    for job in (streamed, returned, failed):
+        assert job.wait(1)
+
+    assert streamed.status == "completed" and streamed.text() == "a derivative"
+    assert streamed.context == {"question": "?"}
+    assert returned.result == 42
+    assert failed.status == "failed" and isinstance(failed.error, ZeroDivisionError)
+    assert service.stats()["active jobs"] == 0
+
+
+def test_cancelled_and_abandoned_jobs_stop_streaming():
+    service = RunService(max_workers=2, abandon_after=0.3)
+    closed = threading.Event()
+
+    def endless(job):
+        try:
+            while True:
+                time.sleep(0.01)
+                yield "."
+        finally:
+            closed.set()
+
+    cancelled = service.submit(endless)
+    time.sleep(0.05)
+    cancelled.cancel()
+    assert cancelled.wait(1) and cancelled.status == "cancelled" and closed.is_set()
+
+    abandoned = service.submit(endless)
+    assert abandoned.wait(2) and abandoned.status == "cancelled"
@@ -0,0 +1,133 @@
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+import streamlit as st
+
+
+DEFAULT_DIRECTORY = os.path.join(".cache", "semantic")
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1536
+
+
+def embed(client, text, model=EMBEDDING_MODEL):
+    response = client.embeddings.create(model=model, input=text)
+    vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def namespace_paths(directory, name):
+    safe_name = re.sub(r"[^\w-]", "_", name)
+    return os.path.join(directory, f"{safe_name}.f32"), os.path.join(directory, f"{safe_name}.json")
+
+
+class Namespace:
+    # Vectors for one assistant in a fixed-capacity float32 matrix (memory-mapped when the
+    # cache has a directory), with answers and last-use times kept alongside in a list.
+    def __init__(self, name, capacity, dimensions, directory=None):
+        self.name = name
+        self.capacity = capacity
+        self.dimensions = dimensions
+        self.entries = []
+        self.matrix_path = None
+        self.metadata_path = None
+        if directory is None:
+            self.matrix = np.zeros((capacity, dimensions), dtype=np.float32)
+            return
+        self.matrix_path, self.metadata_path = namespace_paths(directory, name)
+        mode = "r+" if os.path.exists(self.matrix_path) else "w+"
+        self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode=mode, shape=(capacity, dimensions))
+        if mode == "r+" and os.path.exists(self.metadata_path):
+            with open(self.metadata_path) as metadata_file:
+                self.entries = json.load(metadata_file)
+
+    def search(self, vector):
+        if not self.entries:
+            return None, 0.0
+        scores = self.matrix[:len(self.entries)] @ vector
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+    def add(self, vector, question, answer):
+        if len(self.entries) < self.capacity:
+            slot = len(self.entries)
+            self.entries.append(None)
+        else:
+            # evict the least recently used entry
+            slot = min(range(self.capacity), key=lambda index: self.entries[index]["last_used"])
+        self.matrix[slot] = vector
+        self.entries[slot] = {"question": question, "answer": answer, "last_used": time.time()}
+        self.flush()
+
+    def touch(self, slot):
+        self.entries[slot]["last_used"] = time.time()
+
+    def flush(self):
+        if self.metadata_path is None:
+            return
+        self.matrix.flush()
+        with open(self.metadata_path, "w") as metadata_file:
+            json.dump(self.entries, metadata_file)
+
+
+class SemanticCache:
+    def __init__(self, directory=DEFAULT_DIRECTORY, threshold=0.92, capacity=1024,
+                 dimensions=EMBEDDING_DIMENSIONS):
+        self.directory = directory
+        self.threshold = threshold
+        self.capacity = capacity
+        self.dimensions = dimensions
+        self.namespaces = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def namespace(self, name):
+        if name not in self.namespaces:
+            self.namespaces[name] = Namespace(name, self.capacity, self.dimensions, self.directory)
+        return self.namespaces[name]
+
+    def lookup(self, name, vector):
+        with self.lock:
+            namespace = self.namespace(name)
+            slot, score = namespace.search(vector)
+            if slot is None or score < self.threshold:
+                self.misses += 1
+                return None
+            namespace.touch(slot)
+            self.hits += 1
+            return namespace.entries[slot]["answer"]
+
+    def add(self, name, vector, question, answer):
+        with self.lock:
+            self.namespace(name).add(vector, question, answer)
+
+    def invalidate(self, name):
+        # called when an assistant is edited or deleted, its stored answers are stale
+        with self.lock:
+            self.namespaces.pop(name, None)
+            if self.directory is None:
+                return
+            for path in namespace_paths(self.directory, name):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "namespaces": len(self.namespaces),
+            "entries": sum(len(namespace.entries) for namespace in self.namespaces.values()),
+        }
+
+
+@st.cache_resource
+def get_semantic_cache():
+    return SemanticCache()
@@ -0,0 +1,34 @@
+import numpy as np
+from semantic_cache import SemanticCache
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_lookup_threshold_namespaces_and_eviction(tmp_path):
+    cache = SemanticCache(str(tmp_path), threshold=0.9, capacity=2, dimensions=3)
+    cache.add("asst_a", unit(1, 0, 0), "What is a derivative?", "A rate of change.")
+    cache.add("asst_a", unit(0, 1, 0), "What is an integral?", "An area.")
+
+    assert cache.lookup("asst_a", unit(1, 0.1, 0)) == "A rate of change."
+    assert cache.lookup("asst_a", unit(1, 1, 0)) is None
+    assert cache.lookup("asst_b", unit(1, 0, 0)) is None
+
+    # the integral entry is now least recently used and makes room for a new one
+    cache.add("asst_a", unit(0, 0, 1), "What is a limit?", "A value approached.")
+    assert cache.lookup("asst_a", unit(0, 1, 0)) is None
+    assert cache.lookup("asst_a", unit(1, 0, 0)) == "A rate of change."
+
+
+def test_persistence_and_invalidation(tmp_path):
+    cache = SemanticCache(str(tmp_path), capacity=4, dimensions=3)
+    cache.add("asst_a", unit(1, 0, 0), "What is a derivative?", "A rate of change.")
+
+    reopened = SemanticCache(str(tmp_path), capacity=4, dimensions=3)
+    assert reopened.lookup("asst_a", unit(1, 0, 0)) == "A rate of change."
+
+    reopened.invalidate("asst_a")
+    assert reopened.lookup("asst_a", unit(1, 0, 0)) is None
+    assert SemanticCache(str(tmp_path), capacity=4, dimensions=3).lookup("asst_a", unit(1, 0, 0)) is None
@@ -0,0 +1,343 @@
+import contextvars
+import json
+import os
+import re
+import statistics
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+import httpx
+import streamlit as st
+from rate_limiter import request_cost
+
+try:
+    from opentelemetry import trace as opentelemetry_trace
+    from opentelemetry.trace import Status, StatusCode
+    OPENTELEMETRY = True
+except ImportError:
+    OPENTELEMETRY = False
+
+
+DEFAULT_PATH = os.path.join(".cache", "traces.jsonl")
+CAPTURE_BYTES = 1024 * 1024
+# ids in API paths are replaced so calls to the same endpoint group together
+PATH_IDS = re.compile(r"/(asst|thread|run|msg|file|vs|vsfb|step)_[A-Za-z0-9]+")
+
+# The span work is currently being done for. Like the rate limiter's session, it is
+# carried onto run service workers and the shared event loop with the work it belongs to.
+TRACE = contextvars.ContextVar("trace_span", default=None)
+
+
+class Span:
+    def __init__(self, tracer, name, parent=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.parent_id = parent.id if parent is not None else None
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.status = "ok"
+        self.opentelemetry = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def first_token(self):
+        # seconds from the start of the span to the first byte or token it produced
+        if "ttft" not in self.attributes:
+            self.attributes["ttft"] = time.perf_counter() - self.started
+
+    def to_dict(self):
+        return {"trace_id": self.trace_id, "span_id": self.id, "parent_id": self.parent_id, "name": self.name,
+                "start": self.start, "duration": self.duration, "status": self.status, **self.attributes}
+
+
+class NoSpan:
+    # stands in for a span when nothing is being traced, so callers need not check
+    def set(self, **attributes):
+        pass
+
+    def first_token(self):
+        pass
+
+
+def span(name, **attributes):
+    # a child of the current span, or nothing when no request is being traced
+    parent = TRACE.get()
+    return parent.tracer.span(name, **attributes) if parent is not None else nullcontext(NoSpan())
+
+
+def summarise(root, spans):
+    calls = [span for span in spans if span.name == "call"]
+    streamed = [span.started + span.attributes["ttft"] for span in calls
+                if span.attributes.get("stream") and "ttft" in span.attributes]
+    return {
+        "duration": root.duration,
+        # without a streamed call the student sees nothing until the turn is over
+        "ttft": min(streamed) - root.started if streamed else root.duration,
+        "calls": len(calls),
+        "tokens": sum(span.attributes.get("prompt_tokens", 0) + span.attributes.get("completion_tokens", 0)
+                      for span in calls),
+        "cache hits": sum(1 for span in spans if span.attributes.get("cache_hit")),
+        "retries": sum(span.attributes.get("retries", 0) for span in calls),
+    }
+
+
+class Tracer:
+    # Keeps recent traces in memory for the profiling panel, appends every finished span
+    # to a JSONL file, and mirrors spans to OpenTelemetry when it is installed. Finished
+    # root spans (one per chat turn) feed rolling per-page aggregates.
+    def __init__(self, path=DEFAULT_PATH, max_traces=200, window=100, max_bytes=32 * 1024 * 1024,
+                 opentelemetry=OPENTELEMETRY):
+        self.path = path
+        self.max_traces = max_traces
+        self.window = window
+        self.max_bytes = max_bytes
+        self.opentelemetry = opentelemetry_trace.get_tracer("llm-structures") if opentelemetry else None
+        self.traces = OrderedDict()
+        self.latest = {}
+        self.pages = {}
+        self.lock = threading.Lock()
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def start(self, name, parent=None, **attributes):
+        parent = TRACE.get() if parent is None else parent
+        span = Span(self, name, parent, attributes)
+        if self.opentelemetry is not None:
+            context = None
+            if parent is not None and parent.opentelemetry is not None:
+                context = opentelemetry_trace.set_span_in_context(parent.opentelemetry)
+            span.opentelemetry = self.opentelemetry.start_span(name, context=context, start_time=time.time_ns())
+        return span
+
+    def finish(self, span, error=None, **attributes):
+        if span.duration is not None:
+            return
+        span.duration = time.perf_counter() - span.started
+        span.set(**attributes)
+        if error is not None:
+            span.status = "error"
+            span.set(error=str(error) or type(error).__name__)
+        with self.lock:
+            if span.trace_id not in self.traces:
+                self.traces[span.trace_id] = []
+                while len(self.traces) > self.max_traces:
+                    self.traces.popitem(last=False)
+            spans = self.traces[span.trace_id]
+            spans.append(span)
+            if span.parent_id is None:
+                self.finish_root(span, spans)
+        self.export(span)
+
+    def finish_root(self, root, spans):
+        summary = summarise(root, spans)
+        root.set(**{key.replace(" ", "_"): value for key, value in summary.items() if key != "duration"})
+        session = root.attributes.get("session")
+        if session is not None:
+            self.latest[session] = root.trace_id
+        page = root.attributes.get("page")
+        if page is not None:
+            if page not in self.pages:
+                self.pages[page] = deque(maxlen=self.window)
+            self.pages[page].append(summary)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = self.start(name, **attributes)
+        token = TRACE.set(span)
+        try:
+            yield span
+        except BaseException as error:
+            self.finish(span, error)
+            raise
+        finally:
+            try:
+                TRACE.reset(token)
+            except ValueError:
+                # an async generator closed from another task has a different context
+                pass
+            self.finish(span)
+
+    def export(self, span):
+        if self.path:
+            line = json.dumps(span.to_dict(), default=str) + "\n"
+            with self.lock:
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a") as file:
+                    file.write(line)
+        if span.opentelemetry is not None:
+            span.opentelemetry.set_attributes({
+                key: value for key, value in span.attributes.items() if isinstance(value, (str, bool, int, float))
+            })
+            if span.status == "error":
+                span.opentelemetry.set_status(Status(StatusCode.ERROR, span.attributes.get("error")))
+            span.opentelemetry.end()
+
+    def trace(self, trace_id):
+        with self.lock:
+            return sorted(self.traces.get(trace_id, []), key=lambda span: span.started)
+
+    def latest_trace(self, session):
+        trace_id = self.latest.get(session)
+        return self.trace(trace_id) if trace_id else []
+
+    def aggregates(self):
+        with self.lock:
+            pages = {page: list(summaries) for page, summaries in self.pages.items()}
+        results = {}
+        for page, summaries in pages.items():
+            durations = sorted(summary["duration"] for summary in summaries)
+            results[page] = {
+                "turns": len(summaries),
+                "p50 s": round(statistics.median(durations), 3),
+                "p95 s": round(durations[min(len(durations) - 1, int(0.95 * len(durations)))], 3),
+                "ttft p50 s": round(statistics.median(summary["ttft"] for summary in summaries), 3),
+                "calls per turn": round(statistics.mean(summary["calls"] for summary in summaries), 2),
+                "tokens per turn": round(statistics.mean(summary["tokens"] for summary in summaries)),
+                "cache hits per turn": round(statistics.mean(summary["cache hits"] for summary in summaries), 2),
+                "retries per turn": round(statistics.mean(summary["retries"] for summary in summaries), 2),
+            }
+        return results
+
+
+def call_attributes(request):
+    model, _ = request_cost(request)
+    attributes = {"endpoint": PATH_IDS.sub(lambda match: f"/{{{match.group(1)}}}", request.url.path)}
+    if model != "default":
+        attributes["model"] = model
+    if b'"stream":true' in request.content.replace(b" ", b""):
+        attributes["stream"] = True
+    return attributes
+
+
+def read_usage(content, content_type):
+    # the usage block of a JSON body, or of the last streamed event that carried one
+    try:
+        text = content.decode("utf-8", errors="ignore")
+        if "event-stream" in content_type:
+            bodies = [line[6:] for line in text.splitlines() if line.startswith("data: {")]
+        else:
+            bodies = [text]
+        usage = None
+        for body in bodies:
+            if '"usage"' in body:
+                usage = json.loads(body).get("usage") or usage
+    except ValueError:
+        return {}
+    if not usage:
+        return {}
+    attributes = {"prompt_tokens": usage.get("prompt_tokens", 0), "completion_tokens": usage.get("completion_tokens", 0)}
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    if cached:
+        attributes["cached_tokens"] = cached
+    return attributes
+
+
+class TracedStream(httpx.SyncByteStream):
+    # Ends the call's span when the body has been read, noting the first chunk's arrival
+    # and the token usage reported in the body.
+    def __init__(self, stream, span, tracer, content_type):
+        self.stream = stream
+        self.span = span
+        self.tracer = tracer
+        self.content_type = content_type
+        self.captured = bytearray()
+
+    def capture(self, chunk):
+        self.span.first_token()
+        if len(self.captured) < CAPTURE_BYTES:
+            self.captured.extend(chunk)
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self.capture(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.tracer.finish(self.span, **read_usage(bytes(self.captured), self.content_type))
+
+
+class AsyncTracedStream(TracedStream, httpx.AsyncByteStream):
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.capture(chunk)
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self.tracer.finish(self.span, **read_usage(bytes(self.captured), self.content_type))
+
+
+class TracingTransport(httpx.BaseTransport):
+    # Wraps the rate-limited transport, so a call's span includes its queueing and retries.
+    def __init__(self, transport, tracer):
+        self.transport = transport
+        self.tracer = tracer
+
+    def handle_request(self, request):
+        request.read()
+        span = self.tracer.start("call", **call_attributes(request))
+        try:
+            response = self.transport.handle_request(request)
+        except BaseException as error:
+            self.tracer.finish(span, error)
+            raise
+        span.set(status=response.status_code, retries=response.extensions.get("retries", 0),
+                 queued=response.extensions.get("queued", 0.0))
+        content_type = response.headers.get("content-type", "")
+        if response.is_closed:
+            # the body was read up front, as in-memory transports do
+            span.first_token()
+            self.tracer.finish(span, **read_usage(response.content, content_type))
+            return response
+        response.stream = TracedStream(response.stream, span, self.tracer, content_type)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncTracingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport, tracer):
+        self.transport = transport
+        self.tracer = tracer
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        span = self.tracer.start("call", **call_attributes(request))
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException as error:
+            self.tracer.finish(span, error)
+            raise
+        span.set(status=response.status_code, retries=response.extensions.get("retries", 0),
+                 queued=response.extensions.get("queued", 0.0))
+        content_type = response.headers.get("content-type", "")
+        if response.is_closed:
+            # the body was read up front, as in-memory transports do
+            span.first_token()
+            self.tracer.finish(span, **read_usage(response.content, content_type))
+            return response
+        response.stream = AsyncTracedStream(response.stream, span, self.tracer, content_type)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+@st.cache_resource(show_spinner=False)
+def get_tracer():
+    return Tracer()
@@ -0,0 +1,38 @@
+import json
+import httpx
+from tracing import TRACE, Tracer, TracingTransport, span
+
+
+def test_nests_spans_reads_usage_and_exports_jsonl(tmp_path):
+    tracer = Tracer(path=str(tmp_path / "traces.jsonl"), opentelemetry=False)
+
+    def handler(request):
+        if request.method == "GET":
+            return httpx.Response(200, json={"data": []})
+        return httpx.Response(200, json={"usage": {"prompt_tokens": 12, "completion_tokens": 30,
+                                                   "prompt_tokens_details": {"cached_tokens": 8}}})
+
+    client = httpx.Client(transport=TracingTransport(httpx.MockTransport(handler), tracer))
+    with tracer.span("turn", page="Parallelisation", session="s1"):
+        with span("branch", branch="Explanation"):
+            client.post("https://api.openai.com/v1/chat/completions", json={"model": "gpt-4o-mini", "messages": []})
+        client.get("https://api.openai.com/v1/threads/thread_abc123/messages")
+    assert TRACE.get() is None
+
+    spans = tracer.latest_trace("s1")
+    turn, branch, completion, listing = spans
+    assert branch.parent_id == turn.id and completion.parent_id == branch.id and listing.parent_id == turn.id
+    assert completion.attributes["model"] == "gpt-4o-mini" and completion.attributes["cached_tokens"] == 8
+    assert listing.attributes["endpoint"] == "/v1/threads/{thread}/messages"
+    assert turn.attributes["calls"] == 2 and turn.attributes["tokens"] == 42
+
+    lines = [json.loads(line) for line in open(tmp_path / "traces.jsonl")]
+    assert len(lines) == 4 and {line["trace_id"] for line in lines} == {turn.trace_id}
+    assert tracer.aggregates()["Parallelisation"]["calls per turn"] == 2
+
+
+def test_untraced_work_records_nothing(tmp_path):
+    tracer = Tracer(path=str(tmp_path / "traces.jsonl"), opentelemetry=False)
+    with span("stage", stage="plan") as current:
+        current.set(score=1)
+    assert not tracer.traces